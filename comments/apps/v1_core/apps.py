@@ -1,5 +1,28 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def create_full_text_indexes(using, **kwargs):
+    from apps.v1_core.search import ensure_full_text_indexes
+    ensure_full_text_indexes(connections[using])
+
+
+def create_change_triggers(using, **kwargs):
+    from apps.v1_core.sync import ensure_change_triggers
+    ensure_change_triggers(connections[using])
+
+
+def configure_connection(connection, **kwargs):
+    from apps.v1_core.writes import apply_sqlite_pragmas
+    apply_sqlite_pragmas(connection)
 
 
 class V1CoreConfig(AppConfig):
     name = 'apps.v1_core'
+
+    def ready(self):
+        post_migrate.connect(create_full_text_indexes, sender=self)
+        post_migrate.connect(create_change_triggers, sender=self)
+        connection_created.connect(configure_connection)
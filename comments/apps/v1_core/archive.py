@@ -0,0 +1,192 @@
+from apps.v1_core.cache import invalidate_comment
+from apps.v1_core.likes import like_buffer
+from apps.v1_core.models import ArchivedComment
+from apps.v1_core.models import ArchivedReply
+from apps.v1_core.models import Change
+from apps.v1_core.models import Comment
+from apps.v1_core.models import Like
+from apps.v1_core.models import Reply
+from apps.v1_core.sync import head_token
+from apps.v1_core.writes import run_write
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+ARCHIVE_MODELS = ('v1_core.archivedcomment', 'v1_core.archivedreply')
+
+ARCHIVE_PARAM = 'archive'
+
+
+def archive_alias():
+    return getattr(settings, 'ARCHIVE_DATABASE', 'default')
+
+
+def wants_archive(request):
+    """
+    Whether a read asked for archived comments with `?archive=true`.
+    """
+    value = request.query_params.get(ARCHIVE_PARAM, '')
+    return value.lower() in ('1', 'true', 'yes')
+
+
+class ArchiveRouter:
+    """
+    Keeps the archive models in `ARCHIVE_DATABASE`, reads and writes.
+
+    Comes before `ReplicaRouter`, which would send their writes to the
+    primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in ARCHIVE_MODELS:
+            return archive_alias()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if f'{app_label}.{model_name}' in ARCHIVE_MODELS:
+            return db == archive_alias()
+        return None
+
+
+def field_names(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def copy_to_archive(comment_ids, archived_at):
+    """
+    Copy comments and their replies into the archive, replacing the
+    copies a previous, interrupted run left there.
+    """
+    comments = copy_comments(comment_ids, archived_at)
+    replies = copy_replies(Reply.objects.filter(comment_id__in=comment_ids))
+    return comments, replies
+
+
+def copy_comments(comment_ids, archived_at):
+    """
+    Copy the comments of `comment_ids` into the archive as they are now,
+    buffered likes included, replacing older copies. Returns the number
+    of comments copied.
+    """
+    comment_fields = [
+        name for name in field_names(ArchivedComment) if name != 'archived_at'
+    ]
+    comments = Comment.objects\
+        .filter(id__in=comment_ids)\
+        .values(*comment_fields)
+    comments = list(comments)
+    for comment in comments:
+        comment['likes_comments'] += like_buffer.pending(
+            'comment', comment['id'],
+        )
+    replace_in_archive(ArchivedComment, [
+        ArchivedComment(archived_at=archived_at, **comment)
+        for comment in comments
+    ])
+    return len(comments)
+
+
+def copy_replies(replies):
+    """
+    Copy the `replies` queryset into the archive as it is now, replacing
+    older copies. Returns the number of replies in `replies`.
+    """
+    replies = list(replies.order_by('id').values(*field_names(ArchivedReply)))
+    for reply in replies:
+        reply['likes_replies'] += like_buffer.pending('reply', reply['id'])
+    replace_in_archive(
+        ArchivedReply, [ArchivedReply(**reply) for reply in replies],
+    )
+    return len(replies)
+
+
+def replace_in_archive(model, instances):
+    with transaction.atomic(using=archive_alias()):
+        model.objects\
+            .filter(id__in=[instance.id for instance in instances])\
+            .delete()
+        model.objects.bulk_create(instances)
+
+
+@transaction.atomic
+def delete_archived_chunk(comment_ids, chunk_size, archived_at):
+    """
+    Delete up to `chunk_size` replies of archived comments, newest first,
+    or the comments themselves once no reply is left.
+
+    Returns the number of replies deleted. Every row is copied again in
+    the transaction deleting it, so edits, likes and replies written
+    since the batch was copied reach the archive. Likes go in one
+    `DELETE` each instead of being loaded by the cascade. The change log
+    rows written by the deletes are dropped in the same transaction: the
+    objects are archived, not deleted, so sync clients must not see
+    tombstones.
+    """
+    head = head_token()
+    reply_ids = Reply.objects\
+        .filter(comment_id__in=comment_ids)\
+        .order_by('-id')\
+        .values_list('id', flat=True)
+    reply_ids = list(reply_ids[:chunk_size])
+    if reply_ids:
+        copy_replies(Reply.objects.filter(id__in=reply_ids))
+        Like.objects.filter(reply_id__in=reply_ids).delete()
+        _, deleted = Reply.objects.filter(id__in=reply_ids).delete()
+        deleted = deleted.get(Reply._meta.label, 0)
+    else:
+        copy_comments(comment_ids, archived_at)
+        Like.objects.filter(comment_id__in=comment_ids).delete()
+        Comment.all_objects.filter(id__in=comment_ids).delete()
+        deleted = 0
+    Change.objects\
+        .filter(id__gt=head, comment_id__in=comment_ids)\
+        .delete()
+    return deleted
+
+
+def archive_batch(comment_ids, archived_at=None):
+    """
+    Move comments and their replies to the archive.
+
+    The copy commits before the hot rows are deleted, so a failure in
+    between leaves copies for the next run to replace, never a loss.
+    The hot rows are then deleted `COMMENT_PURGE_CHUNK_SIZE` replies per
+    transaction, like purged comments, each chunk copied again first.
+    """
+    archived_at = archived_at or timezone.now()
+    counts = copy_to_archive(comment_ids, archived_at)
+    chunk_size = getattr(settings, 'COMMENT_PURGE_CHUNK_SIZE', 500)
+    while run_write(
+        delete_archived_chunk, comment_ids, chunk_size, archived_at,
+    ):
+        pass
+    invalidate_comment()
+    return counts
+
+
+def archive_comments(before, batch_size=None, limit=None):
+    """
+    Archive comments created before `before`, oldest first, in batches.
+
+    Returns the number of comments and replies moved.
+    """
+    batch_size = batch_size or getattr(settings, 'ARCHIVE_BATCH_SIZE', 500)
+    # Buffered likes of the comments would have nothing to land on.
+    like_buffer.flush()
+    comments = replies = 0
+    while limit is None or comments < limit:
+        size = batch_size if limit is None else \
+            min(batch_size, limit - comments)
+        comment_ids = Comment.objects\
+            .filter(created_at__lt=before)\
+            .order_by('created_at', 'id')\
+            .values_list('id', flat=True)
+        comment_ids = list(comment_ids[:size])
+        if not comment_ids:
+            break
+        moved_comments, moved_replies = archive_batch(comment_ids)
+        comments += moved_comments
+        replies += moved_replies
+    return comments, replies
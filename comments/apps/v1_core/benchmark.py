@@ -0,0 +1,302 @@
+import http.client
+import json
+import math
+import platform
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler
+from wsgiref.simple_server import make_server
+
+import django
+from apps.v1_core.metrics import request_metrics
+from apps.v1_core.models import Comment
+from apps.v1_core.models import Reply
+from apps.v1_core.seeding import WORDS
+from django.conf import settings
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.test import Client
+from django.utils import timezone
+
+SCENARIOS = (
+    'list', 'detail', 'search', 'create', 'like', 'reply', 'page',
+)
+
+MODES = ('inprocess', 'wsgi')
+
+
+class InProcessTransport:
+    """
+    Calls the Django handler directly, without sockets or a server.
+
+    Every thread sending requests gets its own logged in client.
+    """
+
+    def __init__(self, user, host):
+        self.user = user
+        self.host = host
+        self.local = threading.local()
+
+    @property
+    def client(self):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(HTTP_HOST=self.host)
+            client.force_login(self.user)
+        return client
+
+    def request(self, method, path, data=None):
+        body = json.dumps(data) if data is not None else ''
+        try:
+            response = self.client.generic(
+                method, path, body, content_type='application/json',
+            )
+        except Exception:
+            # The test client re-raises what a server would turn into a 500.
+            return 500
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WSGITransport:
+    """
+    Sends HTTP requests to a threaded `wsgiref` server.
+
+    The session of a forced login and a CSRF token are passed as cookies,
+    so requests authenticate like a browser's would.
+    """
+
+    def __init__(self, user, host):
+        login = Client(HTTP_HOST=host)
+        login.force_login(user)
+        session = login.cookies[settings.SESSION_COOKIE_NAME].value
+        csrf = HttpRequest()
+        token = get_token(csrf)
+        self.headers = {
+            'Host': host,
+            'Cookie': (
+                f'{settings.SESSION_COOKIE_NAME}={session}; '
+                f'{settings.CSRF_COOKIE_NAME}={csrf.META["CSRF_COOKIE"]}'
+            ),
+            'X-CSRFToken': token,
+            'Content-Type': 'application/json',
+        }
+        self.server = make_server(
+            '127.0.0.1', 0, get_wsgi_application(),
+            server_class=ThreadedWSGIServer,
+            handler_class=QuietRequestHandler,
+        )
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name='benchmark-wsgi',
+            daemon=True,
+        )
+        self.thread.start()
+
+    def request(self, method, path, data=None):
+        body = json.dumps(data) if data is not None else None
+        client = http.client.HTTPConnection(
+            '127.0.0.1', self.server.server_port,
+        )
+        try:
+            client.request(method, path, body, self.headers)
+            response = client.getresponse()
+            response.read()
+            return response.status
+        finally:
+            client.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+TRANSPORTS = {
+    'inprocess': InProcessTransport,
+    'wsgi': WSGITransport,
+}
+
+
+def sample_comment_ids(rng, count):
+    """
+    Up to `count` existing comment ids, one indexed lookup each.
+    """
+    bounds = Comment.objects.order_by('pk').values_list('pk', flat=True)
+    first, last = bounds.first(), bounds.reverse().first()
+    if first is None:
+        return []
+    ids = set()
+    for _ in range(count):
+        ids.add(bounds.filter(pk__gte=rng.randint(first, last)).first())
+    return sorted(ids)
+
+
+def percentile(values, fraction):
+    # Nearest rank on sorted values.
+    index = max(math.ceil(fraction * len(values)) - 1, 0)
+    return values[index]
+
+
+def summarize(latencies, elapsed, statuses):
+    latencies = sorted(latencies)
+    queries, observed = request_metrics.totals('comments_request_queries')
+    return {
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'queries_per_request': (
+            round(queries / observed, 2) if observed else None
+        ),
+        'errors': sum(
+            count for status, count in statuses.items() if status >= 400
+        ),
+    }
+
+
+class Benchmark:
+    """
+    Times every scenario with a given transport, sending requests from
+    `concurrency` clients at once.
+
+    Queries per request come from the `MetricsMiddleware` histograms, so
+    they are only reported while it is enabled.
+    """
+
+    def __init__(self, transport, rng, comment_ids, concurrency=1):
+        self.transport = transport
+        self.rng = rng
+        self.comment_ids = comment_ids
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+
+    def next_request(self, scenario):
+        comment_id = self.rng.choice(self.comment_ids)
+        content = ' '.join(self.rng.choice(WORDS) for _ in range(8))
+        if scenario == 'list':
+            return 'GET', '/api/comment/', None
+        if scenario == 'detail':
+            return 'GET', f'/api/comment/{comment_id}/', None
+        if scenario == 'search':
+            return 'GET', f'/api/comment/?search={self.rng.choice(WORDS)}', None  # NOQA
+        if scenario == 'create':
+            return 'POST', '/api/comment/', {'content': content}
+        if scenario == 'page':
+            return 'GET', '/api/comment/?page_size=500&replies=count', None
+        if scenario == 'like':
+            return 'PATCH', f'/api/comment/{comment_id}/like/', None
+        return 'POST', '/api/reply/', {'content': content, 'comment': comment_id}  # NOQA
+
+    def send(self, scenario, count, latencies, statuses):
+        for _ in range(count):
+            with self.lock:
+                method, path, data = self.next_request(scenario)
+            sent = time.perf_counter()
+            status = self.transport.request(method, path, data)
+            elapsed = time.perf_counter() - sent
+            with self.lock:
+                statuses[status] += 1
+                latencies.append(elapsed)
+
+    def run_scenario(self, scenario, requests, warmup):
+        for _ in range(warmup):
+            self.transport.request(*self.next_request(scenario))
+        request_metrics.reset()
+        latencies, statuses = [], Counter()
+        share, extra = divmod(requests, self.concurrency)
+        counts = [
+            share + (client < extra) for client in range(self.concurrency)
+        ]
+        started = time.perf_counter()
+        if self.concurrency == 1:
+            self.send(scenario, requests, latencies, statuses)
+        else:
+            with ThreadPoolExecutor(self.concurrency) as executor:
+                futures = [
+                    executor.submit(
+                        self.send, scenario, count, latencies, statuses,
+                    )
+                    for count in counts
+                ]
+                for future in futures:
+                    future.result()
+        elapsed = time.perf_counter() - started
+        return summarize(latencies, elapsed, statuses)
+
+    def run(self, scenarios, requests, warmup):
+        return {
+            scenario: self.run_scenario(scenario, requests, warmup)
+            for scenario in scenarios
+        }
+
+
+def run_benchmarks(
+    user, modes, scenarios, requests, warmup, rng, host, concurrency=1,
+):
+    comment_ids = sample_comment_ids(rng, 200)
+    if not comment_ids:
+        raise ValueError('No comments to benchmark, run seed_comments first.')
+    results = {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'comments': Comment.objects.count(),
+            'replies': Reply.objects.count(),
+            'requests': requests,
+            'concurrency': concurrency,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+        },
+        'results': {},
+    }
+    for mode in modes:
+        transport = TRANSPORTS[mode](user, host)
+        try:
+            benchmark = Benchmark(transport, rng, comment_ids, concurrency)
+            results['results'][mode] = benchmark.run(
+                scenarios, requests, warmup,
+            )
+        finally:
+            transport.close()
+    return results
+
+
+def compare(baseline, results, max_regression):
+    """
+    Rows of `(mode, scenario, metric, before, after, regressed)`.
+
+    Latencies and queries regress when they grow by more than
+    `max_regression` (a fraction), throughput when it drops by as much.
+    """
+    rows = []
+    for mode, scenarios in results['results'].items():
+        for scenario, current in scenarios.items():
+            before = baseline.get('results', {}).get(mode, {}).get(scenario)
+            if before is None:
+                continue
+            for metric in ('p50_ms', 'p99_ms', 'requests_per_second',
+                           'queries_per_request'):
+                old, new = before.get(metric), current.get(metric)
+                if old is None or new is None:
+                    continue
+                if metric == 'requests_per_second':
+                    regressed = new < old * (1 - max_regression)
+                else:
+                    regressed = new > old * (1 + max_regression)
+                rows.append((mode, scenario, metric, old, new, regressed))
+    return rows
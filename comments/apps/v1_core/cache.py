@@ -0,0 +1,307 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from apps.v1_core.models import Reply
+from apps.v1_core.replicas import read_alias
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded in-process cache with per-entry expiry.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = MISSING
+
+
+class CommentCache:
+    """
+    Read-through cache for comment detail and list responses.
+
+    Entries live in an in-process LRU and, when `COMMENT_CACHE_BACKEND`
+    names one of `CACHES`, in that shared backend too. Every key embeds
+    version tokens, so a write invalidates by dropping a token and stale
+    entries are never read again: a detail key has its comment's token
+    and one for every entry, a list page key its URL and one token for
+    all pages, dropped only when a comment may enter or leave pages.
+    Pages ordered by `hot` also have a token dropped by every counter
+    change. A page entry keeps the tokens of the comments on it and is
+    fetched again once one of them changed. Keys are built from the
+    request alone, so a hit reads no row. Concurrent misses on the same
+    key collapse into one fetch. Reads served by a replica use the
+    entries but never fill them, since a lagging replica could store
+    what an invalidation just dropped.
+    """
+    all_version_key = 'comment:all:version'
+    list_version_key = 'comment:list:version'
+    hot_version_key = 'comment:list:hot:version'
+    lock_wait = 1
+
+    def __init__(self):
+        self.local = LRUCache(self.max_entries)
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'COMMENT_CACHE_ENABLED', False)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'COMMENT_CACHE_TIMEOUT', 60)
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'COMMENT_CACHE_MAX_ENTRIES', 1024)
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'COMMENT_CACHE_BACKEND', None)
+        return caches[alias] if alias else None
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is MISSING and self.shared is not None:
+            value = self.shared.get(key, MISSING)
+            if value is not MISSING:
+                self.local.set(key, value, self.timeout)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value, self.timeout)
+        if self.shared is not None:
+            self.shared.set(key, value, self.timeout)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def version(self, key):
+        shared = self.shared
+        if shared is None:
+            version = self.local.get(key)
+            if version is MISSING:
+                version = uuid.uuid4().hex
+                self.local.set(key, version, self.timeout)
+            return version
+        version = shared.get(key)
+        if version is None:
+            shared.add(key, uuid.uuid4().hex, self.timeout)
+            version = shared.get(key)
+        return version
+
+    def versions(self, keys):
+        shared = self.shared
+        if shared is None:
+            return [self.version(key) for key in keys]
+        found = shared.get_many(keys)
+        return [found.get(key) or self.version(key) for key in keys]
+
+    def comment_version_key(self, comment_id):
+        return f'comment:{comment_id}:version'
+
+    def detail_key(self, comment_id, variant=''):
+        # `variant` is the format and query string, which select the
+        # representation.
+        versions = self.versions([
+            self.all_version_key, self.comment_version_key(comment_id),
+        ])
+        key = f'comment:{comment_id}:{":".join(versions)}'
+        if variant:
+            key += f':{hashlib.md5(variant.encode("utf-8")).hexdigest()}'
+        return key
+
+    def list_key(self, request, variant=''):
+        keys = [self.list_version_key]
+        if 'hot' in request.query_params.get('ordering', ''):
+            keys.append(self.hot_version_key)
+        versions = ':'.join(self.versions(keys)).encode('utf-8')
+        url = f'{variant}:{request.build_absolute_uri()}'.encode('utf-8')
+        return 'comment:list:{}:{}'.format(
+            hashlib.md5(versions).hexdigest(), hashlib.md5(url).hexdigest(),
+        )
+
+    def comment_versions(self, comment_ids):
+        return self.versions([
+            self.comment_version_key(comment_id) for comment_id in comment_ids
+        ])
+
+    def get_or_set(self, key, fetch):
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        if read_alias() is not None:
+            return fetch()
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        if not leader:
+            flight.done.wait(self.timeout)
+            if flight.value is not MISSING:
+                return flight.value
+            return fetch()
+        try:
+            flight.value = self.fetch_shared(key, fetch)
+            return flight.value
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def fetch_shared(self, key, fetch):
+        # Other processes wait for whoever holds the shared lock instead of
+        # all fetching the same key at once.
+        shared = self.shared
+        lock_key = f'{key}:lock'
+        locked = shared is not None and shared.add(lock_key, 1, self.timeout)
+        if shared is not None and not locked:
+            deadline = time.monotonic() + self.lock_wait
+            while time.monotonic() < deadline:
+                time.sleep(0.01)
+                value = shared.get(key, MISSING)
+                if value is not MISSING:
+                    self.local.set(key, value, self.timeout)
+                    return value
+        try:
+            value = fetch()
+            self.set(key, value)
+            return value
+        finally:
+            if locked:
+                shared.delete(lock_key)
+
+    def invalidate(self, comment_id=None, membership=True):
+        """
+        Drop the entries showing `comment_id`, or every entry without it.
+
+        `membership=False` tells only the comment's counters or replies
+        changed, so list pages not showing it stay cached.
+        """
+        if not self.enabled:
+            return
+
+        def drop_versions():
+            if comment_id is not None:
+                self.delete(self.comment_version_key(comment_id))
+            else:
+                self.delete(self.all_version_key)
+            if membership or comment_id is None:
+                self.delete(self.list_version_key)
+            else:
+                self.delete(self.hot_version_key)
+        transaction.on_commit(drop_versions)
+
+
+comment_cache = CommentCache()
+
+
+def representation(request):
+    """
+    Format and query string of a read, which select its representation.
+    """
+    query = request.META.get('QUERY_STRING', '')
+    return f'{request.accepted_renderer.format}?{query}'
+
+
+def cached_detail(comment_id, fetch, variant=''):
+    """
+    `(etag, last_modified, build)` of a comment detail, `build`
+    returning its data.
+
+    `fetch` returns the same for a miss; its `build` only runs when the
+    response is not a 304 or when the entry is stored.
+    """
+    if not comment_cache.enabled:
+        return fetch()
+
+    def fill():
+        etag, last_modified, build = fetch()
+        return etag, last_modified, build()
+    key = comment_cache.detail_key(comment_id, variant)
+    etag, last_modified, data = comment_cache.get_or_set(key, fill)
+    return etag, last_modified, lambda: data
+
+
+def cached_list(request, fetch, variant=''):
+    """
+    `(etag, last_modified, build)` of a list page, like `cached_detail`.
+
+    `fetch` returns the ids of the comments on the page first, their
+    tokens are stored with the entry.
+    """
+    if not comment_cache.enabled:
+        return fetch()[1:]
+
+    def fill():
+        comment_ids, etag, last_modified, build = fetch()
+        versions = comment_cache.comment_versions(comment_ids)
+        return comment_ids, versions, etag, last_modified, build()
+    key = comment_cache.list_key(request, variant)
+    comment_ids, versions, etag, last_modified, data = \
+        comment_cache.get_or_set(key, fill)
+    if comment_cache.comment_versions(comment_ids) != versions:
+        # A comment on the page changed since the page was stored.
+        comment_cache.delete(key)
+        _, _, etag, last_modified, data = comment_cache.get_or_set(key, fill)
+    return etag, last_modified, lambda: data
+
+
+def invalidate_comment(comment_id=None, membership=True):
+    comment_cache.invalidate(comment_id, membership)
+
+
+def invalidate_reply(reply_id):
+    if not comment_cache.enabled:
+        return
+    comment_id = Reply.objects\
+        .filter(pk=reply_id)\
+        .values_list('comment_id', flat=True)\
+        .first()
+    invalidate_comment(comment_id, membership=False)
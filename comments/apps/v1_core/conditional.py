@@ -0,0 +1,111 @@
+import hashlib
+
+from apps.v1_core.likes import like_buffer
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+def thread_etag(request, *parts, version=None):
+    """
+    Strong ETag for a representation built from `parts`.
+
+    The accepted format and the query string select the representation,
+    and unflushed buffered likes change it, so they are part of the tag.
+    The edit `version` of an object's detail prefixes the digest, which
+    is what `check_if_match` compares.
+    """
+    parts = (
+        request.accepted_renderer.format,
+        request.get_full_path(),
+        like_buffer.generation if like_buffer.enabled else None,
+    ) + parts
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    if version is not None:
+        return f'"{version}-{digest}"'
+    return f'"{digest}"'
+
+
+def thread_last_modified(comment):
+    modified = comment.thread_modified_at or comment.created_at
+    return int(modified.timestamp())
+
+
+def version_validators(request, instance):
+    """
+    Validators of an object from its edit `version` and `updated_at`.
+    """
+    etag = thread_etag(
+        request, instance._meta.model_name, instance.pk,
+        version=instance.version,
+    )
+    modified = instance.updated_at or instance.created_at
+    return etag, int(modified.timestamp())
+
+
+def comment_validators(request, comment):
+    etag = thread_etag(
+        request, 'comment', comment.id, comment.thread_version,
+        version=comment.version,
+    )
+    return etag, thread_last_modified(comment)
+
+
+def reply_validators(request, reply):
+    etag = thread_etag(
+        request, 'reply', reply.id, reply.comment_id,
+        reply.comment.thread_version, version=reply.version,
+    )
+    return etag, thread_last_modified(reply.comment)
+
+
+def page_validators(request, page, paginator):
+    etag = thread_etag(
+        request, 'page',
+        tuple((comment.id, comment.thread_version) for comment in page),
+        getattr(paginator, 'has_next', None),
+        getattr(paginator, 'has_previous', None),
+    )
+    return etag, None
+
+
+def not_modified_response(request, etag, last_modified):
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The object was changed since the version you sent.'
+    default_code = 'precondition_failed'
+
+
+def check_if_match(request, instance):
+    """
+    Fail unless `If-Match`, when sent, is `*` or lists an `ETag` of the
+    object's detail read at its current version.
+
+    Only the version in the tag is compared, so replies and likes added
+    since the read do not fail an edit, other edits do.
+    """
+    header = request.META.get('HTTP_IF_MATCH', None)
+    if header is None:
+        return
+    tags = {tag.strip() for tag in header.split(',')}
+    if '*' in tags:
+        return
+    prefix = f'"{instance.version}-'
+    if not any(tag.startswith(prefix) for tag in tags):
+        raise PreconditionFailed()
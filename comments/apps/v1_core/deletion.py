@@ -0,0 +1,152 @@
+import logging
+import threading
+
+from apps.v1_core.models import Comment
+from apps.v1_core.models import Reply
+from apps.v1_core.writes import run_write
+from django.conf import settings
+from django.db import connections
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def soft_delete_comment(comment_id):
+    """
+    Hide a comment right away and leave its removal to `purge_worker`.
+
+    The mark is the only thing written, so deleting a large thread costs
+    one indexed `UPDATE`. It is also the worker's queue, which makes
+    pending deletions survive a restart.
+    """
+    deleted = Comment.objects\
+        .filter(pk=comment_id)\
+        .update(deleted_at=timezone.now())
+    if deleted:
+        transaction.on_commit(purge_worker.schedule)
+    return deleted
+
+
+@transaction.atomic
+def delete_reply_chunk(comment_id, chunk_size):
+    """
+    Delete up to `chunk_size` replies of a comment, newest first.
+
+    Nested replies are newer than their parents, so they are usually gone
+    before their parents and the cascade stays within the chunk.
+    """
+    reply_ids = Reply.objects\
+        .filter(comment_id=comment_id)\
+        .order_by('-id')\
+        .values_list('id', flat=True)
+    reply_ids = list(reply_ids[:chunk_size])
+    if not reply_ids:
+        return 0
+    _, deleted = Reply.objects.filter(id__in=reply_ids).delete()
+    return deleted.get(Reply._meta.label, 0)
+
+
+@transaction.atomic
+def delete_purged_comment(comment_id):
+    return Comment.all_objects\
+        .filter(pk=comment_id, deleted_at__isnull=False)\
+        .delete()
+
+
+def purge_comment(comment_id, chunk_size=None):
+    """
+    Delete a soft deleted comment, its replies a chunk per transaction.
+
+    Returns the number of replies deleted.
+    """
+    chunk_size = chunk_size or \
+        getattr(settings, 'COMMENT_PURGE_CHUNK_SIZE', 500)
+    purged = 0
+    while True:
+        deleted = run_write(delete_reply_chunk, comment_id, chunk_size)
+        if not deleted:
+            break
+        purged += deleted
+    run_write(delete_purged_comment, comment_id)
+    return purged
+
+
+def purge_deleted_comments(chunk_size=None):
+    """
+    Purge every soft deleted comment, oldest deletion first.
+
+    Returns the number of comments and replies deleted.
+    """
+    comments = replies = 0
+    while True:
+        # `deleted_at` is not indexed, an index on a mostly null column
+        # would be picked for every read of live comments; one scan per
+        # round keeps this cheap enough for a background job.
+        comment_ids = Comment.all_objects\
+            .filter(deleted_at__isnull=False)\
+            .order_by('deleted_at', 'id')\
+            .values_list('id', flat=True)
+        comment_ids = list(comment_ids)
+        if not comment_ids:
+            return comments, replies
+        for comment_id in comment_ids:
+            replies += purge_comment(comment_id, chunk_size)
+            comments += 1
+
+
+class PurgeWorker:
+    """
+    Background thread running `purge_deleted_comments` after deletes.
+
+    It runs until no soft deleted comment is left, then exits; the next
+    delete starts it again. Comments left over by a stopped process are
+    picked up when the next one starts serving, see `resume_purges`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.requested = False
+
+    def schedule(self):
+        with self.lock:
+            self.requested = True
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='comment-purge', daemon=True,
+                )
+                self.thread.start()
+
+    def run(self):
+        try:
+            while True:
+                with self.lock:
+                    if not self.requested:
+                        self.thread = None
+                        return
+                    self.requested = False
+                try:
+                    purge_deleted_comments()
+                except Exception:
+                    # The marks stay, the next run retries them.
+                    logger.exception('Purging deleted comments failed')
+        finally:
+            connections.close_all()
+
+    def join(self):
+        thread = self.thread
+        if thread is not None:
+            thread.join()
+
+
+purge_worker = PurgeWorker()
+
+
+def resume_purges():
+    """
+    Finish the purges a previous process left behind. The WSGI
+    application calls it once it is loaded; management commands and
+    tests do not.
+    """
+    purge_worker.schedule()
@@ -0,0 +1,55 @@
+from apps.v1_core.likes import pending_likes
+from apps.v1_core.models import Comment
+from apps.v1_core.models import Reply
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+COMMENT_EXPORT_FIELDS = (
+    'id', 'content', 'user', 'likes_comments', 'created_at', 'updated_at',
+    'target_type', 'target_id',
+)
+
+REPLY_EXPORT_FIELDS = (
+    'id', 'content', 'comment', 'parent', 'likes_replies', 'created_at',
+    'updated_at',
+)
+
+
+def iter_comment_threads(chunk_size=None):
+    """
+    Yield every comment as a dict with its replies under `replies`.
+
+    Comments ordered by id and replies ordered by (comment, id) are read
+    through two chunked cursors and merge-joined, so memory stays bounded
+    by `chunk_size` and the replies of a single comment.
+    """
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    comments = Comment.objects\
+        .order_by('id')\
+        .values(*COMMENT_EXPORT_FIELDS)\
+        .iterator(chunk_size=chunk_size)
+    replies = Reply.objects\
+        .order_by('comment', 'id')\
+        .values(*REPLY_EXPORT_FIELDS)\
+        .iterator(chunk_size=chunk_size)
+    reply = next(replies, None)
+    for comment in comments:
+        comment['likes_comments'] += pending_likes('comment', comment['id'])
+        comment['replies'] = []
+        # Replies of comments created after the comment cursor was opened
+        # are skipped rather than attached to the wrong comment.
+        while reply is not None and reply['comment'] <= comment['id']:
+            if reply['comment'] == comment['id']:
+                reply['likes_replies'] += pending_likes('reply', reply['id'])
+                comment['replies'].append(reply)
+            reply = next(replies, None)
+        yield comment
+
+
+def export_ndjson(chunk_size=None):
+    """
+    Yield the comment store as NDJSON, one line per comment thread.
+    """
+    encode = DjangoJSONEncoder(separators=(',', ':')).encode
+    for comment in iter_comment_threads(chunk_size):
+        yield encode(comment) + '\n'
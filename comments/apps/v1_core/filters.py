@@ -0,0 +1,25 @@
+from rest_framework import filters
+
+
+class AliasOrderingFilter(filters.OrderingFilter):
+    """
+    `OrderingFilter` that also accepts the view's `ordering_aliases`.
+
+    An alias names a ranking rather than a column, e.g. `?ordering=hot`
+    for `-hot_score`.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if params:
+            aliases = getattr(view, 'ordering_aliases', {})
+            fields = [
+                aliases.get(param.strip(), param.strip())
+                for param in params.split(',')
+            ]
+            ordering = self.remove_invalid_fields(
+                queryset, fields, view, request,
+            )
+            if ordering:
+                return ordering
+        return self.get_default_ordering(view)
@@ -0,0 +1,275 @@
+import csv
+import json
+from itertools import islice
+
+from apps.v1_core.models import Comment
+from apps.v1_core.models import Reply
+from apps.v1_core.ranking import hot_fields
+from apps.v1_core.ranking import hot_weight
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case
+from django.db.models import DateTimeField
+from django.db.models import Value
+from django.db.models import When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+User = get_user_model()
+
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'invalid timestamp {value!r}')
+    return parsed
+
+
+def normalize_row(record, counter):
+    if not record.get('content'):
+        raise ValueError('content is required')
+    return {
+        'content': record['content'],
+        counter: int(record.get(counter) or 0),
+        'created_at': parse_timestamp(record.get('created_at')),
+        'updated_at': parse_timestamp(record.get('updated_at')),
+    }
+
+
+def normalize_thread(record):
+    thread = normalize_row(record, 'likes_comments')
+    user = record.get('user')
+    thread['user'] = int(user) if user not in (None, '') else None
+    thread['username'] = record.get('username') or None
+    thread['target_type'] = record.get('target_type') or ''
+    thread['target_id'] = str(record.get('target_id') or '')
+    if thread['user'] is None and thread['username'] is None:
+        raise ValueError('user or username is required')
+    thread['replies'] = [
+        normalize_reply(reply) for reply in record.get('replies') or ()
+    ]
+    return thread
+
+
+def normalize_reply(record):
+    reply = normalize_row(record, 'likes_replies')
+    for key in ('id', 'parent'):
+        value = record.get(key)
+        reply[key] = int(value) if value not in (None, '') else None
+    return reply
+
+
+def parse_ndjson(line):
+    """
+    Parse one NDJSON line into a thread, or return the error instead.
+
+    Parsers run in worker processes, so they never touch the database.
+    """
+    try:
+        return normalize_thread(json.loads(line)), None
+    except (TypeError, ValueError) as error:
+        return None, str(error)
+
+
+def parse_csv(row):
+    try:
+        row = dict(row, replies=json.loads(row.get('replies') or '[]'))
+        return normalize_thread(row), None
+    except (TypeError, ValueError) as error:
+        return None, str(error)
+
+
+IMPORT_FORMATS = {
+    'ndjson': parse_ndjson,
+    'csv': parse_csv,
+}
+
+
+def read_records(source, input_format):
+    if input_format == 'csv':
+        return csv.DictReader(source)
+    return (line for line in source if line.strip())
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+class CommentImporter:
+    """
+    Writes parsed comment threads in chunks of one transaction each.
+
+    Users are resolved with one query per chunk, comments and replies are
+    inserted with batched `bulk_create`, and replies are remapped onto the
+    ids their comments received in this database.
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or \
+            getattr(settings, 'BULK_CREATE_BATCH_SIZE', 500)
+        self.usernames = {}
+        self.user_ids = set()
+
+    def resolve_users(self, threads):
+        usernames = {
+            thread['username'] for thread in threads
+            if thread['username'] and thread['username'] not in self.usernames
+        }
+        if usernames:
+            found = User.objects\
+                .filter(username__in=usernames)\
+                .values_list('username', 'id')
+            self.usernames.update(found)
+        user_ids = {
+            thread['user'] for thread in threads
+            if not thread['username'] and thread['user'] is not None
+        } - self.user_ids
+        if user_ids:
+            found = User.objects\
+                .filter(pk__in=user_ids)\
+                .values_list('id', flat=True)
+            self.user_ids.update(found)
+        resolved = []
+        for thread in threads:
+            if thread['username']:
+                user_id = self.usernames.get(thread['username'])
+            elif thread['user'] in self.user_ids:
+                user_id = thread['user']
+            else:
+                user_id = None
+            if user_id is not None:
+                resolved.append((user_id, thread))
+        return resolved
+
+    def import_chunk(self, threads, checkpoint=None):
+        """
+        Import `threads` atomically, returns the comments and replies made.
+
+        `checkpoint`, an `ImportCheckpoint` already holding the progress
+        after this chunk, is saved in the same transaction.
+        """
+        resolved = self.resolve_users(threads)
+        now = timezone.now()
+        with transaction.atomic():
+            comments = [
+                Comment(
+                    user_id=user_id,
+                    content=thread['content'],
+                    likes_comments=thread['likes_comments'],
+                    target_type=thread['target_type'],
+                    target_id=thread['target_id'],
+                    **hot_fields(
+                        hot_weight(
+                            thread['likes_comments'], len(thread['replies']),
+                        ),
+                        aware(thread['created_at']), now,
+                    ),
+                    updated_at=aware(thread['updated_at']),
+                    reply_count=len(thread['replies']),
+                    last_reply_at=max(
+                        (
+                            aware(reply['created_at']) or now
+                            for reply in thread['replies']
+                        ),
+                        default=None,
+                    ),
+                )
+                for user_id, thread in resolved
+            ]
+            Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+            self.assign_ids(Comment, comments)
+            self.restore_created_at(
+                Comment, comments, [thread for _, thread in resolved],
+            )
+
+            replies, reply_ids = 0, {}
+            for level in self.reply_levels(comments, resolved):
+                replies += self.import_replies(level, reply_ids)
+            if checkpoint is not None:
+                checkpoint.save()
+        return len(comments), replies
+
+    def reply_levels(self, comments, resolved):
+        """
+        Group replies by nesting level, parents are listed before replies.
+
+        A reply whose parent is not an earlier reply of the same thread
+        is imported as a direct reply to the comment.
+        """
+        levels = []
+        for comment, (_, thread) in zip(comments, resolved):
+            depths = {}
+            for row in thread['replies']:
+                depth = depths.get(row['parent'], -1) + 1
+                if row['id'] is not None:
+                    depths[row['id']] = depth
+                if depth == len(levels):
+                    levels.append([])
+                levels[depth].append((comment, row))
+        return levels
+
+    def import_replies(self, level, reply_ids):
+        # Each level is inserted and placed in its threads before the next,
+        # whose rows point at the ids this level received.
+        replies = [
+            Reply(
+                comment_id=comment.id,
+                parent_id=reply_ids.get((comment.id, row['parent'])),
+                content=row['content'],
+                likes_replies=row['likes_replies'],
+                updated_at=aware(row['updated_at']),
+            )
+            for comment, row in level
+        ]
+        Reply.objects.bulk_create(replies, batch_size=self.batch_size)
+        self.assign_ids(Reply, replies)
+        for batch in chunked(replies, self.batch_size):
+            Reply.objects\
+                .filter(pk__in=[reply.pk for reply in batch])\
+                .place_in_threads()
+        self.restore_created_at(Reply, replies, [row for _, row in level])
+        for reply, (comment, row) in zip(replies, level):
+            reply_ids[(comment.id, row['id'])] = reply.pk
+        return len(replies)
+
+    def assign_ids(self, model, instances):
+        # Only some backends return primary keys from `bulk_create`.
+        # Elsewhere the rows were inserted in order inside this
+        # transaction, which holds the write lock, so they own the
+        # trailing block of ids.
+        if not instances or instances[0].pk is not None:
+            return
+        last_id = model.objects\
+            .order_by('-pk')\
+            .values_list('pk', flat=True)\
+            .first()
+        first_id = last_id - len(instances) + 1
+        for pk, instance in enumerate(instances, start=first_id):
+            instance.pk = pk
+
+    def restore_created_at(self, model, instances, rows):
+        # `created_at` is `auto_now`, so the source value is written back.
+        created = [
+            (instance.pk, aware(row['created_at']))
+            for instance, row in zip(instances, rows) if row['created_at']
+        ]
+        for batch in chunked(created, self.batch_size):
+            model.objects\
+                .filter(pk__in=[pk for pk, _ in batch])\
+                .update(created_at=Case(
+                    *[When(pk=pk, then=Value(value)) for pk, value in batch],
+                    output_field=DateTimeField(),
+                ))
+
+
+def aware(value):
+    if value is not None and settings.USE_TZ and timezone.is_naive(value):
+        return timezone.make_aware(value, timezone.utc)
+    return value
@@ -0,0 +1,248 @@
+import atexit
+import threading
+
+from apps.v1_core.cache import invalidate_comment
+from apps.v1_core.cache import invalidate_reply
+from apps.v1_core.models import Comment
+from apps.v1_core.models import Like
+from apps.v1_core.models import Reply
+from apps.v1_core.ranking import hot_increment
+from apps.v1_core.ranking import like_weight
+from apps.v1_core.writes import run_write_transaction
+from django.conf import settings
+from django.db import IntegrityError
+from django.db import transaction
+from django.db.models import Case
+from django.db.models import F
+from django.db.models import IntegerField
+from django.db.models import Value
+from django.db.models import When
+from rest_framework.exceptions import NotFound
+
+LIKE_TARGETS = {
+    'comment': (Comment, 'likes_comments'),
+    'reply': (Reply, 'likes_replies'),
+}
+
+
+def increment_likes(target, target_ids, increment):
+    """
+    Add `increment` to the like counters and bump the affected threads.
+    """
+    model, counter = LIKE_TARGETS[target]
+    queryset = model.objects.filter(pk__in=target_ids)
+    changes = {counter: F(counter) + increment}
+    if target == 'comment':
+        changes.update(hot_increment(like_weight() * increment))
+        return queryset.touch_threads(**changes)
+    updated = queryset.update(**changes)
+    Comment.objects.touch_reply_threads(target_ids)
+    return updated
+
+
+class LikeBuffer:
+    """
+    Per-process write-behind buffer for like counters.
+
+    Increments are merged in memory per target id and written with one
+    batched `UPDATE` per target model (reply likes also bump their
+    threads) every `LIKE_BUFFER_FLUSH_INTERVAL` milliseconds or every
+    `LIKE_BUFFER_FLUSH_EVENTS` likes, whichever comes first, always by
+    the background thread. Pending deltas are flushed on interpreter
+    exit.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.deltas = self.empty()
+        self.flushing = self.empty()
+        self.events = 0
+        self.generation = 0
+        self.thread = None
+        self.stopping = False
+        self.wakeup = threading.Event()
+        atexit.register(self.stop)
+
+    def empty(self):
+        return {target: {} for target in LIKE_TARGETS}
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'LIKE_BUFFER_ENABLED', False)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'LIKE_BUFFER_FLUSH_INTERVAL', 200) / 1000
+
+    @property
+    def flush_events(self):
+        return getattr(settings, 'LIKE_BUFFER_FLUSH_EVENTS', 1000)
+
+    def add(self, target, target_id, amount=1):
+        with self.lock:
+            deltas = self.deltas[target]
+            deltas[target_id] = deltas.get(target_id, 0) + amount
+            self.events += 1
+            self.generation += 1
+            full = self.events >= self.flush_events
+        self.start()
+        if full:
+            # The request only wakes the flusher up, it does not wait.
+            self.wakeup.set()
+
+    def pending(self, target, target_id):
+        with self.lock:
+            return self.deltas[target].get(target_id, 0) + \
+                self.flushing[target].get(target_id, 0)
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                self.flushing, self.deltas = self.deltas, self.empty()
+                self.events = 0
+            deltas = self.flushing
+            if not any(deltas.values()):
+                return
+            try:
+                run_write_transaction(self.save, deltas)
+            except Exception:
+                self.merge(deltas)
+                raise
+
+    def save(self, deltas):
+        locked = False
+        try:
+            with transaction.atomic():
+                for target, target_deltas in deltas.items():
+                    self.write(target, target_deltas)
+                # Readers add `flushing` to the counters they read, so it
+                # is emptied in the critical section of the commit: no
+                # reader sees both the new counters and the deltas.
+                self.lock.acquire()
+                locked = True
+            self.flushing = self.empty()
+        finally:
+            if locked:
+                self.lock.release()
+
+    def write(self, target, deltas):
+        if not deltas:
+            return
+        increment = Case(
+            *[
+                When(pk=target_id, then=Value(delta))
+                for target_id, delta in deltas.items()
+            ],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        increment_likes(target, list(deltas), increment)
+
+    def merge(self, deltas):
+        with self.lock:
+            self.flushing = self.empty()
+            for target, target_deltas in deltas.items():
+                for target_id, delta in target_deltas.items():
+                    current = self.deltas[target].get(target_id, 0)
+                    self.deltas[target][target_id] = current + delta
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='like-buffer', daemon=True,
+                )
+                self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            if self.stopping:
+                return
+            try:
+                self.flush()
+            except Exception:
+                # Deltas were merged back, retry on the next tick.
+                pass
+
+    def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.stopping = False
+        self.wakeup.clear()
+        self.flush()
+
+
+like_buffer = LikeBuffer()
+
+
+def pending_likes(target, target_id):
+    return like_buffer.pending(target, target_id)
+
+
+def add_like(user, target, target_id):
+    """
+    Record `user` liking `target` and bump its counter exactly once.
+
+    The unique (user, target) row makes repeated likes a no-op and the
+    counter is incremented with a single `UPDATE ... SET n = n + 1`, or
+    handed to the write-behind `like_buffer` when it is enabled.
+    Returns the current like count and whether a new like was recorded.
+    """
+    if like_buffer.enabled:
+        return add_buffered_like(user, target, target_id)
+    model, counter = LIKE_TARGETS[target]
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Like.objects.create(user=user, **{f'{target}_id': target_id})
+        except IntegrityError:
+            created = False
+        else:
+            created = True
+            updated = increment_likes(target, [target_id], 1)
+            if not updated:
+                raise NotFound(f'{target} not found')
+    likes = model.objects\
+        .filter(pk=target_id)\
+        .values_list(counter, flat=True)\
+        .first()
+    if likes is None:
+        raise NotFound(f'{target} not found')
+    if created:
+        invalidate_like_target(target, target_id)
+    return likes + pending_likes(target, target_id), created
+
+
+def invalidate_like_target(target, target_id):
+    if target == 'comment':
+        invalidate_comment(target_id, membership=False)
+    else:
+        invalidate_reply(target_id)
+
+
+def add_buffered_like(user, target, target_id):
+    model, counter = LIKE_TARGETS[target]
+    likes = model.objects\
+        .filter(pk=target_id)\
+        .values_list(counter, flat=True)\
+        .first()
+    if likes is None:
+        raise NotFound(f'{target} not found')
+    try:
+        with transaction.atomic():
+            Like.objects.create(user=user, **{f'{target}_id': target_id})
+    except IntegrityError:
+        created = False
+    else:
+        created = True
+        like_buffer.add(target, target_id)
+        invalidate_like_target(target, target_id)
+    return likes + pending_likes(target, target_id), created
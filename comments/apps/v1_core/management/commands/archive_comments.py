@@ -0,0 +1,40 @@
+import datetime
+
+from apps.v1_core.archive import archive_comments
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Move old comments and their replies to the archive tables. They '
+        'stay readable with ?archive=true.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            help='Age in days of the comments moved '
+                 '(default ARCHIVE_AFTER_DAYS).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Comments per transaction (default ARCHIVE_BATCH_SIZE).',
+        )
+        parser.add_argument(
+            '--limit', type=int,
+            help='Stop after this many comments.',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = getattr(settings, 'ARCHIVE_AFTER_DAYS', 365)
+        before = timezone.now() - datetime.timedelta(days=days)
+        comments, replies = archive_comments(
+            before, options['batch_size'], options['limit'],
+        )
+        self.stdout.write(
+            f'{comments} comments and {replies} replies archived',
+        )
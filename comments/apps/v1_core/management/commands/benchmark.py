@@ -0,0 +1,107 @@
+import json
+import random
+
+from apps.v1_core.benchmark import MODES
+from apps.v1_core.benchmark import SCENARIOS
+from apps.v1_core.benchmark import compare
+from apps.v1_core.benchmark import run_benchmarks
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the list, detail, search, create, like and reply endpoints '
+        'in process and through a local WSGI server. Writes go to the '
+        'configured database, run it against a seeded copy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', choices=MODES + ('all',), default='all',
+        )
+        parser.add_argument(
+            '--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS,
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Timed requests per scenario.',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='Untimed requests per scenario.',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Clients sending requests at the same time.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument(
+            '--username', default='benchmark',
+            help='User the requests are sent as, created when missing.',
+        )
+        parser.add_argument(
+            '-o', '--output', help='Write the results to this JSON file.',
+        )
+        parser.add_argument(
+            '--baseline', help='Compare with the results in this JSON file.',
+        )
+        parser.add_argument(
+            '--max-regression', type=float, default=0.2,
+            help='Tolerated change against the baseline, as a fraction.',
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Exit with an error when a metric regressed.',
+        )
+
+    def handle(self, *args, **options):
+        modes = MODES if options['mode'] == 'all' else (options['mode'],)
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1.')
+        user, _ = User.objects.get_or_create(username=options['username'])
+        try:
+            results = run_benchmarks(
+                user, modes, options['scenarios'], options['requests'],
+                options['warmup'], random.Random(options['seed']),
+                options['host'], options['concurrency'],
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        for mode, scenarios in results['results'].items():
+            for scenario, result in scenarios.items():
+                self.stdout.write(
+                    f'{mode:9} {scenario:6} '
+                    f'{result["requests_per_second"]:8.1f} req/s  '
+                    f'p50 {result["p50_ms"]:8.2f} ms  '
+                    f'p99 {result["p99_ms"]:8.2f} ms  '
+                    f'{result["queries_per_request"]} queries/req  '
+                    f'{result["errors"]} errors',
+                )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+                output.write('\n')
+        if options['baseline']:
+            self.compare(results, options)
+
+    def compare(self, results, options):
+        with open(options['baseline'], encoding='utf-8') as baseline:
+            baseline = json.load(baseline)
+        rows = compare(baseline, results, options['max_regression'])
+        regressions = 0
+        for mode, scenario, metric, old, new, regressed in rows:
+            change = (new - old) / old * 100 if old else 0.0
+            marker = '  REGRESSION' if regressed else ''
+            self.stdout.write(
+                f'{mode:9} {scenario:6} {metric:20} '
+                f'{old:10} -> {new:10} ({change:+.1f}%){marker}',
+            )
+            regressions += regressed
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{regressions} metrics regressed')
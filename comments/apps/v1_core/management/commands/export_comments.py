@@ -0,0 +1,25 @@
+from apps.v1_core.export import export_ndjson
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Export every comment with its replies as NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-o', '--output',
+            help='File to write to, standard output when omitted.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help='Rows fetched per round trip (default EXPORT_CHUNK_SIZE).',
+        )
+
+    def handle(self, *args, **options):
+        lines = export_ndjson(options['chunk_size'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            output.writelines(lines)
@@ -0,0 +1,121 @@
+import os
+import time
+from itertools import islice
+from multiprocessing import Pool
+
+from apps.v1_core.cache import invalidate_comment
+from apps.v1_core.importer import CommentImporter
+from apps.v1_core.importer import IMPORT_FORMATS
+from apps.v1_core.importer import chunked
+from apps.v1_core.importer import read_records
+from apps.v1_core.models import ImportCheckpoint
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Import comments with nested replies from NDJSON or CSV files. '
+        'CSV files carry the replies of each comment as a JSON array in '
+        'their `replies` column.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', metavar='path')
+        parser.add_argument(
+            '--format', choices=sorted(IMPORT_FORMATS),
+            help='Input format, guessed from the file extension by default.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help='Comments per transaction (default IMPORT_CHUNK_SIZE).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Rows per INSERT (default BULK_CREATE_BATCH_SIZE).',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=0,
+            help='Parse input in this many worker processes.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Name under which progress is recorded in the database; '
+                 'a rerun with the same name resumes from it.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size'] or \
+            getattr(settings, 'IMPORT_CHUNK_SIZE', 1000)
+        importer = CommentImporter(options['batch_size'])
+        checkpoint = options['checkpoint']
+        pool = Pool(options['workers']) if options['workers'] > 1 else None
+        try:
+            for path in options['paths']:
+                self.import_file(
+                    path, options['format'] or self.guess_format(path),
+                    importer, chunk_size, pool, checkpoint,
+                )
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            invalidate_comment()
+
+    def import_file(
+        self, path, input_format, importer, chunk_size, pool, checkpoint,
+    ):
+        progress = self.load_checkpoint(checkpoint, os.path.abspath(path))
+        done = progress.records if progress is not None else 0
+        if done:
+            self.stdout.write(f'{path}: resuming after {done} records')
+        parse = IMPORT_FORMATS[input_format]
+        started = time.monotonic()
+        comments = replies = skipped = 0
+        with open(path, newline='', encoding='utf-8') as source:
+            records = islice(read_records(source, input_format), done, None)
+            if pool is not None:
+                parsed = pool.imap(parse, records, chunksize=chunk_size)
+            else:
+                parsed = map(parse, records)
+            for chunk in chunked(parsed, chunk_size):
+                threads = []
+                for offset, (thread, error) in enumerate(chunk, done + 1):
+                    if error is not None:
+                        self.stderr.write(f'{path}:{offset}: {error}')
+                    else:
+                        threads.append(thread)
+                done += len(chunk)
+                if progress is not None:
+                    progress.records = done
+                created, created_replies = importer.import_chunk(
+                    threads, progress,
+                )
+                skipped += len(chunk) - created
+                comments += created
+                replies += created_replies
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'{path}: {done} records, {comments} comments, '
+                    f'{replies} replies, {skipped} skipped '
+                    f'({(comments + replies) / elapsed:.0f} rows/s)',
+                )
+
+    def guess_format(self, path):
+        extension = os.path.splitext(path)[1].lstrip('.').lower()
+        if extension == 'csv':
+            return 'csv'
+        if extension in ('ndjson', 'jsonl', 'json'):
+            return 'ndjson'
+        raise CommandError(f'{path}: use --format to name the input format')
+
+    def load_checkpoint(self, name, path):
+        # Saved by the transaction of each chunk, so it never runs ahead
+        # of or behind the committed rows.
+        if not name:
+            return None
+        progress = ImportCheckpoint.objects\
+            .filter(name=name, path=path)\
+            .first()
+        return progress or ImportCheckpoint(name=name, path=path)
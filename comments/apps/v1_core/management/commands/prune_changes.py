@@ -0,0 +1,27 @@
+import datetime
+
+from apps.v1_core.sync import prune_changes
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete old entries of the change log behind /api/sync/. Clients '
+        'holding an older sync token have to reload their threads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            help='Days of changes to keep (default SYNC_RETENTION_DAYS).',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = getattr(settings, 'SYNC_RETENTION_DAYS', 30)
+        before = timezone.now() - datetime.timedelta(days=days)
+        deleted = prune_changes(before)
+        self.stdout.write(f'{deleted} changes deleted')
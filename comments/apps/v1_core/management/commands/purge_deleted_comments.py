@@ -0,0 +1,20 @@
+from apps.v1_core.deletion import purge_deleted_comments
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete soft deleted comments and their replies, a chunk of '
+        'replies per transaction. Run it after a restart to finish '
+        'deletions the background worker did not get to.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help='Replies per transaction (default COMMENT_PURGE_CHUNK_SIZE).',
+        )
+
+    def handle(self, *args, **options):
+        comments, replies = purge_deleted_comments(options['chunk_size'])
+        self.stdout.write(f'{comments} comments and {replies} replies deleted')
@@ -0,0 +1,25 @@
+from apps.v1_core.models import Comment
+from apps.v1_core.ranking import hot_rebaser
+from apps.v1_core.ranking import recompute_hot_scores
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Rescale hot scores to the current epoch. The WSGI application '
+        'does it at the start of every epoch on its own.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recompute', action='store_true',
+            help='Score every comment again from its like and reply counts.',
+        )
+
+    def handle(self, *args, **options):
+        if options['recompute']:
+            scored = recompute_hot_scores(Comment.objects.all())
+            self.stdout.write(f'{scored} comments scored')
+            return
+        rebased = hot_rebaser.rebase()
+        self.stdout.write(f'{rebased} comments rebased')
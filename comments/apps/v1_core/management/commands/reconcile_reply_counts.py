@@ -0,0 +1,46 @@
+from apps.v1_core.cache import invalidate_comment
+from apps.v1_core.models import Comment
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recount reply_count and last_reply_at where they drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Comments checked per query.',
+        )
+
+    def handle(self, *args, **options):
+        checked = fixed = 0
+        last_id = 0
+        while True:
+            queryset = Comment.objects\
+                .filter(pk__gt=last_id)\
+                .order_by('pk')\
+                .with_counted_replies()\
+                .values(
+                    'pk', 'reply_count', 'last_reply_at',
+                    'counted_replies', 'latest_reply_at',
+                )
+            comments = list(queryset[:options['chunk_size']])
+            if not comments:
+                break
+            last_id = comments[-1]['pk']
+            checked += len(comments)
+            drifted = [
+                comment['pk'] for comment in comments if self.drifted(comment)
+            ]
+            if drifted:
+                fixed += Comment.objects\
+                    .filter(pk__in=drifted)\
+                    .recount_replies()
+                for comment_id in drifted:
+                    invalidate_comment(comment_id, membership=False)
+        self.stdout.write(f'{checked} comments checked, {fixed} fixed')
+
+    def drifted(self, comment):
+        if comment['reply_count'] != comment['counted_replies']:
+            return True
+        return comment['last_reply_at'] != comment['latest_reply_at']
@@ -0,0 +1,88 @@
+import random
+import time
+
+from apps.v1_core.cache import invalidate_comment
+from apps.v1_core.importer import CommentImporter
+from apps.v1_core.importer import chunked
+from apps.v1_core.seeding import ThreadGenerator
+from apps.v1_core.seeding import seed_users
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic comments, nested replies and skewed like '
+        'counts for benchmarks, e.g. `--comments 1000000 '
+        '--replies-per-comment 10`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=1000)
+        parser.add_argument(
+            '--replies-per-comment', type=float, default=10.0,
+            help='Mean replies per comment (exponentially distributed).',
+        )
+        parser.add_argument(
+            '--users', type=int, default=100,
+            help='Seed users the comments are spread over.',
+        )
+        parser.add_argument(
+            '--like-skew', type=float, default=1.2,
+            help='Pareto shape of like counts, lower is more skewed.',
+        )
+        parser.add_argument('--max-likes', type=int, default=100000)
+        parser.add_argument(
+            '--nesting', type=float, default=0.3,
+            help='Share of replies answering another reply.',
+        )
+        parser.add_argument(
+            '--days', type=int, default=30,
+            help='Spread creation times over this many past days.',
+        )
+        parser.add_argument(
+            '--targets', type=int, default=0,
+            help='Attach comments to this many `article` targets.',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed, the same seed generates the same data.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help='Comments per transaction (default IMPORT_CHUNK_SIZE).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Rows per INSERT (default BULK_CREATE_BATCH_SIZE).',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size'] or \
+            getattr(settings, 'IMPORT_CHUNK_SIZE', 1000)
+        importer = CommentImporter(options['batch_size'])
+        user_ids = seed_users(options['users'], importer.batch_size)
+        generator = ThreadGenerator(
+            random.Random(options['seed']), user_ids,
+            replies_per_comment=options['replies_per_comment'],
+            like_skew=options['like_skew'],
+            max_likes=options['max_likes'],
+            nesting=options['nesting'],
+            days=options['days'],
+            targets=options['targets'],
+        )
+        started = time.monotonic()
+        comments = replies = 0
+        try:
+            threads = generator.threads(options['comments'])
+            for chunk in chunked(threads, chunk_size):
+                created, created_replies = importer.import_chunk(chunk)
+                comments += created
+                replies += created_replies
+                elapsed = max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'{comments} comments, {replies} replies '
+                    f'({(comments + replies) / elapsed:.0f} rows/s)',
+                )
+        finally:
+            invalidate_comment()
@@ -0,0 +1,266 @@
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import BasePermission
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+HISTOGRAMS = {
+    'comments_request_duration_seconds': (
+        'Request latency per view, method and status.', DURATION_BUCKETS,
+    ),
+    'comments_request_queries': (
+        'Database queries per request.', QUERY_BUCKETS,
+    ),
+    'comments_request_db_duration_seconds': (
+        'Time spent in database queries per request.', DURATION_BUCKETS,
+    ),
+    'comments_request_serialize_duration_seconds': (
+        'Time spent building serializer data per request.', DURATION_BUCKETS,
+    ),
+    'comments_request_render_duration_seconds': (
+        'Time spent rendering the response body per request.',
+        DURATION_BUCKETS,
+    ),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Slow requests log at most this many of their statements.
+SLOW_LOG_MAX_QUERIES = 100
+
+_local = threading.local()
+
+
+class RequestMetrics:
+    """
+    Per-process histograms of the requests served, in Prometheus format.
+
+    Observations only take a lock around a few integer increments, and
+    series are keyed by view name rather than path, so their number stays
+    bounded by the url patterns.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {name: {} for name in HISTOGRAMS}
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        index = bisect_left(buckets, value)
+        with self.lock:
+            series = self.series[name].get(labels)
+            if series is None:
+                series = self.series[name][labels] = [0] * (len(buckets) + 1)
+                series.append(0.0)
+            series[index] += 1
+            series[-1] += value
+
+    def totals(self, name):
+        """
+        Sum and count of `name` over all of its series.
+        """
+        with self.lock:
+            series = list(self.series[name].values())
+        return (
+            sum(values[-1] for values in series),
+            sum(sum(values[:-1]) for values in series),
+        )
+
+    def reset(self):
+        with self.lock:
+            self.series = {name: {} for name in HISTOGRAMS}
+
+    def render(self):
+        with self.lock:
+            snapshot = {
+                name: {labels: list(values) for labels, values in series.items()}  # NOQA
+                for name, series in self.series.items()
+            }
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, series in sorted(snapshot[name].items()):
+                cumulative = 0
+                bounds = [repr(float(bound)) for bound in buckets] + ['+Inf']
+                for bound, count in zip(bounds, series):
+                    cumulative += count
+                    le = format_labels(labels + (('le', bound),))
+                    lines.append(f'{name}_bucket{le} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {series[-1]!r}')  # NOQA
+                lines.append(f'{name}_count{format_labels(labels)} {cumulative}')  # NOQA
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+def format_labels(labels):
+    escaped = (
+        (key, value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))  # NOQA
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+@contextmanager
+def timed(stage):
+    """
+    Add the time spent inside to `stage` of the current request.
+
+    Outside of a request this does nothing, and nested uses of the same
+    stage (a list serializer and its children) are only counted once.
+    """
+    timings = getattr(_local, 'timings', None)
+    if timings is None or stage in _local.active:
+        yield
+        return
+    _local.active.add(stage)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timings[stage] = timings.get(stage, 0.0) + elapsed
+        _local.active.discard(stage)
+
+
+class TimedSerializerMixin:
+    """
+    Counts building `data` towards the request's serialize time.
+    """
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class QueryRecorder:
+    """
+    `execute_wrapper` counting the queries of a request and their time.
+    """
+
+    def __init__(self, keep_sql):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = [] if keep_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if self.queries is not None and \
+                    len(self.queries) < SLOW_LOG_MAX_QUERIES:
+                self.queries.append((elapsed, sql, params))
+
+
+class MetricsMiddleware:
+    """
+    Records latency, queries, serialize and render time of every request.
+
+    Set `METRICS_SLOW_REQUEST_MS` to log requests slower than that with
+    their SQL; statements are only kept while it is set.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    @property
+    def slow_request_ms(self):
+        return getattr(settings, 'METRICS_SLOW_REQUEST_MS', None)
+
+    def __call__(self, request):
+        recorder = QueryRecorder(keep_sql=self.slow_request_ms is not None)
+        _local.timings, _local.active = {}, set()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+            duration = time.perf_counter() - started
+            self.record(request, response, duration, recorder, _local.timings)
+        finally:
+            del _local.timings, _local.active
+        return response
+
+    def process_template_response(self, request, response):
+        # Runs right before the response is rendered.
+        started = time.perf_counter()
+        timings = _local.timings
+
+        def rendered(response):
+            timings['render'] = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def record(self, request, response, duration, recorder, timings):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+        labels = (('view', view), ('method', request.method))
+        request_metrics.observe(
+            'comments_request_duration_seconds',
+            labels + (('status', str(response.status_code)),), duration,
+        )
+        request_metrics.observe(
+            'comments_request_queries', labels, recorder.count,
+        )
+        request_metrics.observe(
+            'comments_request_db_duration_seconds', labels, recorder.duration,
+        )
+        for stage in ('serialize', 'render'):
+            if stage in timings:
+                request_metrics.observe(
+                    f'comments_request_{stage}_duration_seconds',
+                    labels, timings[stage],
+                )
+        slow_request_ms = self.slow_request_ms
+        if slow_request_ms is not None and duration * 1000 >= slow_request_ms:
+            self.log_slow_request(request, view, duration, recorder)
+
+    def log_slow_request(self, request, view, duration, recorder):
+        queries = '\n'.join(
+            f'  {elapsed * 1000:.1f} ms {sql} {params!r}'
+            for elapsed, sql, params in recorder.queries
+        )
+        logger.warning(
+            'Slow request %s %s (%s) took %.1f ms, %d queries in %.1f ms\n%s',
+            request.method, request.get_full_path(), view, duration * 1000,
+            recorder.count, recorder.duration * 1000, queries,
+        )
+
+
+class HasMetricsToken(BasePermission):
+    """
+    Requires `Authorization: Bearer <METRICS_TOKEN>` when a token is set.
+    """
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if not token:
+            return True
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        return hmac.compare_digest(authorization, f'Bearer {token}')
@@ -0,0 +1,34 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:34
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v1_core', '0002_reply'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reply',
+            name='comment',
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='replies', to='v1_core.Comment',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(
+                fields=['created_at', 'id'], name='comment_created_id_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(
+                fields=['user', 'id'], name='comment_user_id_idx',
+            ),
+        ),
+    ]
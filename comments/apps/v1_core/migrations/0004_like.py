@@ -0,0 +1,51 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:35
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('v1_core', '0003_comment_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Like',
+            fields=[
+                (
+                    'id', models.AutoField(
+                        auto_created=True,
+                        primary_key=True, serialize=False, verbose_name='ID',
+                    ),
+                ),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                (
+                    'comment', models.ForeignKey(
+                        blank=True, null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='likes', to='v1_core.Comment',
+                    ),
+                ),
+                (
+                    'reply', models.ForeignKey(
+                        blank=True, null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='likes', to='v1_core.Reply',
+                    ),
+                ),
+                (
+                    'user', models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                'unique_together': {('user', 'comment'), ('user', 'reply')},
+            },
+        ),
+    ]
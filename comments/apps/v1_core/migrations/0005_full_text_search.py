@@ -0,0 +1,58 @@
+from django.db import migrations
+
+INDEXES = (
+    ('v1_core_comment', 'v1_core_comment_fts'),
+    ('v1_core_reply', 'v1_core_reply_fts'),
+)
+
+
+def create_full_text_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, index in INDEXES:
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {index} USING fts5('
+            f"content, content='{table}', content_rowid='id')",
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {index}_ai AFTER INSERT ON {table} BEGIN '
+            f'INSERT INTO {index}(rowid, content) '
+            f'VALUES (new.id, new.content); END',
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {index}_ad AFTER DELETE ON {table} BEGIN '
+            f'INSERT INTO {index}({index}, rowid, content) '
+            f"VALUES ('delete', old.id, old.content); END",
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {index}_au AFTER UPDATE OF content ON {table} '
+            f'BEGIN INSERT INTO {index}({index}, rowid, content) '
+            f"VALUES ('delete', old.id, old.content); "
+            f'INSERT INTO {index}(rowid, content) '
+            f'VALUES (new.id, new.content); END',
+        )
+        schema_editor.execute(
+            f"INSERT INTO {index}({index}) VALUES ('rebuild')",
+        )
+
+
+def drop_full_text_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, index in INDEXES:
+        for trigger in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {index}_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {index}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v1_core', '0004_like'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_full_text_indexes, drop_full_text_indexes,
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:44
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v1_core', '0005_full_text_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='thread_modified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='thread_version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
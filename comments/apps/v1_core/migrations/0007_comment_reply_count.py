@@ -0,0 +1,47 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:54
+from django.db import migrations
+from django.db import models
+from django.db.models import Count
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_replies(apps, schema_editor):
+    Comment = apps.get_model('v1_core', 'Comment')
+    Reply = apps.get_model('v1_core', 'Reply')
+    replies = Reply.objects\
+        .filter(comment=OuterRef('pk'))\
+        .order_by()
+    counts = replies\
+        .values('comment')\
+        .annotate(count=Count('id'))\
+        .values('count')
+    latest = replies\
+        .order_by('-created_at')\
+        .values('created_at')
+    Comment.objects.update(
+        reply_count=Coalesce(Subquery(counts), 0),
+        last_reply_at=Subquery(latest[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v1_core', '0006_comment_thread_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='last_reply_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_replies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:58
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+def place_replies(apps, schema_editor):
+    from apps.v1_core.models import thread_placement
+    Reply = apps.get_model('v1_core', 'Reply')
+    # Every existing reply answers its comment directly.
+    Reply.objects.update(**thread_placement(Reply))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v1_core', '0007_comment_reply_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reply',
+            name='depth',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='parent',
+            field=models.ForeignKey(
+                blank=True, null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='children', to='v1_core.Reply',
+            ),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='path',
+            field=models.CharField(blank=True, default='', max_length=512),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='position',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='reply',
+            index=models.Index(
+                fields=['comment', 'path'], name='reply_comment_path_idx',
+            ),
+        ),
+        migrations.RunPython(place_replies, migrations.RunPython.noop),
+    ]
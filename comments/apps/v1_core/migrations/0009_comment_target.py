@@ -0,0 +1,30 @@
+# Generated by Django 2.1.7 on 2026-10-18 17:01
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v1_core', '0008_reply_threads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='target_id',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='target_type',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(
+                fields=['target_type', 'target_id', 'created_at', 'id'],
+                name='comment_target_created_idx',
+            ),
+        ),
+    ]
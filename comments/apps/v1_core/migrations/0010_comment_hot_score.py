@@ -0,0 +1,41 @@
+# Generated by Django 2.1.7 on 2026-10-18 17:07
+import apps.v1_core.ranking
+from django.db import migrations
+from django.db import models
+
+
+def score_comments(apps, schema_editor):
+    from apps.v1_core.ranking import recompute_hot_scores
+    Comment = apps.get_model('v1_core', 'Comment')
+    recompute_hot_scores(Comment.objects.all())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v1_core', '0009_comment_target'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='hot_epoch',
+            field=models.IntegerField(
+                default=apps.v1_core.ranking.current_hot_epoch,
+            ),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='hot_score',
+            field=models.FloatField(
+                default=apps.v1_core.ranking.new_hot_score,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(
+                fields=['hot_score', 'id'], name='comment_hot_id_idx',
+            ),
+        ),
+        migrations.RunPython(score_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.1.7 on 2026-10-18 17:11
+from django.db import migrations
+from django.db import models
+
+
+def create_change_triggers(apps, schema_editor):
+    from apps.v1_core.sync import ensure_change_triggers
+    ensure_change_triggers(schema_editor.connection)
+
+
+def drop_change_triggers(apps, schema_editor):
+    from apps.v1_core.sync import drop_change_triggers
+    drop_change_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v1_core', '0010_comment_hot_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True, primary_key=True, serialize=False,
+                    verbose_name='ID',
+                )),
+                ('kind', models.CharField(max_length=16)),
+                ('object_id', models.IntegerField()),
+                ('comment_id', models.IntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(
+                fields=['comment_id', 'id'], name='change_comment_id_idx',
+            ),
+        ),
+        migrations.RunPython(create_change_triggers, drop_change_triggers),
+    ]
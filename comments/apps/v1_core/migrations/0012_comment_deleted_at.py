@@ -0,0 +1,29 @@
+# Generated by Django 2.1.7 on 2026-10-18 17:40
+from django.db import migrations
+from django.db import models
+
+
+def refresh_change_triggers(apps, schema_editor):
+    # The comment update trigger now also fires on `deleted_at`.
+    from apps.v1_core.sync import drop_change_triggers
+    from apps.v1_core.sync import ensure_change_triggers
+    drop_change_triggers(schema_editor.connection)
+    ensure_change_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v1_core', '0011_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(
+            refresh_change_triggers, refresh_change_triggers,
+        ),
+    ]
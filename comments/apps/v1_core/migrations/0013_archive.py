@@ -0,0 +1,92 @@
+# Generated by Django 2.1.7 on 2026-10-18 17:45
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('v1_core', '0012_comment_deleted_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+                ('likes_comments', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+                ('thread_version', models.IntegerField(default=0)),
+                ('thread_modified_at', models.DateTimeField(
+                    blank=True, null=True,
+                )),
+                ('reply_count', models.IntegerField(default=0)),
+                ('last_reply_at', models.DateTimeField(
+                    blank=True, null=True,
+                )),
+                ('target_type', models.CharField(
+                    blank=True, default='', max_length=64,
+                )),
+                ('target_id', models.CharField(
+                    blank=True, default='', max_length=64,
+                )),
+                ('hot_score', models.FloatField(default=0.0)),
+                ('archived_at', models.DateTimeField()),
+                ('user', models.ForeignKey(
+                    db_constraint=False,
+                    on_delete=django.db.models.deletion.DO_NOTHING,
+                    related_name='+', to=settings.AUTH_USER_MODEL,
+                )),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedReply',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+                ('path', models.CharField(
+                    blank=True, default='', max_length=512,
+                )),
+                ('depth', models.IntegerField(default=0)),
+                ('position', models.IntegerField(default=0)),
+                ('likes_replies', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+                ('comment', models.ForeignKey(
+                    db_constraint=False,
+                    on_delete=django.db.models.deletion.DO_NOTHING,
+                    related_name='replies', to='v1_core.ArchivedComment',
+                )),
+                ('parent', models.ForeignKey(
+                    blank=True, db_constraint=False, null=True,
+                    on_delete=django.db.models.deletion.DO_NOTHING,
+                    related_name='children', to='v1_core.ArchivedReply',
+                )),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedreply',
+            index=models.Index(
+                fields=['comment', 'path'], name='archived_reply_comment_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomment',
+            index=models.Index(
+                fields=['created_at', 'id'],
+                name='archived_comment_created_idx',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomment',
+            index=models.Index(
+                fields=['target_type', 'target_id', 'created_at', 'id'],
+                name='archived_comment_target_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.1.7 on 2026-10-18 18:07
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v1_core', '0014_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True, primary_key=True, serialize=False,
+                    verbose_name='ID',
+                )),
+                ('name', models.CharField(max_length=255)),
+                ('path', models.CharField(max_length=1024)),
+                ('records', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('name', 'path')},
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+INDEXES = (
+    ('v1_core_comment', 'v1_core_comment_fts'),
+    ('v1_core_reply', 'v1_core_reply_fts'),
+)
+
+TRIGGERS = (
+    (
+        'ai',
+        'AFTER INSERT ON {table} BEGIN '
+        'INSERT INTO {index}(rowid, content) VALUES (new.id, new.content); '
+        'END',
+    ),
+    (
+        'ad',
+        'AFTER DELETE ON {table} BEGIN '
+        'INSERT INTO {index}({index}, rowid, content) '
+        "VALUES ('delete', old.id, old.content); END",
+    ),
+    (
+        'au',
+        'AFTER UPDATE OF content ON {table} BEGIN '
+        'INSERT INTO {index}({index}, rowid, content) '
+        "VALUES ('delete', old.id, old.content); "
+        'INSERT INTO {index}(rowid, content) VALUES (new.id, new.content); '
+        'END',
+    ),
+)
+
+
+def recreate_full_text_triggers(apps, schema_editor):
+    # Table rebuilds by the migrations since 0005 dropped the triggers,
+    # so the indexes missed writes and are rebuilt too.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, index in INDEXES:
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5('
+            f"content, content='{table}', content_rowid='id')",
+        )
+        for name, body in TRIGGERS:
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {index}_{name}')
+            schema_editor.execute(
+                f'CREATE TRIGGER {index}_{name} '
+                f'{body.format(table=table, index=index)}',
+            )
+        schema_editor.execute(
+            f"INSERT INTO {index}({index}) VALUES ('rebuild')",
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('v1_core', '0015_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            recreate_full_text_triggers, migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,194 @@
+from apps.v1_core.conditional import PreconditionFailed
+from apps.v1_core.conditional import check_if_match
+from apps.v1_core.conditional import set_validators
+from apps.v1_core.conditional import version_validators
+from apps.v1_core.rows import RowSerializer
+from apps.v1_core.writes import run_write_transaction
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+
+class BulkCreateModelMixin:
+    """
+    `POST <list>/bulk/` with a JSON array creates every item at once.
+
+    Items are validated in one pass, with related rows preloaded by a
+    single `in_bulk` query per relation, and inserted with `bulk_create`
+    in batches inside one transaction, committed through the write queue
+    like every other write. If any item is invalid nothing is inserted
+    and the errors are reported per item index.
+    """
+    bulk_batch_size_query_param = 'batch_size'
+
+    def get_throttle_cost(self, request):
+        # A bulk create spends a throttle token per item.
+        if self.action == 'bulk_create' and isinstance(request.data, list):
+            return max(len(request.data), 1)
+        return 1
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        items = request.data
+        max_items = getattr(settings, 'BULK_CREATE_MAX_ITEMS', 10000)
+        if not isinstance(items, list):
+            return Response(
+                data={'response': 'expected a list of items'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > max_items:
+            return Response(
+                data={'response': f'at most {max_items} items per request'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        context = self.get_serializer_context()
+        serializer_class = self.get_serializer_class()
+        context['preloaded'] = self.preload_related(
+            serializer_class(context=context), items,
+        )
+        serializer = serializer_class(data=items, many=True, context=context)
+        if not serializer.is_valid():
+            return Response(
+                data={'errors': self.get_bulk_errors(serializer)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        model = self.get_queryset().model
+        instances = [model(**data) for data in serializer.validated_data]
+        self.perform_bulk_create(
+            instances, self.get_bulk_batch_size(request),
+        )
+        return Response(
+            data={'created': len(instances)},
+            status=status.HTTP_201_CREATED,
+        )
+
+    def preload_related(self, serializer, items):
+        preloaded = {}
+        for name, field in serializer.fields.items():
+            if not isinstance(field, serializers.PrimaryKeyRelatedField):
+                continue
+            ids = set()
+            for item in items:
+                try:
+                    ids.add(int(item[name]))
+                except (KeyError, TypeError, ValueError):
+                    # Left for the field to report or fill from its default.
+                    pass
+            model = field.get_queryset().model
+            preloaded[model] = model._default_manager.in_bulk(ids)
+        return preloaded
+
+    def get_bulk_errors(self, serializer):
+        errors = serializer.errors
+        if isinstance(errors, dict):
+            return [{'index': None, 'errors': errors}]
+        return [
+            {'index': index, 'errors': item_errors}
+            for index, item_errors in enumerate(errors) if item_errors
+        ]
+
+    def get_bulk_batch_size(self, request):
+        batch_size = getattr(settings, 'BULK_CREATE_BATCH_SIZE', 500)
+        try:
+            batch_size = int(
+                request.query_params[self.bulk_batch_size_query_param],
+            )
+        except (KeyError, ValueError):
+            pass
+        return max(batch_size, 1)
+
+    def perform_bulk_create(self, instances, batch_size):
+        run_write_transaction(self.save_bulk_create, instances, batch_size)
+
+    @transaction.atomic
+    def save_bulk_create(self, instances, batch_size):
+        model = self.get_queryset().model
+        model.objects.bulk_create(instances, batch_size=batch_size)
+
+
+class VersionedUpdateMixin:
+    """
+    Edits written with one `UPDATE ... WHERE id = %s AND version = %s`.
+
+    The version is the one read for validation, checked against
+    `If-Match` first, so an edit never overwrites a newer one; losing
+    the race to a concurrent edit answers 412 like a stale `If-Match`.
+    The response carries the validators from `get_validators`, so its
+    `ETag` can be sent with the next edit; they default to the ones of
+    the edited object's `version` and `updated_at`.
+    """
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        check_if_match(request, instance)
+        serializer = self.get_serializer(
+            instance, data=request.data, partial=partial,
+        )
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        etag, last_modified = self.get_validators(request, serializer.instance)
+        return set_validators(Response(serializer.data), etag, last_modified)
+
+    def get_validators(self, request, instance):
+        return version_validators(request, instance)
+
+    def save_versioned(self, serializer, **changes):
+        """
+        Write the validated data and `changes` if the row is still at the
+        version of `serializer.instance`, and apply them to the instance.
+        """
+        instance = serializer.instance
+        values = dict(serializer.validated_data, updated_at=timezone.now())
+        updated = type(instance)._default_manager\
+            .filter(pk=instance.pk, version=instance.version)\
+            .update(version=F('version') + 1, **values, **changes)
+        if not updated:
+            raise PreconditionFailed()
+        for name, value in values.items():
+            setattr(instance, name, value)
+        instance.version += 1
+
+
+class RowSerializerMixin:
+    """
+    Serves JSON reads from `values_list` rows through a `RowSerializer`.
+
+    Other renderers, and serializers with fields the row serializer does
+    not know, keep going through the regular serializer.
+    `row_columns` are loaded besides the output, for validators and
+    pagination cursors.
+    """
+    row_columns = ('id',)
+
+    def get_row_serializer(self):
+        if not getattr(settings, 'FAST_READ_PATH_ENABLED', True):
+            return None
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        if getattr(renderer, 'format', None) != 'json':
+            return None
+        return RowSerializer.compile(
+            self.get_serializer(), self.get_row_method_fields(),
+        )
+
+    def get_row_method_fields(self):
+        return {}
+
+    def get_rows(self, queryset, row_serializer):
+        if row_serializer is None:
+            return queryset
+        return row_serializer.values_list(queryset, *self.row_columns)
+
+    def get_data(self, instances, row_serializer, many=True):
+        if row_serializer is None:
+            return self.get_serializer(instances, many=many).data
+        if many:
+            return row_serializer.serialize(instances)
+        return row_serializer.serialize([instances])[0]
@@ -1,11 +1,139 @@
+from collections import Counter
+
+from apps.v1_core.ranking import current_hot_epoch
+from apps.v1_core.ranking import hot_increment
+from apps.v1_core.ranking import new_hot_score
+from apps.v1_core.ranking import reply_weight
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.functions import Cast
+from django.db.models.functions import Coalesce
+from django.db.models.functions import Concat
+from django.db.models.functions import LPad
+from django.db.models.functions import Substr
+from django.utils import timezone
 
 # Create your models here.
 
 User = get_user_model()
 
 
+class TargetQuerySet(models.QuerySet):
+    """
+    Lookups by external target, shared by live and archived comments.
+    """
+
+    def for_target(self, target_type, target_id):
+        return self.filter(target_type=target_type, target_id=target_id)
+
+    def target_counts(self, target_type, target_ids):
+        """
+        Comments per target id, one grouped query over the target index.
+        """
+        counted = self\
+            .filter(target_type=target_type, target_id__in=target_ids)\
+            .order_by()\
+            .values_list('target_id')\
+            .annotate(count=models.Count('id'))
+        counts = dict.fromkeys(target_ids, 0)
+        counts.update(counted)
+        return counts
+
+
+class CommentQuerySet(TargetQuerySet):
+
+    def touch_threads(self, **changes):
+        return self.update(
+            thread_version=models.F('thread_version') + 1,
+            thread_modified_at=timezone.now(),
+            **changes,
+        )
+
+    def touch_reply_threads(self, reply_ids):
+        comment_ids = Reply.objects\
+            .filter(pk__in=reply_ids)\
+            .values('comment_id')
+        return self.filter(id__in=comment_ids).touch_threads()
+
+    def with_counted_replies(self):
+        return self.annotate(
+            counted_replies=counted_replies(),
+            latest_reply_at=latest_reply_at(),
+        )
+
+    def recount_replies(self):
+        return self.touch_threads(
+            reply_count=counted_replies(),
+            last_reply_at=latest_reply_at(),
+        )
+
+    def replies_added(self, replies):
+        """
+        Count just created `replies` on their comments in one `UPDATE`.
+        """
+        counts = Counter(reply.comment_id for reply in replies)
+        latest = {}
+        for reply in replies:
+            current = latest.get(reply.comment_id)
+            if current is None or reply.created_at > current:
+                latest[reply.comment_id] = reply.created_at
+        added = per_comment(counts, models.IntegerField())
+        return self.filter(pk__in=counts).touch_threads(
+            reply_count=models.F('reply_count') + added,
+            last_reply_at=per_comment(latest, models.DateTimeField()),
+            **hot_increment(reply_weight() * added),
+        )
+
+    def replies_removed(self, comment_ids):
+        """
+        Uncount one removed reply per entry of `comment_ids`.
+        """
+        counts = Counter(comment_ids)
+        return self.filter(pk__in=counts).touch_threads(
+            reply_count=models.F('reply_count') - per_comment(
+                counts, models.IntegerField(),
+            ),
+            last_reply_at=latest_reply_at(),
+        )
+
+
+class CommentManager(models.Manager.from_queryset(CommentQuerySet)):
+    """
+    Leaves out soft deleted comments, see `apps.v1_core.deletion`.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+def per_comment(values, output_field):
+    return models.Case(
+        *[
+            models.When(pk=comment_id, then=models.Value(value))
+            for comment_id, value in values.items()
+        ],
+        output_field=output_field,
+    )
+
+
+def counted_replies():
+    counts = Reply.objects\
+        .filter(comment=models.OuterRef('pk'))\
+        .order_by()\
+        .values('comment')\
+        .annotate(count=models.Count('id'))\
+        .values('count')
+    return Coalesce(models.Subquery(counts), 0)
+
+
+def latest_reply_at():
+    latest = Reply.objects\
+        .filter(comment=models.OuterRef('pk'))\
+        .order_by('-created_at')\
+        .values('created_at')
+    return models.Subquery(latest[:1])
+
+
 class Comment(models.Model):
 
     content = models.TextField(blank=False, null=False)
@@ -13,17 +141,327 @@ class Comment(models.Model):
     likes_comments = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now=True)
     updated_at = models.DateTimeField(blank=True, null=True)
+    thread_version = models.IntegerField(default=0)
+    thread_modified_at = models.DateTimeField(blank=True, null=True)
+    reply_count = models.IntegerField(default=0)
+    last_reply_at = models.DateTimeField(blank=True, null=True)
+    target_type = models.CharField(max_length=64, blank=True, default='')
+    target_id = models.CharField(max_length=64, blank=True, default='')
+    hot_score = models.FloatField(default=new_hot_score)
+    hot_epoch = models.IntegerField(default=current_hot_epoch)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+    # Bumped by every edit, clients send it back with `If-Match`.
+    version = models.IntegerField(default=0)
+
+    objects = CommentManager()
+    all_objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['created_at', 'id'], name='comment_created_id_idx',
+            ),
+            models.Index(fields=['user', 'id'], name='comment_user_id_idx'),
+            models.Index(
+                fields=['target_type', 'target_id', 'created_at', 'id'],
+                name='comment_target_created_idx',
+            ),
+            models.Index(
+                fields=['hot_score', 'id'], name='comment_hot_id_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.content
 
 
+# A reply's `path` is its parent's path plus one segment: the reply's
+# position after its older siblings and its id, both zero padded, so sorting by
+# path walks a thread depth first and a subtree is one range of paths.
+PATH_POSITION_WIDTH = 6
+PATH_ID_WIDTH = 10
+PATH_SEGMENT_WIDTH = PATH_POSITION_WIDTH + PATH_ID_WIDTH
+PATH_MAX_LENGTH = 512
+
+
+def thread_placement(model):
+    """
+    `UPDATE` values placing new rows of `model` under their parents.
+
+    Run it on replies whose parents are already placed; it only reads the
+    parent row and the older siblings. A reply's position follows the
+    highest position among its placed older siblings, plus one for each
+    older sibling placed by the same statement, so it never goes back
+    below an existing reply once older siblings are deleted.
+    """
+    parents = model.objects.filter(pk=models.OuterRef('parent_id'))
+
+    def following(**siblings):
+        older = model.objects\
+            .filter(id__lt=models.OuterRef('id'), **siblings)\
+            .order_by()\
+            .values('comment_id')
+        last = older\
+            .exclude(path='')\
+            .annotate(last=models.Max('position'))\
+            .values('last')
+        waiting = older\
+            .filter(path='')\
+            .annotate(count=models.Count('id'))\
+            .values('count')
+        return Coalesce(
+            models.Subquery(last, output_field=models.IntegerField()), 0,
+        ) + Coalesce(
+            models.Subquery(waiting, output_field=models.IntegerField()), 0,
+        )
+
+    position = models.Case(
+        models.When(parent__isnull=True, then=following(
+            comment_id=models.OuterRef('comment_id'), parent__isnull=True,
+        )),
+        default=following(parent_id=models.OuterRef('parent_id')),
+        output_field=models.IntegerField(),
+    ) + 1
+    return {
+        'depth': Coalesce(
+            models.Subquery(parents.values('depth')[:1]) + 1, 0,
+        ),
+        'position': position,
+        'path': Concat(
+            Coalesce(
+                models.Subquery(parents.values('path')[:1]), models.Value(''),
+            ),
+            LPad(
+                Cast(position, models.CharField()),
+                PATH_POSITION_WIDTH, models.Value('0'),
+            ),
+            LPad(
+                Cast('id', models.CharField()),
+                PATH_ID_WIDTH, models.Value('0'),
+            ),
+            output_field=models.CharField(),
+        ),
+    }
+
+
+class ReplyQuerySet(models.QuerySet):
+
+    def visible(self):
+        """
+        Replies whose comment is not soft deleted.
+        """
+        return self.filter(comment__deleted_at__isnull=True)
+
+    def place_in_threads(self):
+        return self.update(**thread_placement(self.model))
+
+    def thread(self, comment_id, root=None, depth=None, children=None):
+        """
+        Replies of a comment, or under `root`, in depth first order.
+
+        `depth` limits how many levels are returned and `children` how many
+        replies per parent. The depth limit is a filter on `depth` on the
+        range scan of the `(comment, path)` index. The per parent limit
+        reads each level's ancestor id from the path and keeps it when it
+        is among the first `children` ids of its parent, so it still holds
+        k replies after older siblings were deleted.
+        """
+        queryset = self.filter(comment_id=comment_id)
+        base, offset = 0, 0
+        if root is not None:
+            queryset = queryset.filter(
+                path__gt=root.path, path__lt=root.path + ':',
+            )
+            base, offset = root.depth + 1, len(root.path)
+        if depth is not None:
+            queryset = queryset.filter(depth__lt=base + depth)
+        if children is not None:
+            levels = depth or PATH_MAX_LENGTH // PATH_SEGMENT_WIDTH - base
+            siblings = self.model.objects.order_by('id').values('id')
+            if root is not None:
+                firsts = siblings.filter(parent_id=root.id)
+            else:
+                firsts = siblings.filter(
+                    comment_id=comment_id, parent__isnull=True,
+                )
+            for level in range(levels):
+                name = f'ancestor_{level}'
+                start = offset + level * PATH_SEGMENT_WIDTH + 1
+                if level:
+                    firsts = siblings.filter(
+                        parent_id=models.OuterRef(f'ancestor_{level - 1}'),
+                    )
+                above = models.Q(depth__lt=base + level)
+                within = models.Q(**{
+                    f'{name}__in': models.Subquery(firsts[:children]),
+                })
+                queryset = queryset\
+                    .annotate(**{name: Cast(
+                        Substr(
+                            'path', start + PATH_POSITION_WIDTH, PATH_ID_WIDTH,
+                        ),
+                        models.IntegerField(),
+                    )})\
+                    .filter(above | within)
+        return queryset.order_by('path')
+
+
 class Reply(models.Model):
 
     content = models.TextField(null=False, blank=False)
     comment = models.ForeignKey(
         Comment, related_name='replies', on_delete=models.CASCADE,
     )
+    parent = models.ForeignKey(
+        'self', related_name='children', null=True, blank=True,
+        on_delete=models.CASCADE,
+    )
+    path = models.CharField(
+        max_length=PATH_MAX_LENGTH, blank=True, default='',
+    )
+    depth = models.IntegerField(default=0)
+    position = models.IntegerField(default=0)
     likes_replies = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now=True)
     updated_at = models.DateTimeField(null=True, blank=True)
+    version = models.IntegerField(default=0)
+
+    objects = ReplyQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['comment', 'path'], name='reply_comment_path_idx',
+            ),
+        ]
+
+
+class ArchivedComment(models.Model):
+    """
+    Comment moved out of the hot tables by `apps.v1_core.archive`.
+
+    Keeps the columns and ids of `Comment`, so both serialize the same,
+    and lives in the `ARCHIVE_DATABASE`; the user is a plain id there.
+    """
+    id = models.IntegerField(primary_key=True)
+    content = models.TextField()
+    user = models.ForeignKey(
+        User, related_name='+', on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    likes_comments = models.IntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(blank=True, null=True)
+    thread_version = models.IntegerField(default=0)
+    thread_modified_at = models.DateTimeField(blank=True, null=True)
+    reply_count = models.IntegerField(default=0)
+    last_reply_at = models.DateTimeField(blank=True, null=True)
+    target_type = models.CharField(max_length=64, blank=True, default='')
+    target_id = models.CharField(max_length=64, blank=True, default='')
+    hot_score = models.FloatField(default=0.0)
+    version = models.IntegerField(default=0)
+    archived_at = models.DateTimeField()
+
+    objects = TargetQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['created_at', 'id'],
+                name='archived_comment_created_idx',
+            ),
+            models.Index(
+                fields=['target_type', 'target_id', 'created_at', 'id'],
+                name='archived_comment_target_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return self.content
+
+
+class ArchivedReply(models.Model):
+    """
+    Reply archived with its comment, columns in the order of `Reply`.
+    """
+    id = models.IntegerField(primary_key=True)
+    content = models.TextField()
+    comment = models.ForeignKey(
+        ArchivedComment, related_name='replies', on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    parent = models.ForeignKey(
+        'self', related_name='children', null=True, blank=True,
+        on_delete=models.DO_NOTHING, db_constraint=False,
+    )
+    path = models.CharField(
+        max_length=PATH_MAX_LENGTH, blank=True, default='',
+    )
+    depth = models.IntegerField(default=0)
+    position = models.IntegerField(default=0)
+    likes_replies = models.IntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(null=True, blank=True)
+    version = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['comment', 'path'],
+                name='archived_reply_comment_idx',
+            ),
+        ]
+
+
+class Like(models.Model):
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    comment = models.ForeignKey(
+        Comment, related_name='likes', null=True, blank=True,
+        on_delete=models.CASCADE,
+    )
+    reply = models.ForeignKey(
+        Reply, related_name='likes', null=True, blank=True,
+        on_delete=models.CASCADE,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('user', 'comment'), ('user', 'reply'))
+
+
+class Change(models.Model):
+    """
+    Append-only log of comment and reply writes, filled by triggers.
+
+    The id is the change sequence handed to clients as a sync token, and
+    rows with `deleted` set are the tombstones of deleted objects.
+    """
+    COMMENT = 'comment'
+    REPLY = 'reply'
+
+    kind = models.CharField(max_length=16)
+    object_id = models.IntegerField()
+    comment_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['comment_id', 'id'], name='change_comment_id_idx',
+            ),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Records of a file `import_comments` committed, saved in the same
+    transaction as their chunk so a resumed import never repeats one.
+    """
+    name = models.CharField(max_length=255)
+    path = models.CharField(max_length=1024)
+    records = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('name', 'path'),)
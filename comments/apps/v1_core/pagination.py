@@ -0,0 +1,143 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque cursor pagination over a `(<field>, id)` keyset.
+
+    Every page is a single indexed range query, so fetching page 10,000
+    costs the same as fetching page 1.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = 'created_at'
+    keyset_fields = {
+        'created_at': ('created_at', parse_datetime),
+        'user': ('user_id', int),
+        'rank': ('rank', float),
+        'hot_score': ('hot_score', float),
+    }
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(
+            request, queryset, view,
+        )
+        cursor = self.decode_cursor(request)
+        self.reverse = cursor is not None and cursor['r']
+
+        queryset = queryset.order_by(*self.get_order_by(self.reverse))
+        if cursor is not None:
+            queryset = queryset.filter(self.get_position_filter(cursor))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+
+        self.page = results
+        self.has_next = has_more if not self.reverse else cursor is not None
+        self.has_previous = cursor is not None if not self.reverse else has_more  # NOQA
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for filter_cls in getattr(view, 'filter_backends', ()):
+            if hasattr(filter_cls, 'get_ordering'):
+                ordering = filter_cls().get_ordering(request, queryset, view)
+                break
+        ordering = ordering[0] if ordering else self.ordering
+        field = ordering.lstrip('-')
+        if field not in self.keyset_fields:
+            field, ordering = self.ordering.lstrip('-'), self.ordering
+        return field, ordering.startswith('-')
+
+    def get_order_by(self, reverse):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return f'{prefix}{self.field}', f'{prefix}id'
+
+    def get_position_filter(self, cursor):
+        descending = self.descending != cursor['r']
+        lookup = 'lt' if descending else 'gt'
+        bound = 'lte' if descending else 'gte'
+        value = cursor['v']
+        after = Q(**{f'{self.field}__{lookup}': value})
+        after |= Q(**{f'id__{lookup}': cursor['id']})
+        return Q(**{f'{self.field}__{bound}': value}) & after
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.page[0], reverse=True)
+
+    def get_link(self, instance, reverse):
+        url = self.request.build_absolute_uri()
+        value = getattr(instance, self.keyset_fields[self.field][0])
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        cursor = self.encode_cursor({'v': value, 'id': instance.id, 'r': reverse})  # NOQA
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def encode_cursor(self, cursor):
+        data = json.dumps(cursor, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))  # NOQA
+            cursor = {
+                'v': cursor['v'], 'id': int(cursor['id']),
+                'r': bool(cursor['r']),
+            }
+            cursor['v'] = self.keyset_fields[self.field][1](cursor['v'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if cursor['v'] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+
+class ThreadPagination(KeysetPagination):
+    """
+    Keyset pagination over replies in depth first (`path`) order.
+    """
+    ordering = 'path'
+    keyset_fields = {
+        'path': ('path', str),
+    }
@@ -0,0 +1,253 @@
+import datetime
+import logging
+import threading
+
+from apps.v1_core.writes import run_write
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case
+from django.db.models import ExpressionWrapper
+from django.db.models import F
+from django.db.models import FloatField
+from django.db.models import Value
+from django.db.models import When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+EPOCH_ORIGIN = datetime.datetime(2019, 1, 1, tzinfo=timezone.utc)
+
+
+def half_life():
+    return getattr(settings, 'HOT_SCORE_HALF_LIFE', 12 * 60 * 60)
+
+
+def epoch_length():
+    return getattr(settings, 'HOT_SCORE_EPOCH_LENGTH', 3 * 60 * 60)
+
+
+def epoch_of(moment):
+    return int((moment - EPOCH_ORIGIN).total_seconds() // epoch_length())
+
+
+def epoch_start(epoch):
+    return EPOCH_ORIGIN + datetime.timedelta(seconds=epoch * epoch_length())
+
+
+def growth(moment, epoch):
+    """
+    Weight of an event at `moment` in the scale of `epoch`.
+    """
+    seconds = (moment - epoch_start(epoch)).total_seconds()
+    return 2 ** (seconds / half_life())
+
+
+def rescaling(epoch, current):
+    """
+    Factor moving a score of `epoch` to the scale of `current`.
+
+    Computed as a negative power, so a very old epoch underflows to zero
+    instead of overflowing.
+    """
+    return 2 ** -((current - epoch) * epoch_length() / half_life())
+
+
+def hot_fields(weight, moment=None, now=None):
+    """
+    `hot_score` and `hot_epoch` of a comment scored `weight` at `moment`.
+    """
+    now = now or timezone.now()
+    epoch = epoch_of(now)
+    return {
+        'hot_score': weight * growth(moment or now, epoch),
+        'hot_epoch': epoch,
+    }
+
+
+def current_hot_epoch():
+    return epoch_of(timezone.now())
+
+
+def new_hot_score():
+    return hot_fields(comment_weight())['hot_score']
+
+
+def hot_increment(weight, now=None):
+    """
+    `hot_score` plus `weight` (a number or an expression) counted now,
+    with `hot_epoch` moved to the current epoch.
+
+    A comment's score is the sum of its events, each weighted by
+    `2 ** (age / half life)` relative to the start of the comment's
+    `hot_epoch`. Newer events weigh more, which orders comments exactly
+    like decaying every older event, but an event only ever adds a
+    constant, so it is a plain `UPDATE ... SET hot_score = hot_score + x`.
+    The old score is rescaled to the current epoch in the same `UPDATE`,
+    however old its epoch is.
+    """
+    now = now or timezone.now()
+    current = epoch_of(now)
+    rescale = Value(2.0) ** (
+        (F('hot_epoch') - current) * (epoch_length() / half_life())
+    )
+    return {
+        'hot_score': ExpressionWrapper(
+            F('hot_score') * rescale + weight * Value(
+                growth(now, current), output_field=FloatField(),
+            ),
+            output_field=FloatField(),
+        ),
+        'hot_epoch': current,
+    }
+
+
+def comment_weight():
+    return getattr(settings, 'HOT_SCORE_COMMENT_WEIGHT', 1)
+
+
+def like_weight():
+    return getattr(settings, 'HOT_SCORE_LIKE_WEIGHT', 1)
+
+
+def reply_weight():
+    return getattr(settings, 'HOT_SCORE_REPLY_WEIGHT', 2)
+
+
+def hot_weight(likes=0, replies=0):
+    return comment_weight() + likes * like_weight() + \
+        replies * reply_weight()
+
+
+def rebase_hot_scores(queryset, batch_size=500, now=None):
+    """
+    Rescale comments of older epochs to the current one, walking the ids
+    in batches of one `UPDATE` each.
+
+    Scores grow with every epoch, so this keeps them in floating point
+    range and makes comments of different epochs comparable again. Every
+    batch is its own write, so the write lock is released between them.
+    """
+    current = epoch_of(now or timezone.now())
+    last_id, rebased = 0, 0
+    while True:
+        rows = queryset\
+            .filter(pk__gt=last_id, hot_epoch__lt=current)\
+            .order_by('pk')\
+            .values_list('pk', 'hot_epoch')
+        rows = list(rows[:batch_size])
+        if not rows:
+            return rebased
+        last_id = rows[-1][0]
+        epochs = {epoch for _, epoch in rows}
+        factor = Case(
+            *[
+                When(hot_epoch=epoch, then=Value(rescaling(epoch, current)))
+                for epoch in epochs
+            ],
+            output_field=FloatField(),
+        )
+        # Comments written since were moved to the current epoch already.
+        batch = queryset.filter(
+            pk__in=[row[0] for row in rows], hot_epoch__in=epochs,
+        )
+        rebased += run_write(
+            batch.update, hot_score=F('hot_score') * factor,
+            hot_epoch=current,
+        )
+
+
+class HotScoreRebaser:
+    """
+    Background thread running `rebase_hot_scores` at the start of every
+    epoch.
+
+    Every write puts its comment in the current epoch, so only comments
+    untouched since an older epoch need it. Reads ordered by `hot` never
+    rebase; the WSGI application starts the thread once it is loaded,
+    elsewhere the `rebase_hot_scores` command does the same.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopping = False
+        self.wakeup = threading.Event()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.stopping = False
+                self.thread = threading.Thread(
+                    target=self.run, name='hot-rebase', daemon=True,
+                )
+                self.thread.start()
+
+    def run(self):
+        try:
+            while True:
+                try:
+                    self.rebase()
+                except Exception:
+                    # Scores stay in their epochs, the next epoch retries.
+                    logger.exception('Rebasing hot scores failed')
+                now = timezone.now()
+                next_epoch = epoch_start(epoch_of(now) + 1)
+                self.wakeup.wait((next_epoch - now).total_seconds())
+                self.wakeup.clear()
+                if self.stopping:
+                    return
+        finally:
+            connections.close_all()
+
+    def rebase(self, now=None):
+        # Both modules import this one.
+        from apps.v1_core.cache import invalidate_comment
+        from apps.v1_core.models import Comment
+        rebased = rebase_hot_scores(Comment.objects.all(), now=now)
+        if rebased:
+            invalidate_comment()
+        return rebased
+
+    def stop(self):
+        with self.lock:
+            thread, self.stopping = self.thread, True
+            self.wakeup.set()
+        if thread is not None:
+            thread.join()
+        with self.lock:
+            self.thread = None
+            self.wakeup.clear()
+
+
+hot_rebaser = HotScoreRebaser()
+
+
+def recompute_hot_scores(queryset, batch_size=500, now=None):
+    """
+    Score comments from their counters as if every event happened when
+    the comment was created, in batches of one `UPDATE` each.
+    """
+    now = now or timezone.now()
+    epoch = epoch_of(now)
+    last_id, updated = 0, 0
+    while True:
+        rows = queryset\
+            .filter(pk__gt=last_id)\
+            .order_by('pk')\
+            .values_list('pk', 'created_at', 'likes_comments', 'reply_count')
+        rows = list(rows[:batch_size])
+        if not rows:
+            return updated
+        last_id = rows[-1][0]
+        scores = [
+            When(pk=pk, then=Value(
+                hot_weight(likes, replies) * growth(created_at, epoch),
+            ))
+            for pk, created_at, likes, replies in rows
+        ]
+        updated += queryset\
+            .filter(pk__in=[row[0] for row in rows])\
+            .update(
+                hot_score=Case(*scores, output_field=FloatField()),
+                hot_epoch=epoch,
+            )
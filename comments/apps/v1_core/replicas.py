@@ -0,0 +1,166 @@
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db import DatabaseError
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class ReplicaPool:
+    """
+    Weighted choice among the healthy aliases of `DATABASE_REPLICAS`.
+
+    Each replica is probed with `SELECT 1` at most once per
+    `REPLICA_HEALTH_CHECK_SECONDS`; a replica failing the probe is left
+    out until the next one succeeds. With no healthy replica reads stay
+    on the primary.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checks = {}
+
+    @property
+    def replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', {})
+
+    @property
+    def check_interval(self):
+        return getattr(settings, 'REPLICA_HEALTH_CHECK_SECONDS', 10)
+
+    def probe(self, alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError:
+            logger.warning('Read replica %s failed its health check', alias)
+            return False
+        return True
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            healthy, checked_at = self.checks.get(alias, (True, None))
+            if checked_at is not None and \
+                    now - checked_at < self.check_interval:
+                return healthy
+            # Claimed before probing, so only one request probes at once.
+            self.checks[alias] = (healthy, now)
+        healthy = self.probe(alias)
+        with self.lock:
+            self.checks[alias] = (healthy, now)
+        return healthy
+
+    def mark_failed(self, alias):
+        with self.lock:
+            self.checks[alias] = (False, time.monotonic())
+
+    def choose(self, rng=random):
+        candidates = [
+            (alias, weight) for alias, weight in self.replicas.items()
+            if weight > 0 and self.is_healthy(alias)
+        ]
+        if not candidates:
+            return None
+        aliases, weights = zip(*candidates)
+        return rng.choices(aliases, weights)[0]
+
+    def reset(self):
+        with self.lock:
+            self.checks = {}
+
+
+replica_pool = ReplicaPool()
+
+
+def read_alias():
+    """
+    Replica serving the reads of the current request, if any.
+    """
+    return getattr(_local, 'alias', None)
+
+
+class ReplicaRouter:
+    """
+    Sends comment reads to the replica picked by `ReplicaMiddleware` for
+    the current request and every write to the primary.
+
+    Sessions and users stay on the primary, so a fresh login is never
+    missed, and outside of routed requests all reads do.
+    """
+    app_labels = ('v1_core',)
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in self.app_labels:
+            return read_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Without an answer Django would write instances to the database
+        # they were read from, which may be a replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaMiddleware:
+    """
+    Routes safe requests to views with `use_read_replicas` to a replica.
+
+    A successful write pins its client to the primary for
+    `REPLICA_STICKY_SECONDS` with a cookie, so it reads its own writes
+    however far the replicas lag.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @property
+    def sticky_seconds(self):
+        return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+    @property
+    def cookie_name(self):
+        return getattr(settings, 'REPLICA_PIN_COOKIE', 'primary_pin')
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.alias = None
+        if request.method not in SAFE_METHODS and \
+                response.status_code < 400 and self.sticky_seconds:
+            response.set_cookie(
+                self.cookie_name, str(time.time() + self.sticky_seconds),
+                max_age=self.sticky_seconds, httponly=True,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'cls', None)
+        if request.method in SAFE_METHODS and \
+                getattr(view, 'use_read_replicas', False) and \
+                not self.is_pinned(request):
+            _local.alias = replica_pool.choose()
+
+    def process_exception(self, request, exception):
+        alias = read_alias()
+        if alias is not None and isinstance(exception, DatabaseError):
+            logger.warning('Read replica %s failed: %s', alias, exception)
+            replica_pool.mark_failed(alias)
+
+    def is_pinned(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(self.cookie_name, 0))
+        except ValueError:
+            return False
+        return pinned_until > time.time()
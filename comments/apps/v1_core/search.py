@@ -0,0 +1,178 @@
+import operator
+from functools import reduce
+
+from apps.v1_core.models import Comment
+from apps.v1_core.models import Reply
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models import Q
+from django.db.models import Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from rest_framework import filters
+
+FULL_TEXT_INDEXES = {
+    Comment: 'v1_core_comment_fts',
+    Reply: 'v1_core_reply_fts',
+}
+
+FULL_TEXT_TRIGGERS = {
+    'ai': (
+        'AFTER INSERT ON {table} BEGIN '
+        'INSERT INTO {index}(rowid, content) VALUES (new.id, new.content); '
+        'END'
+    ),
+    'ad': (
+        'AFTER DELETE ON {table} BEGIN '
+        'INSERT INTO {index}({index}, rowid, content) '
+        "VALUES ('delete', old.id, old.content); END"
+    ),
+    'au': (
+        'AFTER UPDATE OF content ON {table} BEGIN '
+        'INSERT INTO {index}({index}, rowid, content) '
+        "VALUES ('delete', old.id, old.content); "
+        'INSERT INTO {index}(rowid, content) VALUES (new.id, new.content); '
+        'END'
+    ),
+}
+
+_available_indexes = {}
+
+
+def ensure_full_text_indexes(connection):
+    """
+    Create the sync triggers of the FTS5 tables where they are missing.
+
+    SQLite rebuilds a table to alter it, which silently drops its
+    triggers, so this also runs after every `migrate`. An index that
+    missed writes in the meantime is rebuilt from its content table.
+    The FTS5 tables themselves belong to the migrations.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    _available_indexes.clear()
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        triggers = {row[0] for row in cursor.fetchall()}
+        for model, index in FULL_TEXT_INDEXES.items():
+            table = model._meta.db_table
+            if table not in tables or index not in tables:
+                continue
+            stale = False
+            for name, body in FULL_TEXT_TRIGGERS.items():
+                if f'{index}_{name}' in triggers:
+                    continue
+                stale = True
+                body = body.format(table=table, index=index)
+                cursor.execute(f'CREATE TRIGGER {index}_{name} {body}')
+            if stale:
+                cursor.execute(
+                    f"INSERT INTO {index}({index}) VALUES ('rebuild')",
+                )
+
+
+def has_full_text_index(model, using):
+    index = FULL_TEXT_INDEXES.get(model)
+    connection = connections[using]
+    if index is None or connection.vendor != 'sqlite':
+        return False
+    key = (using, index)
+    if key not in _available_indexes:
+        with connection.cursor() as cursor:
+            tables = connection.introspection.table_names(cursor)
+        _available_indexes[key] = index in tables
+    return _available_indexes[key]
+
+
+class MatchingRowids(RawSQL):
+    """
+    Rowids matching a full-text query, meant for an `__in` lookup.
+
+    `RawSQL` wraps itself in parentheses and `__in` adds its own, which
+    SQLite reads as a scalar subquery returning only the first rowid.
+    """
+
+    def __init__(self, index, match):
+        super().__init__(
+            f'SELECT rowid FROM {index} WHERE content MATCH %s', (match,),
+        )
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def build_match_query(search_terms):
+    """
+    Quote every term and match it as a prefix, all terms must match.
+    """
+    return ' '.join(
+        '"{}"*'.format(term.replace('"', '""')) for term in search_terms
+    )
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    `SearchFilter` that resolves `content` through an SQLite FTS5 index.
+
+    Matching ids come from the inverted index instead of an `icontains`
+    table scan, and the bm25 relevance is annotated as `rank` so the
+    results can be sorted with `?ordering=rank`. The remaining
+    `search_fields` keep the regular `SearchFilter` lookups, and
+    databases without the index fall back to `SearchFilter` entirely.
+    """
+    full_text_field = 'content'
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        model = queryset.model
+        if not search_terms or not has_full_text_index(model, queryset.db):
+            queryset = super().filter_queryset(request, queryset, view)
+            return self.annotate_rank(queryset, view)
+
+        index = FULL_TEXT_INDEXES[model]
+        match = build_match_query(search_terms)
+        condition = Q(id__in=MatchingRowids(index, match))
+        search_fields = [
+            field for field in getattr(view, 'search_fields', ())
+            if field != self.full_text_field
+        ]
+        if search_fields:
+            orm_lookups = [
+                self.construct_search(str(field)) for field in search_fields
+            ]
+            condition |= reduce(operator.and_, [
+                reduce(operator.or_, [
+                    self.lookup_condition(model, orm_lookup, search_term)
+                    for orm_lookup in orm_lookups
+                ])
+                for search_term in search_terms
+            ])
+
+        rank = RawSQL(
+            f'SELECT rank FROM {index} WHERE content MATCH %s '
+            f'AND rowid = {model._meta.db_table}.id',
+            (match,), output_field=FloatField(),
+        )
+        queryset = queryset.filter(condition)
+        return self.annotate_rank(queryset, view, rank)
+
+    def lookup_condition(self, model, orm_lookup, search_term):
+        # Lookups across a relation become `<fk> IN (SELECT ...)` so the
+        # database can answer both sides of the OR from an index.
+        relation, _, related_lookup = orm_lookup.partition('__')
+        field = model._meta.get_field(relation)
+        if not related_lookup or not field.is_relation:
+            return Q(**{orm_lookup: search_term})
+        related = field.related_model._default_manager\
+            .filter(**{related_lookup: search_term})\
+            .values('pk')
+        return Q(**{f'{relation}__in': related})
+
+    def annotate_rank(self, queryset, view, rank=None):
+        if 'rank' not in getattr(view, 'ordering_fields', ()):
+            return queryset
+        unranked = Value(0.0, output_field=FloatField())
+        if rank is None:
+            return queryset.annotate(rank=unranked)
+        return queryset.annotate(rank=Coalesce(rank, unranked))
@@ -0,0 +1,115 @@
+import datetime
+
+from apps.v1_core.importer import chunked
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+User = get_user_model()
+
+WORDS = (
+    'apple', 'river', 'signal', 'copper', 'garden', 'lantern', 'velvet',
+    'orbit', 'meadow', 'harbor', 'pixel', 'thunder', 'maple', 'canvas',
+    'ember', 'glacier', 'quartz', 'willow', 'falcon', 'compass', 'saffron',
+    'tundra', 'marble', 'beacon', 'cobalt', 'prairie', 'lagoon', 'summit',
+)
+
+SEED_USERNAME = 'seed-user-{}'
+
+
+def seed_users(count, batch_size):
+    """
+    Ids of `count` seed users, creating the ones missing.
+    """
+    # Seed users cannot log in, so one unusable password serves them all.
+    password = make_password(None)
+    user_ids = []
+    usernames = (SEED_USERNAME.format(i) for i in range(count))
+    for batch in chunked(usernames, batch_size):
+        existing = User.objects\
+            .filter(username__in=batch)\
+            .values_list('username', flat=True)
+        existing = set(existing)
+        User.objects.bulk_create([
+            User(username=username, password=password)
+            for username in batch if username not in existing
+        ])
+        batch_ids = User.objects\
+            .filter(username__in=batch)\
+            .order_by('id')\
+            .values_list('id', flat=True)
+        user_ids.extend(batch_ids)
+    return user_ids
+
+
+class ThreadGenerator:
+    """
+    Synthetic comment threads in the normalized `import_comments` format.
+
+    Reply counts are exponential around `replies_per_comment`, like counts
+    follow a Pareto distribution (a few comments get most likes), and
+    `nesting` is the share of replies answering an earlier reply.
+    Everything is drawn from `rng`, so a seed reproduces the dataset.
+    """
+
+    def __init__(
+        self, rng, user_ids, replies_per_comment=10.0, like_skew=1.2,
+        max_likes=100000, nesting=0.3, days=30, targets=0, now=None,
+    ):
+        self.rng = rng
+        self.user_ids = user_ids
+        self.replies_per_comment = replies_per_comment
+        self.like_skew = like_skew
+        self.max_likes = max_likes
+        self.nesting = nesting
+        self.seconds = days * 24 * 60 * 60
+        self.targets = targets
+        self.now = now or timezone.now()
+
+    def content(self, words=8):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
+
+    def likes(self):
+        return min(int(self.rng.paretovariate(self.like_skew)) - 1, self.max_likes)  # NOQA
+
+    def moment(self, after=None):
+        start = after or self.now - datetime.timedelta(seconds=self.seconds)
+        span = (self.now - start).total_seconds()
+        return start + datetime.timedelta(seconds=self.rng.random() * span)
+
+    def thread(self):
+        created_at = self.moment()
+        target = self.rng.randrange(self.targets) if self.targets else None
+        replies = 0
+        if self.replies_per_comment:
+            replies = int(self.rng.expovariate(1 / self.replies_per_comment))
+        return {
+            'content': self.content(),
+            'likes_comments': self.likes(),
+            'created_at': created_at,
+            'updated_at': None,
+            'user': self.rng.choice(self.user_ids),
+            'username': None,
+            'target_type': 'article' if target is not None else '',
+            'target_id': str(target) if target is not None else '',
+            'replies': [
+                self.reply(reply_id, created_at) for reply_id in range(replies)
+            ],
+        }
+
+    def reply(self, reply_id, after):
+        parent = None
+        if reply_id and self.rng.random() < self.nesting:
+            parent = self.rng.randrange(reply_id)
+        return {
+            'id': reply_id,
+            'parent': parent,
+            'content': self.content(self.rng.randint(3, 12)),
+            'likes_replies': self.likes() // 10,
+            'created_at': self.moment(after),
+            'updated_at': None,
+        }
+
+    def threads(self, count):
+        for _ in range(count):
+            yield self.thread()
@@ -1,48 +1,263 @@
+import operator
+from functools import reduce
+
+from apps.v1_core.likes import pending_likes
+from apps.v1_core.metrics import TimedSerializerMixin
+from apps.v1_core.models import ArchivedComment
+from apps.v1_core.models import ArchivedReply
 from apps.v1_core.models import Comment
 from apps.v1_core.models import Reply
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import Q
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 
 User = get_user_model()
 
 
-class CommentSerializer(serializers.ModelSerializer):
+def group_replies(comment_ids, limit=None, model=Reply):
+    replies = {comment_id: [] for comment_id in comment_ids}
+    queryset = model.objects.filter(comment__in=comment_ids)
+    if limit is not None and comment_ids:
+        # One `LIMIT` subquery per comment, so only `limit` replies of
+        # each are read however large its thread is.
+        queryset = model.objects.filter(reduce(operator.or_, [
+            Q(id__in=first_replies(comment_id, limit, model))
+            for comment_id in comment_ids
+        ]))
+    queryset = queryset\
+        .order_by('id')\
+        .values()
+    for reply in queryset:
+        reply['likes_replies'] += pending_likes('reply', reply['id'])
+        replies[reply['comment_id']].append(reply)
+    return replies
+
+
+def first_replies(comment_id, limit, model=Reply):
+    replies = model.objects\
+        .filter(comment=comment_id)\
+        .order_by('id')\
+        .values('id')
+    return replies[:limit]
+
+
+REPLY_EMBEDDINGS = ('all', 'none', 'count')
+
+
+def reply_embedding(request):
+    """
+    `(mode, limit)` selected by `?replies=all|none|count|first:N`.
+    """
+    value = getattr(request, 'query_params', {}).get('replies', 'all')
+    if value in REPLY_EMBEDDINGS:
+        return value, None
+    mode, _, limit = value.partition(':')
+    max_limit = getattr(settings, 'REPLY_EMBED_MAX', 100)
+    if mode == 'first' and limit.isdigit() and 0 < int(limit) <= max_limit:
+        return mode, int(limit)
+    raise serializers.ValidationError({
+        'replies': f'Use all, none, count or first:N up to {max_limit}.',
+    })
+
+
+def sparse_fields(request):
+    """
+    Field names asked for with `?fields=a,b` on reads, `None` for all.
+    """
+    if getattr(request, 'method', None) not in SAFE_METHODS:
+        return None
+    value = getattr(request, 'query_params', {}).get('fields', None)
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves primary keys from `context['preloaded'][model]` when present.
+
+    Bulk endpoints fetch every referenced row with one `in_bulk` query
+    instead of one `get` per item.
+    """
+
+    def to_internal_value(self, data):
+        model = self.get_queryset().model
+        preloaded = self.context.get('preloaded', {}).get(model)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        try:
+            return preloaded[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class CommentListSerializer(TimedListSerializer):
+
+    def to_representation(self, data):
+        comments = list(data.all() if hasattr(data, 'all') else data)
+        replies = self.child.fields.get('replies', None)
+        if isinstance(replies, serializers.SerializerMethodField):
+            _, limit = reply_embedding(self.context.get('request', None))
+            self.context['replies'] = group_replies(
+                [comment.id for comment in comments], limit,
+                self.child.reply_model,
+            )
+        return super().to_representation(comments)
+
+
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     replies = serializers.SerializerMethodField()
-    user = serializers.PrimaryKeyRelatedField(
+    user = PreloadedPrimaryKeyRelatedField(
         queryset=User.objects.all(),
         default=serializers.CurrentUserDefault(),
     )
+    # Like target and counter topped up with the buffered likes.
+    likes_counter = ('comment', 'likes_comments')
+    reply_model = Reply
 
     class Meta:
         model = Comment
         fields = (
-            'content', 'replies', 'user',
+            'content', 'replies', 'reply_count',
+            'last_reply_at', 'user',
             'likes_comments', 'created_at',
-            'updated_at',
+            'updated_at', 'target_type', 'target_id', 'version',
+        )
+        # Counters and scores only change through `F()` increments.
+        read_only_fields = (
+            'reply_count', 'last_reply_at', 'version', 'likes_comments',
+            'hot_score', 'hot_epoch',
         )
+        list_serializer_class = CommentListSerializer
 
     def get_replies(self, instance):
-        replies = Reply.objects\
-            .filter(comment=instance.id)\
-            .values()
-        return replies
+        replies = self.context.get('replies', None)
+        if replies is not None and instance.id in replies:
+            return replies[instance.id]
+        _, limit = reply_embedding(self.context.get('request', None))
+        replies = group_replies([instance.id], limit, self.reply_model)
+        return replies[instance.id]
+
+    def validate(self, attrs):
+        target_type = attrs.get(
+            'target_type', getattr(self.instance, 'target_type', ''),
+        )
+        target_id = attrs.get(
+            'target_id', getattr(self.instance, 'target_id', ''),
+        )
+        if bool(target_type) != bool(target_id):
+            raise serializers.ValidationError(
+                'target_type and target_id are set together.',
+            )
+        return attrs
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        target, counter = self.likes_counter
+        if counter in data:
+            data[counter] += pending_likes(target, instance.id)
+        return data
 
     def get_fields(self, *args, **kwargs):
         fields = super().get_fields()
         request = self.context.get('request', None)
         if request and getattr(request, 'method', None) == 'PATCH':
             fields['content'].required = False
+        mode, _ = reply_embedding(request)
+        if 'replies' in fields and mode == 'none':
+            # Clients showing only `reply_count` skip the replies table.
+            fields.pop('replies')
+        elif 'replies' in fields and mode == 'count':
+            fields['replies'] = serializers.IntegerField(
+                source='reply_count', read_only=True,
+            )
+        names = sparse_fields(request)
+        if names is None:
+            return fields
+        unknown = names.difference(fields)
+        if unknown:
+            raise serializers.ValidationError({
+                'fields': f'Unknown fields: {", ".join(sorted(unknown))}.',
+            })
+        for name in list(fields):
+            if name not in names:
+                fields.pop(name)
         return fields
 
 
-class ReplySerializer(serializers.ModelSerializer):
+class SyncCommentSerializer(CommentSerializer):
+    """
+    Comment as returned by the sync endpoint, replies are synced apart.
+    """
+    replies = None
+
+    class Meta(CommentSerializer.Meta):
+        fields = ('id',) + tuple(
+            field for field in CommentSerializer.Meta.fields
+            if field != 'replies'
+        )
+
+
+class ArchivedCommentSerializer(CommentSerializer):
+    """
+    Comment read back from the archive, in the shape it had when live.
+    """
+    reply_model = ArchivedReply
+
+    class Meta(CommentSerializer.Meta):
+        model = ArchivedComment
+
+
+class ReplySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    serializer_related_field = PreloadedPrimaryKeyRelatedField
+    likes_counter = ('reply', 'likes_replies')
+
     class Meta:
         model = Reply
         fields = (
-            'content', 'comment', 'likes_replies',
-            'created_at', 'updated_at',
+            'id', 'content', 'comment', 'parent', 'depth',
+            'likes_replies', 'created_at', 'updated_at', 'version',
         )
-        read_only = 'likes_replies',
+        read_only_fields = ('depth', 'version', 'likes_replies',)
+        list_serializer_class = TimedListSerializer
+
+    def validate(self, attrs):
+        instance = self.instance
+        comment = attrs.get('comment', getattr(instance, 'comment', None))
+        parent = attrs.get('parent', getattr(instance, 'parent', None))
+        max_depth = getattr(settings, 'REPLY_MAX_DEPTH', 32)
+        if instance is not None and parent != instance.parent:
+            raise serializers.ValidationError(
+                {'parent': 'A reply cannot change its parent.'},
+            )
+        if parent is not None and parent.comment_id != comment.id:
+            raise serializers.ValidationError(
+                {'parent': 'The parent must reply to the same comment.'},
+            )
+        if parent is not None and parent.depth + 1 >= max_depth:
+            raise serializers.ValidationError(
+                {'parent': f'Replies nest at most {max_depth} levels deep.'},
+            )
+        if instance is not None and comment != instance.comment:
+            if instance.parent_id or instance.children.exists():
+                raise serializers.ValidationError(
+                    {'comment': 'Only a reply outside a thread can move.'},
+                )
+        return attrs
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        target, counter = self.likes_counter
+        data[counter] += pending_likes(target, instance.id)
+        return data
 
     def get_fields(self, *args, **kwargs):
         fields = super().get_fields()
@@ -50,3 +265,43 @@ class ReplySerializer(serializers.ModelSerializer):
         if request and getattr(request, 'method', None) == 'PATCH':
             fields['content'].required = False
         return fields
+
+
+class ReplyThreadQuerySerializer(serializers.Serializer):
+    comment = serializers.PrimaryKeyRelatedField(
+        queryset=Comment.objects.all(), required=False,
+    )
+    root = serializers.PrimaryKeyRelatedField(
+        queryset=Reply.objects.visible(), required=False,
+    )
+    depth = serializers.IntegerField(min_value=1, required=False)
+    children = serializers.IntegerField(
+        min_value=1, max_value=999999, required=False,
+    )
+
+    def validate(self, attrs):
+        if 'comment' not in attrs and 'root' not in attrs:
+            raise serializers.ValidationError(
+                'Pass the comment or the root reply of the thread.',
+            )
+        return attrs
+
+
+class TargetCountsQuerySerializer(serializers.Serializer):
+    target_type = serializers.CharField(max_length=64)
+    target_id = serializers.ListField(
+        child=serializers.CharField(max_length=64), min_length=1,
+    )
+
+    def validate_target_id(self, value):
+        max_targets = getattr(settings, 'TARGET_COUNTS_MAX_TARGETS', 200)
+        if len(value) > max_targets:
+            raise serializers.ValidationError(
+                f'At most {max_targets} targets per request.',
+            )
+        return value
+
+
+class SyncQuerySerializer(serializers.Serializer):
+    token = serializers.IntegerField(min_value=0, required=False)
+    comment = serializers.IntegerField(min_value=1, required=False)
@@ -0,0 +1,183 @@
+from apps.v1_core.models import Change
+from apps.v1_core.models import Comment
+from apps.v1_core.models import Reply
+from django.conf import settings
+from django.db.models import Max
+
+CHANGE_TABLE = Change._meta.db_table
+
+CHANGE_COLUMNS = f'{CHANGE_TABLE}(kind, object_id, comment_id, deleted, changed_at)'  # NOQA
+
+CHANGED_AT = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# Only columns that are part of an object's own representation log a
+# change, so counters such as likes or `reply_count` do not flood it.
+CHANGE_TRIGGERS = {
+    Comment: {
+        'ai': (
+            'AFTER INSERT ON {table} BEGIN '
+            'INSERT INTO {columns} '
+            f"VALUES ('comment', new.id, new.id, 0, {CHANGED_AT}); END"
+        ),
+        'au': (
+            'AFTER UPDATE OF content, user_id, updated_at, target_type, '
+            'target_id, deleted_at ON {table} BEGIN '
+            'INSERT INTO {columns} '
+            f"VALUES ('comment', new.id, new.id, 0, {CHANGED_AT}); END"
+        ),
+        'ad': (
+            'AFTER DELETE ON {table} BEGIN '
+            'INSERT INTO {columns} '
+            f"VALUES ('comment', old.id, old.id, 1, {CHANGED_AT}); END"
+        ),
+    },
+    Reply: {
+        'ai': (
+            'AFTER INSERT ON {table} BEGIN '
+            'INSERT INTO {columns} '
+            f"VALUES ('reply', new.id, new.comment_id, 0, {CHANGED_AT}); END"
+        ),
+        # A reply moved to another comment leaves a tombstone in the old
+        # thread, logged first so the move itself is the latest change.
+        'au': (
+            'AFTER UPDATE OF content, comment_id, parent_id, updated_at '
+            'ON {table} BEGIN '
+            'INSERT INTO {columns} '
+            f"SELECT 'reply', old.id, old.comment_id, 1, {CHANGED_AT} "
+            'WHERE old.comment_id != new.comment_id; '
+            'INSERT INTO {columns} '
+            f"VALUES ('reply', new.id, new.comment_id, 0, {CHANGED_AT}); END"
+        ),
+        'ad': (
+            'AFTER DELETE ON {table} BEGIN '
+            'INSERT INTO {columns} '
+            f"VALUES ('reply', old.id, old.comment_id, 1, {CHANGED_AT}); END"
+        ),
+    },
+}
+
+
+def ensure_change_triggers(connection):
+    """
+    Create the triggers filling the change log where they are missing.
+
+    Like the full-text triggers they are dropped whenever SQLite rebuilds
+    a table, so this also runs after every `migrate`.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        if CHANGE_TABLE not in tables:
+            return
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        triggers = {row[0] for row in cursor.fetchall()}
+        for model, bodies in CHANGE_TRIGGERS.items():
+            table = model._meta.db_table
+            if table not in tables:
+                continue
+            for name, body in bodies.items():
+                if f'{table}_change_{name}' in triggers:
+                    continue
+                body = body.format(table=table, columns=CHANGE_COLUMNS)
+                cursor.execute(f'CREATE TRIGGER {table}_change_{name} {body}')
+
+
+def drop_change_triggers(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for model, bodies in CHANGE_TRIGGERS.items():
+            table = model._meta.db_table
+            for name in bodies:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {table}_change_{name}')
+
+
+def head_token():
+    return Change.objects\
+        .order_by('-id')\
+        .values_list('id', flat=True)\
+        .first() or 0
+
+
+def is_expired(token):
+    """
+    Whether changes after `token` were already pruned from the log.
+    """
+    oldest = Change.objects\
+        .order_by('id')\
+        .values_list('id', flat=True)\
+        .first()
+    return oldest is not None and token + 1 < oldest
+
+
+def changes_since(token, comment_id=None, limit=None):
+    """
+    Latest change of every object changed after `token`, in log order.
+
+    Returns `{(kind, object_id): deleted}`, the token of the last change
+    read and whether more changes are waiting. Reads one range of the
+    log, so the cost follows the number of changes, not the thread size.
+    """
+    limit = limit or getattr(settings, 'SYNC_PAGE_SIZE', 500)
+    queryset = Change.objects.filter(id__gt=token)
+    if comment_id is not None:
+        queryset = queryset.filter(comment_id=comment_id)
+    rows = queryset\
+        .order_by('id')\
+        .values_list('id', 'kind', 'object_id', 'deleted')
+    rows = list(rows[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    latest = {}
+    for _, kind, object_id, deleted in rows:
+        latest.pop((kind, object_id), None)
+        latest[(kind, object_id)] = deleted
+    return latest, rows[-1][0] if rows else token, has_more
+
+
+def changed_objects(latest, comment_id=None):
+    """
+    Split `changes_since` into current comments, replies and tombstones.
+
+    An object that disappeared since its change was logged is reported
+    as deleted, as are soft deleted comments with their replies and a
+    reply that moved out of the synced thread.
+    """
+    wanted = {Change.COMMENT: [], Change.REPLY: []}
+    for (kind, object_id), deleted in latest.items():
+        if not deleted:
+            wanted[kind].append(object_id)
+    comments = Comment.objects.in_bulk(wanted[Change.COMMENT])
+    replies = Reply.objects.visible().in_bulk(wanted[Change.REPLY])
+    if comment_id is not None:
+        replies = {
+            pk: reply for pk, reply in replies.items()
+            if reply.comment_id == comment_id
+        }
+    found = {Change.COMMENT: comments, Change.REPLY: replies}
+    deleted = {Change.COMMENT: [], Change.REPLY: []}
+    for kind, object_id in latest:
+        if object_id not in found[kind]:
+            deleted[kind].append(object_id)
+    return (
+        [comments[pk] for pk in wanted[Change.COMMENT] if pk in comments],
+        [replies[pk] for pk in wanted[Change.REPLY] if pk in replies],
+        deleted,
+    )
+
+
+def prune_changes(before):
+    """
+    Delete changes logged before `before`, always keeping the latest one.
+
+    Tokens older than the oldest kept change then expire, see
+    `is_expired`.
+    """
+    last_id = Change.objects\
+        .filter(changed_at__lt=before, id__lt=head_token())\
+        .aggregate(last_id=Max('id'))['last_id']
+    if last_id is None:
+        return 0
+    deleted, _ = Change.objects.filter(id__lte=last_id).delete()
+    return deleted
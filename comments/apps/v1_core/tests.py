@@ -1,13 +1,62 @@
 import datetime
+import importlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
 
+from apps.v1_core.archive import archive_comments
+from apps.v1_core.archive import copy_to_archive
+from apps.v1_core.cache import CommentCache
+from apps.v1_core.cache import comment_cache
+from apps.v1_core.deletion import purge_deleted_comments
+from apps.v1_core.deletion import purge_worker
+from apps.v1_core.deletion import soft_delete_comment
+from apps.v1_core.importer import CommentImporter
+from apps.v1_core.likes import add_like
+from apps.v1_core.likes import like_buffer
+from apps.v1_core.metrics import request_metrics
+from apps.v1_core.mixins import VersionedUpdateMixin
+from apps.v1_core.models import ArchivedComment
+from apps.v1_core.models import ArchivedReply
+from apps.v1_core.models import Change
 from apps.v1_core.models import Comment
+from apps.v1_core.models import ImportCheckpoint
+from apps.v1_core.models import Like
 from apps.v1_core.models import Reply
+from apps.v1_core.ranking import current_hot_epoch
+from apps.v1_core.ranking import hot_fields
+from apps.v1_core.ranking import hot_rebaser
+from apps.v1_core.ranking import rebase_hot_scores
+from apps.v1_core.replicas import replica_pool
+from apps.v1_core.search import ensure_full_text_indexes
 from apps.v1_core.serializers import CommentSerializer
+from apps.v1_core.throttling import TokenBucketStore
+from apps.v1_core.throttling import TokenBuckets
+from apps.v1_core.throttling import token_buckets
+from apps.v1_core.views import ReplyAPIView
+from apps.v1_core.writes import run_write
+from apps.v1_core.writes import write_queue
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import OperationalError
+from django.db import connection
 from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework.test import APIRequestFactory
 from rest_framework.test import APITestCase
+from rest_framework.test import APITransactionTestCase
 # Create your tests here.
 
 User = get_user_model()
@@ -149,6 +198,11 @@ class DeleteCommentTestCase(APIViewBaseTest):
                 content=f'Reply number {i}', comment=comment_instance,
             )
         self.client.delete(f'/api/comment/{comment_instance.id}/')
+        self.assertEqual(Reply.objects.visible().count(), 0)
+        response = self.client.get('/api/reply/')
+        self.assertEqual(response.data, [])
+        # Replies are removed by the purge worker after the commit.
+        purge_deleted_comments()
         reply_counter = Reply.objects.count()
         self.assertEqual(reply_counter, 0)
 
@@ -184,7 +238,7 @@ class FetchCommentTestCase(APIViewBaseTest):
         )
         response = self.client.get('/api/comment/', follow=True)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), len(self.comments))
+        self.assertEqual(len(response.data['results']), len(self.comments))
 
     def test_get_all_comments_user_1(self):
         self.client.login(
@@ -195,7 +249,13 @@ class FetchCommentTestCase(APIViewBaseTest):
             '/api/comment/', {'search': 'other@test.com'}, follow=True,
         )
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_search_matches_part_of_the_username(self):
+        self.client.login(username='user@test.com', password='thisisapassword')
+        response = self.client.get('/api/comment/', {'search': 'other@'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 3)
 
     def test_get_all_comments_user_2(self):
         self.client.login(username='user@test.com', password='thisisapassword')
@@ -203,7 +263,7 @@ class FetchCommentTestCase(APIViewBaseTest):
             '/api/comment/', {'search': 'user@test.com'}, follow=True,
         )
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 4)
+        self.assertEqual(len(response.data['results']), 4)
 
     def test_get_latest_comments(self):
         self.client.login(username='user@test.com', password='thisisapassword')
@@ -221,11 +281,13 @@ class FetchCommentTestCase(APIViewBaseTest):
             '/api/comment/', params, follow=True,
         )
         serializer = CommentSerializer(
-            Comment.objects.all().order_by('-created_at'), many=True,
+            Comment.objects.all().order_by('-created_at', '-id'), many=True,
         )
         result_expected = JSONRenderer().render(serializer.data)
 
-        self.assertEqual(result_expected, response.content)
+        self.assertEqual(
+            result_expected, JSONRenderer().render(response.data['results']),
+        )
 
     def test_get_comments_from_specific_user(self):
         self.client.login(username='user@test.com', password='thisisapassword')
@@ -243,11 +305,13 @@ class FetchCommentTestCase(APIViewBaseTest):
             '/api/comment/', params, follow=True,
         )
         serializer = CommentSerializer(
-            Comment.objects.all().order_by('user'), many=True,
+            Comment.objects.all().order_by('user', 'id'), many=True,
         )
         result_expected = JSONRenderer().render(serializer.data)
 
-        self.assertEqual(result_expected, response.content)
+        self.assertEqual(
+            result_expected, JSONRenderer().render(response.data['results']),
+        )
 
     def test_get_older_comments(self):
         self.client.login(username='user@test.com', password='thisisapassword')
@@ -265,10 +329,821 @@ class FetchCommentTestCase(APIViewBaseTest):
             '/api/comment/', params, follow=True,
         )
         serializer = CommentSerializer(
-            Comment.objects.all().order_by('created_at'), many=True,
+            Comment.objects.all().order_by('created_at', 'id'), many=True,
+        )
+        result_expected = JSONRenderer().render(serializer.data)
+        self.assertEqual(
+            result_expected, JSONRenderer().render(response.data['results']),
+        )
+
+
+class CommentRepliesQueryCountTestCase(APIViewBaseTest):
+
+    def create_comments(self, number_of_comments):
+        for i in range(number_of_comments):
+            comment = Comment.objects.create(
+                content=f'this is a comment {i}', user=self.user,
+            )
+            for j in range(3):
+                Reply.objects.create(
+                    content=f'Reply number {j}', comment=comment,
+                )
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/comment/', follow=True)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_list_query_count_does_not_grow_with_comments(self):
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.create_comments(2)
+        few_comments = self.count_list_queries()
+        self.create_comments(30)
+        many_comments = self.count_list_queries()
+        self.assertEqual(few_comments, many_comments)
+        self.assertLessEqual(many_comments, 4)
+
+    def test_replies_are_grouped_by_comment(self):
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.create_comments(3)
+        response = self.client.get('/api/comment/', follow=True)
+        serializer = CommentSerializer(
+            Comment.objects.order_by('created_at', 'id'), many=True,
         )
         result_expected = JSONRenderer().render(serializer.data)
-        self.assertEqual(result_expected, response.content)
+        self.assertEqual(
+            result_expected, JSONRenderer().render(response.data['results']),
+        )
+        for comment in response.data['results']:
+            self.assertEqual(len(comment['replies']), 3)
+
+    def test_retrieve_query_count(self):
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.create_comments(1)
+        comment = Comment.objects.get()
+        with self.assertNumQueries(4):
+            self.client.get(f'/api/comment/{comment.id}/', follow=True)
+
+
+class CommentKeysetPaginationTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.other_user = User.objects.create_user(
+            username='other@test.com', password='thisisapassword',
+        )
+        for i in range(7):
+            Comment.objects.create(
+                content=f'this is a comment {i}',
+                user=self.user if i % 2 else self.other_user,
+            )
+        self.client.login(username='user@test.com', password='thisisapassword')
+
+    def walk_pages(self, params):
+        ids, response = [], self.client.get('/api/comment/', params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['content'] for item in response.data['results'])
+            if response.data['next'] is None:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_every_comment_once(self):
+        for ordering, order_by in (
+            ('created_at', ('created_at', 'id')),
+            ('-created_at', ('-created_at', '-id')),
+            ('user', ('user', 'id')),
+            ('-user', ('-user', '-id')),
+        ):
+            contents, _ = self.walk_pages(
+                {'ordering': ordering, 'page_size': 3},
+            )
+            expected = Comment.objects.order_by(*order_by)\
+                .values_list('content', flat=True)
+            self.assertEqual(contents, list(expected))
+
+    def test_previous_link_returns_previous_page(self):
+        first = self.client.get('/api/comment/', {'page_size': 3})
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        previous = self.client.get(second.data['previous'])
+        self.assertEqual(previous.data['results'], first.data['results'])
+
+    def test_search_is_applied_before_paging(self):
+        contents, _ = self.walk_pages(
+            {'search': 'other@test.com', 'page_size': 2},
+        )
+        self.assertEqual(len(contents), 4)
+
+    def test_page_query_count_is_constant(self):
+        first = self.client.get('/api/comment/', {'page_size': 2})
+        with CaptureQueriesContext(connection) as first_page:
+            self.client.get('/api/comment/', {'page_size': 2})
+        with CaptureQueriesContext(connection) as later_page:
+            self.client.get(first.data['next'])
+        self.assertEqual(
+            len(first_page.captured_queries),
+            len(later_page.captured_queries),
+        )
+        for query in later_page.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/comment/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_unknown_ordering_is_ignored(self):
+        response = self.client.get('/api/comment/', {'ordering': 'user__password'})  # NOQA
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 7)
+
+
+class FullTextSearchTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.pizza = Comment.objects.create(
+            content='pizza is great, pizza every day', user=self.user,
+        )
+        self.pasta = Comment.objects.create(
+            content='pasta is great too, but pizza wins', user=self.user,
+        )
+        Comment.objects.create(content='nothing to see here', user=self.user)
+
+    def search(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_prefix_matching(self):
+        data = self.search('/api/comment/', search='piz')
+        self.assertEqual(len(data['results']), 2)
+        data = self.search('/api/comment/', search='pas gre')
+        self.assertEqual(
+            [item['content'] for item in data['results']],
+            [self.pasta.content],
+        )
+
+    def test_relevance_ranking(self):
+        data = self.search('/api/comment/', search='pizza', ordering='rank')
+        self.assertEqual(
+            [item['content'] for item in data['results']],
+            [self.pizza.content, self.pasta.content],
+        )
+
+    def test_index_follows_updates_and_deletes(self):
+        self.pasta.content = 'lasagna only'
+        self.pasta.save()
+        self.pizza.delete()
+        self.assertEqual(
+            len(self.search('/api/comment/', search='pizza')['results']), 0,
+        )
+        data = self.search('/api/comment/', search='lasag')
+        self.assertEqual(len(data['results']), 1)
+
+    def test_reply_search(self):
+        Reply.objects.create(content='pineapple belongs', comment=self.pizza)
+        Reply.objects.create(content='it does not', comment=self.pizza)
+        data = self.search('/api/reply/', search='pineap')
+        self.assertEqual(len(data), 1)
+
+    def test_missing_triggers_are_recreated(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER v1_core_comment_fts_ai')
+        Comment.objects.create(content='risotto tonight', user=self.user)
+        ensure_full_text_indexes(connection)
+        data = self.search('/api/comment/', search='risot')
+        self.assertEqual(len(data['results']), 1)
+
+    def test_search_uses_full_text_index(self):
+        with CaptureQueriesContext(connection) as context:
+            self.search('/api/comment/', search='pizza')
+        sql = context.captured_queries[-2]['sql']
+        self.assertIn('v1_core_comment_fts', sql)
+        # Only the username keeps its substring match on the users table.
+        self.assertNotIn('"content" LIKE', sql)
+        self.assertIn('"username" LIKE', sql)
+
+
+@override_settings(COMMENT_CACHE_ENABLED=True)
+class CommentCacheTestCase(APITransactionTestCase):
+
+    def setUp(self):
+        comment_cache.local.clear()
+        self.user = User.objects.create_user(
+            username='user@test.com', password='thisisapassword',
+        )
+        self.comment = Comment.objects.create(
+            content='this is a comment', user=self.user,
+        )
+        self.url = f'/api/comment/{self.comment.id}/'
+        self.client.login(username='user@test.com', password='thisisapassword')
+
+    def count_reply_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len([
+            query for query in context.captured_queries
+            if 'v1_core_reply' in query['sql']
+        ])
+
+    def test_detail_and_list_are_served_from_cache(self):
+        self.assertEqual(self.count_reply_queries(self.url), 1)
+        self.assertEqual(self.count_reply_queries(self.url), 0)
+        self.assertEqual(self.count_reply_queries('/api/comment/'), 1)
+        self.assertEqual(self.count_reply_queries('/api/comment/'), 0)
+
+    def test_hits_read_no_rows(self):
+        for url in (self.url, '/api/comment/'):
+            response = self.client.get(url)
+            with CaptureQueriesContext(connection) as context:
+                cached = self.client.get(url)
+            self.assertEqual(cached.data, response.data)
+            self.assertEqual(cached['ETag'], response['ETag'])
+            self.assertFalse([
+                query for query in context.captured_queries
+                if 'v1_core_' in query['sql']
+            ])
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'],
+                )
+            self.assertEqual(response.status_code, 304)
+            self.assertFalse([
+                query for query in context.captured_queries
+                if 'v1_core_' in query['sql']
+            ])
+
+    def test_archiving_drops_cached_details(self):
+        self.client.get(self.url)
+        archive_comments(timezone.now() + datetime.timedelta(days=1))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_detail_is_cached_per_representation(self):
+        Reply.objects.create(content='cached reply', comment=self.comment)
+        response = self.client.get(f'{self.url}?replies=none')
+        self.assertNotIn('replies', response.data)
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data['replies']), 1)
+
+    def test_update_invalidates_detail(self):
+        self.client.get(self.url)
+        self.client.patch(self.url, {'content': 'updated comment'})
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['content'], 'updated comment')
+
+    def test_like_invalidates_detail(self):
+        self.client.get(self.url)
+        self.client.patch(f'{self.url}like/')
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['likes_comments'], 1)
+
+    def test_like_only_invalidates_pages_showing_the_comment(self):
+        other = Comment.objects.create(content='other', user=self.user)
+        page = '/api/comment/?page_size=1'
+        self.assertEqual(self.count_reply_queries(page), 1)
+        self.client.patch(f'/api/comment/{other.id}/like/')
+        self.assertEqual(self.count_reply_queries(page), 0)
+        self.client.patch(f'{self.url}like/')
+        self.assertEqual(self.count_reply_queries(page), 1)
+        response = self.client.get(page)
+        self.assertEqual(response.data['results'][0]['likes_comments'], 1)
+
+    def test_like_invalidates_hot_pages(self):
+        other = Comment.objects.create(content='other', user=self.user)
+        page = '/api/comment/?page_size=1&ordering=hot'
+        self.assertEqual(self.count_reply_queries(page), 1)
+        self.client.patch(f'/api/comment/{other.id}/like/')
+        self.assertEqual(self.count_reply_queries(page), 1)
+
+    def test_reply_changes_invalidate_detail(self):
+        self.client.get(self.url)
+        self.client.post(
+            '/api/reply/', {'content': 'a reply', 'comment': self.comment.id},
+        )
+        self.assertEqual(len(self.client.get(self.url).data['replies']), 1)
+        reply = Reply.objects.get()
+        self.client.delete(f'/api/reply/{reply.id}/')
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['replies'], [])
+
+    def test_create_and_destroy_invalidate_list(self):
+        self.client.get('/api/comment/')
+        self.client.post('/api/comment/', {'content': 'another comment'})
+        response = self.client.get('/api/comment/')
+        self.assertEqual(len(response.data['results']), 2)
+        self.client.delete(self.url)
+        purge_worker.join()
+        response = self.client.get('/api/comment/')
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_concurrent_misses_fetch_once(self):
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'content': 'fetched'}
+
+        def read():
+            barrier.wait()
+            results.append(comment_cache.get_or_set('hot-key', fetch))
+
+        results = []
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'content': 'fetched'}] * 8)
+
+    @override_settings(
+        COMMENT_CACHE_BACKEND='default',
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }},
+    )
+    def test_shared_backend_invalidates_every_process(self):
+        other_process = CommentCache()
+        key = other_process.detail_key(self.comment.id)
+        other_process.set(key, {'content': 'stale'})
+        self.client.patch(self.url, {'content': 'updated comment'})
+        self.assertNotEqual(other_process.detail_key(self.comment.id), key)
+
+
+class ConditionalGetTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.comment = Comment.objects.create(
+            content='this is a comment', user=self.user,
+        )
+        self.reply = Reply.objects.create(
+            content='this is a reply', comment=self.comment,
+        )
+        self.url = f'/api/comment/{self.comment.id}/'
+
+    def assertNotModified(self, url, **headers):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+        for query in context.captured_queries:
+            self.assertNotIn('v1_core_reply"', query['sql'])
+        return response
+
+    def test_detail_validators(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        not_modified = self.assertNotModified(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertNotModified(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+
+    def test_thread_changes_change_the_etag(self):
+        etags = {self.client.get(self.url)['ETag']}
+        self.client.patch(f'{self.url}like/')
+        etags.add(self.client.get(self.url)['ETag'])
+        self.client.patch(f'/api/reply/{self.reply.id}/like/')
+        etags.add(self.client.get(self.url)['ETag'])
+        self.client.patch(
+            f'/api/reply/{self.reply.id}/', {'content': 'edited reply'},
+        )
+        etags.add(self.client.get(self.url)['ETag'])
+        self.client.delete(f'/api/reply/{self.reply.id}/')
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=', '.join(etags),
+        )
+        self.assertEqual(response.status_code, 200)
+        etags.add(response['ETag'])
+        self.assertEqual(len(etags), 5)
+
+    def test_list_validators(self):
+        response = self.client.get('/api/comment/')
+        self.assertNotModified(
+            '/api/comment/', HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        Comment.objects.create(content='another comment', user=self.user)
+        response = self.client.get(
+            '/api/comment/', HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_reply_validators(self):
+        url = f'/api/reply/{self.reply.id}/'
+        response = self.client.get(url)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            .status_code, 304,
+        )
+        self.client.patch(f'{url}like/')
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            .status_code, 200,
+        )
+
+
+class VersionedUpdateTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.comment = Comment.objects.create(content='first', user=self.user)
+        self.reply = Reply.objects.create(
+            content='first', comment=self.comment,
+        )
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_edit_is_one_conditional_update(self):
+        url = f'/api/comment/{self.comment.id}/'
+        etag = self.etag(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                url, {'content': 'second'}, HTTP_IF_MATCH=etag,
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['version'], 1)
+        updates = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('UPDATE "v1_core_comment"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"v1_core_comment"."version" = 0', updates[0])
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.content, 'second')
+        self.assertEqual(self.comment.version, 1)
+        self.assertEqual(self.comment.thread_version, 1)
+
+    def test_etag_of_a_read_or_an_edit_is_the_if_match(self):
+        url = f'/api/comment/{self.comment.id}/'
+        etag = self.etag(url)
+        # Replies added since the read do not fail the edit.
+        self.client.post('/api/reply/', {
+            'content': 'meanwhile', 'comment': self.comment.id,
+        })
+        response = self.client.patch(
+            url, {'content': 'second'}, HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], self.etag(url))
+        response = self.client.patch(
+            url, {'content': 'third'}, HTTP_IF_MATCH=response['ETag'],
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_if_match_is_rejected(self):
+        url = f'/api/comment/{self.comment.id}/'
+        stale = self.etag(url)
+        self.client.patch(url, {'content': 'second'})
+        response = self.client.patch(
+            url, {'content': 'lost'}, HTTP_IF_MATCH=stale,
+        )
+        self.assertEqual(response.status_code, 412)
+        response = self.client.patch(
+            url, {'content': 'lost'}, HTTP_IF_MATCH='"1"',
+        )
+        self.assertEqual(response.status_code, 412)
+        response = self.client.patch(
+            url, {'content': 'third'},
+            HTTP_IF_MATCH=f'{stale}, {self.etag(url)}',
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(
+            url, {'content': 'fourth'}, HTTP_IF_MATCH='*',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Comment.objects.get().content, 'fourth')
+
+    def test_concurrent_edit_is_not_overwritten(self):
+        def edit_meanwhile(request, instance):
+            type(instance).objects\
+                .filter(pk=instance.pk)\
+                .update(content='meanwhile', version=5)
+        with mock.patch(
+            'apps.v1_core.mixins.check_if_match', edit_meanwhile,
+        ):
+            for url in (
+                f'/api/comment/{self.comment.id}/',
+                f'/api/reply/{self.reply.id}/',
+            ):
+                response = self.client.patch(url, {'content': 'lost'})
+                self.assertEqual(response.status_code, 412)
+        self.assertEqual(Comment.objects.get().content, 'meanwhile')
+        self.assertEqual(Reply.objects.get().content, 'meanwhile')
+
+    def test_default_validators_follow_the_version(self):
+        request = APIRequestFactory().get('/')
+        request.accepted_renderer = JSONRenderer()
+        mixin = VersionedUpdateMixin()
+        etag, last_modified = mixin.get_validators(request, self.reply)
+        self.assertTrue(etag.startswith('"0-'))
+        self.assertEqual(
+            last_modified, int(self.reply.created_at.timestamp()),
+        )
+        self.reply.version = 1
+        self.assertNotEqual(mixin.get_validators(request, self.reply)[0], etag)
+
+    def test_reply_edit(self):
+        url = f'/api/reply/{self.reply.id}/'
+        response = self.client.get(url)
+        self.assertEqual(response.data['version'], 0)
+        stale = response['ETag']
+        response = self.client.patch(
+            url, {'content': 'second'}, HTTP_IF_MATCH=stale,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['version'], 1)
+        self.assertEqual(response['ETag'], self.etag(url))
+        response = self.client.put(
+            url, {'content': 'lost', 'comment': self.comment.id},
+            HTTP_IF_MATCH=stale,
+        )
+        self.assertEqual(response.status_code, 412)
+        self.reply.refresh_from_db()
+        self.assertEqual(self.reply.content, 'second')
+        self.assertEqual(self.reply.version, 1)
+        self.assertIsNotNone(self.reply.updated_at)
+
+
+class BulkCreateTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.comment = Comment.objects.create(
+            content='this is a comment', user=self.user,
+        )
+
+    def test_bulk_create_comments_in_constant_queries(self):
+        items = [{'content': f'bulk comment {i}'} for i in range(200)]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                '/api/comment/bulk/?batch_size=50', items, format='json',
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'created': 200})
+        self.assertEqual(Comment.objects.filter(user=self.user).count(), 201)
+        self.assertLessEqual(len(context.captured_queries), 12)
+
+    def test_bulk_create_replies(self):
+        other = Comment.objects.create(content='other', user=self.user)
+        items = [
+            {'content': f'bulk reply {i}', 'comment': comment.id}
+            for i, comment in enumerate([self.comment, other] * 50)
+        ]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                '/api/reply/bulk/', items, format='json',
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Reply.objects.filter(comment=other).count(), 50)
+        self.assertLessEqual(len(context.captured_queries), 10)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.thread_version, 1)
+
+    def test_bulk_create_reports_errors_per_item(self):
+        items = [
+            {'content': 'valid reply', 'comment': self.comment.id},
+            {'content': '', 'comment': self.comment.id},
+            {'content': 'missing comment', 'comment': 999},
+        ]
+        response = self.client.post('/api/reply/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [error['index'] for error in response.data['errors']], [1, 2],
+        )
+        self.assertIn('content', response.data['errors'][0]['errors'])
+        self.assertIn('comment', response.data['errors'][1]['errors'])
+        self.assertFalse(Reply.objects.exists())
+
+    def test_bulk_create_expects_a_list(self):
+        response = self.client.post(
+            '/api/comment/bulk/', {'content': 'not a list'}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.comments = [
+            Comment.objects.create(content=f'comment {i}', user=self.user)
+            for i in range(5)
+        ]
+        for comment in self.comments[1::2]:
+            for i in range(3):
+                Reply.objects.create(content=f'reply {i}', comment=comment)
+
+    def read_lines(self, content):
+        return [json.loads(line) for line in content.splitlines()]
+
+    def assert_threads(self, threads):
+        self.assertEqual(
+            [thread['id'] for thread in threads],
+            [comment.id for comment in self.comments],
+        )
+        for thread, comment in zip(threads, self.comments):
+            reply_ids = comment.replies\
+                .order_by('id')\
+                .values_list('id', flat=True)
+            self.assertEqual(
+                [reply['id'] for reply in thread['replies']], list(reply_ids),
+            )
+
+    def test_export_command_merges_replies_in_two_queries(self):
+        output = io.StringIO()
+        with CaptureQueriesContext(connection) as context:
+            call_command('export_comments', chunk_size=2, stdout=output)
+        self.assertEqual(len(context.captured_queries), 2)
+        threads = self.read_lines(output.getvalue())
+        self.assert_threads(threads)
+        self.assertEqual(threads[1]['replies'][0]['content'], 'reply 0')
+
+    def test_export_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'comments.ndjson')
+            call_command('export_comments', output=path)
+            with open(path, encoding='utf-8') as export:
+                self.assert_threads(self.read_lines(export.read()))
+
+    def test_export_endpoint_streams_ndjson(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        response = self.client.get('/api/comment/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assert_threads(self.read_lines(content))
+
+    def test_export_endpoint_requires_staff(self):
+        self.client.login(username='user@test.com', password='thisisapassword')
+        response = self.client.get('/api/comment/export/')
+        self.assertEqual(response.status_code, 403)
+
+
+class ImportTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='user@test.com', password='thisisapassword',
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8', newline='') as output:
+            output.write(content)
+        return path
+
+    def threads(self, count):
+        return [
+            {
+                'id': 1000 + i,
+                'content': f'comment {i}',
+                'username': 'user@test.com',
+                'likes_comments': i,
+                'created_at': f'2019-01-{i + 1:02d}T10:00:00Z',
+                'replies': [
+                    {'id': 5000 + i * 10 + j, 'content': f'reply {i}.{j}'}
+                    for j in range(i % 3)
+                ],
+            }
+            for i in range(count)
+        ]
+
+    def write_ndjson(self, threads):
+        return self.write('comments.ndjson', ''.join(
+            json.dumps(thread) + '\n' for thread in threads
+        ))
+
+    def assert_imported(self, threads):
+        comments = Comment.objects.order_by('id')
+        self.assertEqual(
+            [comment.content for comment in comments],
+            [thread['content'] for thread in threads],
+        )
+        for comment, thread in zip(comments, threads):
+            self.assertEqual(comment.user, self.user)
+            self.assertEqual(comment.reply_count, len(thread['replies']))
+            self.assertEqual(comment.likes_comments, thread['likes_comments'])
+            self.assertEqual(
+                comment.created_at.isoformat(),
+                thread['created_at'].replace('Z', '+00:00'),
+            )
+            self.assertEqual(
+                list(comment.replies.order_by('id').values_list(
+                    'content', flat=True,
+                )),
+                [reply['content'] for reply in thread['replies']],
+            )
+
+    def test_import_ndjson_remaps_replies(self):
+        threads = self.threads(10)
+        path = self.write_ndjson(threads)
+        output = io.StringIO()
+        with CaptureQueriesContext(connection) as context:
+            call_command(
+                'import_comments', path, chunk_size=4, stdout=output,
+            )
+        self.assert_imported(threads)
+        self.assertIn('10 records, 10 comments, 9 replies', output.getvalue())
+        self.assertIn('rows/s', output.getvalue())
+        # A user lookup on the first chunk, then per chunk: savepoint,
+        # comment insert, id lookup, created_at update, reply insert,
+        # reply id lookup and created_at update when timestamps are set.
+        self.assertLessEqual(len(context.captured_queries), 3 * 8 + 1)
+
+    def test_import_csv_with_user_ids(self):
+        threads = self.threads(3)
+        rows = ['content,user,likes_comments,created_at,replies']
+        for thread in threads:
+            replies = json.dumps(thread['replies']).replace('"', '""')
+            rows.append(
+                f'{thread["content"]},{self.user.id},'
+                f'{thread["likes_comments"]},{thread["created_at"]},'
+                f'"{replies}"',
+            )
+        path = self.write('comments.csv', '\n'.join(rows) + '\n')
+        call_command('import_comments', path, stdout=io.StringIO())
+        self.assert_imported(threads)
+
+    def test_import_skips_invalid_records(self):
+        threads = self.threads(3)
+        lines = [json.dumps(thread) for thread in threads]
+        lines.insert(1, '{"content": ""}')
+        lines.append(json.dumps(dict(threads[0], username='nobody')))
+        path = self.write('comments.ndjson', '\n'.join(lines))
+        stderr = io.StringIO()
+        call_command(
+            'import_comments', path, stdout=io.StringIO(), stderr=stderr,
+        )
+        self.assert_imported(threads)
+        self.assertIn(':2: content is required', stderr.getvalue())
+
+    def test_import_resumes_from_checkpoint(self):
+        threads = self.threads(6)
+        path = self.write_ndjson(threads)
+        ImportCheckpoint.objects.create(
+            name='nightly', path=os.path.abspath(path), records=4,
+        )
+        call_command(
+            'import_comments', path, checkpoint='nightly', chunk_size=1,
+            stdout=io.StringIO(),
+        )
+        self.assert_imported(threads[4:])
+        self.assertEqual(ImportCheckpoint.objects.get().records, 6)
+
+    def test_checkpoint_commits_with_its_chunk(self):
+        threads = self.threads(4)
+        path = self.write_ndjson(threads)
+        import_chunk = CommentImporter.import_chunk
+
+        def crash_after_commit(importer, chunk, checkpoint=None):
+            import_chunk(importer, chunk, checkpoint)
+            raise RuntimeError('crashed')
+        with mock.patch.object(
+            CommentImporter, 'import_chunk', crash_after_commit,
+        ):
+            with self.assertRaises(RuntimeError):
+                call_command(
+                    'import_comments', path, checkpoint='nightly',
+                    chunk_size=2, stdout=io.StringIO(),
+                )
+        self.assertEqual(ImportCheckpoint.objects.get().records, 2)
+        self.assertEqual(Comment.objects.count(), 2)
+        call_command(
+            'import_comments', path, checkpoint='nightly', chunk_size=2,
+            stdout=io.StringIO(),
+        )
+        self.assert_imported(threads)
+
+    def test_import_parses_in_worker_processes(self):
+        threads = self.threads(8)
+        path = self.write_ndjson(threads)
+        call_command(
+            'import_comments', path, workers=2, chunk_size=3,
+            stdout=io.StringIO(),
+        )
+        self.assert_imported(threads)
 
 
 class ReplyAPITestCase(APIViewBaseTest):
@@ -348,25 +1223,1412 @@ class ReplyAPITestCase(APIViewBaseTest):
         )
         counter_before_request = Reply.objects.count()
         response = self.client.delete(
-            f'/api/comment/{reply.id}/', follow=True,
+            f'/api/reply/{reply.id}/', follow=True,
         )
         counter_after_request = Reply.objects.count()
         self.assertEqual(response.status_code, 200)
         self.assertEqual(counter_after_request, (counter_before_request - 1))
 
 
-class TestLikeUpdateView(APITestCase):
+class ReplyCountTestCase(APIViewBaseTest):
+
     def setUp(self):
-        self.user = User.objects.create_user(
-            username='like@test.com', password='thisisapassword',
-        )
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
         self.comment = Comment.objects.create(
-            content='this awesome comment',
-            user=self.user,
+            content='this is a comment', user=self.user,
         )
-        self.reply_data = {
-            'content': 'this is a reply to the comment',
-            'comment': self.comment,
+        self.other = Comment.objects.create(
+            content='this is another comment', user=self.user,
+        )
+
+    def post_reply(self, comment, content='this is a reply'):
+        response = self.client.post(
+            '/api/reply/', {'content': content, 'comment': comment.id},
+        )
+        self.assertEqual(response.status_code, 201)
+        return Reply.objects.latest('id')
+
+    def test_reply_create_and_delete_update_counts(self):
+        self.post_reply(self.comment)
+        reply = self.post_reply(self.comment)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.reply_count, 2)
+        self.assertEqual(self.comment.last_reply_at, reply.created_at)
+        self.client.delete(f'/api/reply/{reply.id}/')
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.reply_count, 1)
+        self.assertLess(self.comment.last_reply_at, reply.created_at)
+
+    def test_moving_a_reply_updates_both_comments(self):
+        reply = self.post_reply(self.comment)
+        response = self.client.patch(
+            f'/api/reply/{reply.id}/',
+            {'content': 'moved', 'comment': self.other.id},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.comment.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.comment.reply_count, 0)
+        self.assertIsNone(self.comment.last_reply_at)
+        self.assertEqual(self.other.reply_count, 1)
+
+    def test_bulk_replies_are_counted_per_comment(self):
+        items = [
+            {'content': 'bulk reply', 'comment': comment.id}
+            for comment in [self.comment, self.comment, self.other]
+        ]
+        response = self.client.post('/api/reply/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            dict(Comment.objects.values_list('id', 'reply_count')),
+            {self.comment.id: 2, self.other.id: 1},
+        )
+
+    def test_list_shows_counts_without_reading_replies(self):
+        self.post_reply(self.comment)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/comment/?replies=none')
+        results = {
+            comment['content']: comment for comment in response.data['results']
+        }
+        self.assertEqual(results['this is a comment']['reply_count'], 1)
+        self.assertNotIn('replies', results['this is a comment'])
+        self.assertFalse(any(
+            'v1_core_reply' in query['sql']
+            for query in context.captured_queries
+        ))
+
+    def test_reconcile_fixes_drift(self):
+        Reply.objects.create(content='unseen reply', comment=self.comment)
+        self.post_reply(self.other)
+        Comment.objects.filter(pk=self.other.id).update(reply_count=7)
+        output = io.StringIO()
+        call_command('reconcile_reply_counts', chunk_size=1, stdout=output)
+        self.assertIn('2 comments checked, 2 fixed', output.getvalue())
+        self.comment.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.comment.reply_count, 1)
+        self.assertIsNotNone(self.comment.last_reply_at)
+        self.assertEqual(self.other.reply_count, 1)
+
+
+class ReplyThreadTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.comment = Comment.objects.create(
+            content='this is a comment', user=self.user,
+        )
+        # a
+        # +- a1
+        # |  +- a1x
+        # +- a2
+        # +- a3
+        # b
+        self.a = self.post_reply('a')
+        self.a1 = self.post_reply('a1', self.a)
+        self.a1x = self.post_reply('a1x', self.a1)
+        self.a2 = self.post_reply('a2', self.a)
+        self.b = self.post_reply('b')
+        self.a3 = self.post_reply('a3', self.a)
+
+    def post_reply(self, content, parent=None):
+        data = {'content': content, 'comment': self.comment.id}
+        if parent is not None:
+            data['parent'] = parent
+        response = self.client.post('/api/reply/', data)
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def thread(self, **params):
+        response = self.client.get('/api/reply/thread/', params)
+        self.assertEqual(response.status_code, 200)
+        return [reply['content'] for reply in response.data['results']]
+
+    def test_replies_are_nested(self):
+        response = self.client.get(f'/api/reply/{self.a1x}/')
+        self.assertEqual(response.data['parent'], self.a1)
+        self.assertEqual(response.data['depth'], 2)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.reply_count, 6)
+
+    def test_thread_is_depth_first(self):
+        self.assertEqual(
+            self.thread(comment=self.comment.id),
+            ['a', 'a1', 'a1x', 'a2', 'a3', 'b'],
+        )
+
+    def test_thread_limits_depth_and_children(self):
+        comment = self.comment.id
+        self.assertEqual(self.thread(comment=comment, depth=1), ['a', 'b'])
+        self.assertEqual(
+            self.thread(comment=comment, children=1), ['a', 'a1', 'a1x'],
+        )
+        self.assertEqual(
+            self.thread(comment=comment, depth=2, children=2),
+            ['a', 'a1', 'a2', 'b'],
+        )
+
+    def test_children_limit_skips_deleted_siblings(self):
+        self.client.delete(f'/api/reply/{self.a1}/')
+        self.assertEqual(
+            self.thread(comment=self.comment.id, children=2),
+            ['a', 'a2', 'a3', 'b'],
+        )
+        self.assertEqual(
+            self.thread(root=self.a, children=1), ['a2'],
+        )
+
+    def test_new_reply_follows_siblings_after_deletes(self):
+        self.client.delete(f'/api/reply/{self.a1}/')
+        self.client.delete(f'/api/reply/{self.a2}/')
+        self.post_reply('a4', self.a)
+        self.assertEqual(self.thread(root=self.a), ['a3', 'a4'])
+        self.assertEqual(self.thread(root=self.a, children=1), ['a3'])
+
+    def test_subtree_is_one_range_query(self):
+        with CaptureQueriesContext(connection) as context:
+            replies = self.thread(root=self.a, depth=1, children=2)
+        self.assertEqual(replies, ['a1', 'a2'])
+        self.assertEqual(
+            len([
+                query for query in context.captured_queries
+                if 'v1_core_reply' in query['sql']
+            ]),
+            2,
+        )
+
+    def test_thread_is_paginated(self):
+        response = self.client.get(
+            '/api/reply/thread/', {'comment': self.comment.id, 'page_size': 4},
+        )
+        contents = [reply['content'] for reply in response.data['results']]
+        response = self.client.get(response.data['next'])
+        contents += [reply['content'] for reply in response.data['results']]
+        self.assertEqual(contents, ['a', 'a1', 'a1x', 'a2', 'a3', 'b'])
+        self.assertIsNone(response.data['next'])
+
+    def test_thread_requires_comment_or_root(self):
+        response = self.client.get('/api/reply/thread/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_parent_must_reply_to_the_same_comment(self):
+        other = Comment.objects.create(content='other', user=self.user)
+        response = self.client.post(
+            '/api/reply/',
+            {'content': 'wrong', 'comment': other.id, 'parent': self.a},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.data)
+
+    def test_parent_cannot_change(self):
+        response = self.client.patch(
+            f'/api/reply/{self.a2}/', {'content': 'a2', 'parent': self.b},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(REPLY_MAX_DEPTH=3)
+    def test_replies_nest_at_most_max_depth(self):
+        response = self.client.post('/api/reply/', {
+            'content': 'too deep', 'comment': self.comment.id,
+            'parent': self.a1x,
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_deleting_a_reply_deletes_its_subtree(self):
+        response = self.client.delete(f'/api/reply/{self.a}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.thread(comment=self.comment.id), ['b'])
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.reply_count, 1)
+
+    def test_export_and_import_keep_nesting(self):
+        output = io.StringIO()
+        call_command('export_comments', stdout=output)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'comments.ndjson')
+            with open(path, 'w', encoding='utf-8') as export:
+                export.write(output.getvalue())
+            call_command('import_comments', path, stdout=io.StringIO())
+        imported = Comment.objects.latest('id')
+        self.assertNotEqual(imported.id, self.comment.id)
+        self.assertEqual(
+            [
+                (reply.content, reply.depth)
+                for reply in Reply.objects.thread(imported.id)
+            ],
+            [
+                ('a', 0), ('a1', 1), ('a1x', 2), ('a2', 1), ('a3', 1),
+                ('b', 0),
+            ],
+        )
+
+
+class CommentTargetTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        for i in range(5):
+            Comment.objects.create(
+                content=f'article comment {i}', user=self.user,
+                target_type='article', target_id='42',
+            )
+        Comment.objects.create(
+            content='video comment', user=self.user,
+            target_type='video', target_id='42',
+        )
+        Comment.objects.create(content='untargeted comment', user=self.user)
+
+    def test_create_comment_with_target(self):
+        response = self.client.post('/api/comment/', {
+            'content': 'new comment', 'target_type': 'video',
+            'target_id': 'abc',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            Comment.objects.for_target('video', 'abc').count(), 1,
+        )
+
+    def test_target_needs_type_and_id(self):
+        response = self.client.post('/api/comment/', {
+            'content': 'new comment', 'target_type': 'video',
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_target_thread_is_keyset_paginated(self):
+        url = '/api/comment/target/article/42/?page_size=3'
+        response = self.client.get(url)
+        contents = [comment['content'] for comment in response.data['results']]
+        response = self.client.get(response.data['next'])
+        contents += [
+            comment['content'] for comment in response.data['results']
+        ]
+        self.assertEqual(
+            contents, [f'article comment {i}' for i in range(5)],
+        )
+        self.assertIsNone(response.data['next'])
+
+    def test_target_thread_uses_target_index(self):
+        queryset = Comment.objects\
+            .for_target('article', '42')\
+            .order_by('created_at', 'id')
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('comment_target_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_counts_for_many_targets_in_one_query(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/comment/counts/', {
+                'target_type': 'article', 'target_id': ['42', '43'],
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'target_type': 'article', 'counts': {'42': 5, '43': 0},
+        })
+        self.assertEqual(
+            len([
+                query for query in context.captured_queries
+                if 'v1_core_comment' in query['sql']
+            ]),
+            1,
+        )
+
+    @override_settings(TARGET_COUNTS_MAX_TARGETS=2)
+    def test_counts_are_limited_per_request(self):
+        response = self.client.get('/api/comment/counts/', {
+            'target_type': 'article', 'target_id': ['1', '2', '3'],
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class HotRankingTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.comments = [
+            Comment.objects.create(content=f'comment {i}', user=self.user)
+            for i in range(4)
+        ]
+        self.likers = [
+            User.objects.create_user(
+                username=f'liker{i}@test.com', password='thisisapassword',
+            )
+            for i in range(3)
+        ]
+
+    def hot(self, **params):
+        params['ordering'] = 'hot'
+        response = self.client.get('/api/comment/', params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def contents(self, response):
+        return [comment['content'] for comment in response.data['results']]
+
+    def test_newer_comments_rank_higher(self):
+        self.assertEqual(
+            self.contents(self.hot()),
+            ['comment 3', 'comment 2', 'comment 1', 'comment 0'],
+        )
+        now = timezone.now()
+        older = hot_fields(1, now - datetime.timedelta(hours=12), now)
+        self.assertAlmostEqual(
+            older['hot_score'] * 2, hot_fields(1, now, now)['hot_score'],
+        )
+
+    def test_likes_and_replies_raise_the_score(self):
+        for liker in self.likers:
+            add_like(liker, 'comment', self.comments[0].id)
+        response = self.client.post('/api/reply/', {
+            'content': 'reply', 'comment': self.comments[1].id,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            self.contents(self.hot()),
+            ['comment 0', 'comment 1', 'comment 3', 'comment 2'],
+        )
+
+    @override_settings(LIKE_BUFFER_ENABLED=True)
+    def test_buffered_likes_raise_the_score(self):
+        before = self.comments[0].hot_score
+        for liker in self.likers:
+            add_like(liker, 'comment', self.comments[0].id)
+        like_buffer.flush()
+        self.comments[0].refresh_from_db()
+        self.assertAlmostEqual(
+            self.comments[0].hot_score, before * 4, places=3,
+        )
+
+    def test_hot_ordering_is_keyset_paginated(self):
+        add_like(self.likers[0], 'comment', self.comments[1].id)
+        response = self.hot(page_size=3)
+        contents = self.contents(response)
+        response = self.client.get(response.data['next'])
+        contents += self.contents(response)
+        self.assertEqual(
+            contents, ['comment 1', 'comment 3', 'comment 2', 'comment 0'],
+        )
+
+    def test_top_comments_are_read_from_the_index(self):
+        queryset = Comment.objects.order_by('-hot_score', '-id')[:10]
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('comment_hot_id_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_rebase_moves_older_epochs_to_the_current_one(self):
+        epoch = current_hot_epoch()
+        old = self.comments[0]
+        Comment.objects.filter(pk=old.pk).update(
+            hot_epoch=epoch - 2, hot_score=8.0,
+        )
+        output = io.StringIO()
+        call_command('rebase_hot_scores', stdout=output)
+        self.assertIn('1 comments rebased', output.getvalue())
+        old.refresh_from_db()
+        self.assertEqual(old.hot_epoch, epoch)
+        # Two 3 hour epochs are half of the 12 hour half life.
+        self.assertAlmostEqual(old.hot_score, 8.0 / 2 ** 0.5, places=6)
+
+    def test_rebase_drops_very_old_epochs_to_zero(self):
+        Comment.objects.filter(pk=self.comments[0].pk).update(
+            hot_epoch=0, hot_score=8.0,
+        )
+        rebase_hot_scores(Comment.objects.all())
+        old = Comment.objects.get(pk=self.comments[0].pk)
+        self.assertEqual(old.hot_epoch, current_hot_epoch())
+        self.assertEqual(old.hot_score, 0.0)
+
+    def test_likes_count_on_comments_of_any_epoch(self):
+        epoch = current_hot_epoch()
+        old = self.comments[0]
+        Comment.objects.filter(pk=old.pk).update(
+            hot_epoch=epoch - 20, hot_score=8.0,
+        )
+        add_like(self.likers[0], 'comment', old.id)
+        old.refresh_from_db()
+        self.assertEqual(old.hot_epoch, epoch)
+        # Twenty epochs are five half lives.
+        self.assertAlmostEqual(
+            old.hot_score, 8.0 / 2 ** 5 + hot_fields(1)['hot_score'],
+            places=3,
+        )
+
+    def test_hot_ordering_across_an_epoch_boundary(self):
+        epoch = current_hot_epoch()
+        Comment.objects.filter(pk=self.comments[0].pk).update(
+            hot_epoch=epoch - 1, hot_score=10.0,
+        )
+        Comment.objects.filter(pk=self.comments[1].pk).update(hot_score=9.0)
+        with CaptureQueriesContext(connection) as context:
+            self.hot()
+        self.assertFalse([
+            query for query in context.captured_queries
+            if query['sql'].startswith('UPDATE')
+        ])
+        hot_rebaser.rebase()
+        # 10 a quarter half life ago is 8.4 now.
+        self.assertEqual(
+            self.contents(self.hot()),
+            ['comment 1', 'comment 0', 'comment 3', 'comment 2'],
+        )
+        self.assertFalse(Comment.objects.filter(hot_epoch__lt=epoch).exists())
+
+    def test_rebase_walks_the_ids_in_batches(self):
+        epoch = current_hot_epoch()
+        Comment.objects.update(hot_epoch=epoch - 2, hot_score=8.0)
+        with CaptureQueriesContext(connection) as context:
+            rebased = rebase_hot_scores(Comment.objects.all(), batch_size=3)
+        self.assertEqual(rebased, 4)
+        self.assertEqual(len([
+            query for query in context.captured_queries
+            if query['sql'].startswith('UPDATE')
+        ]), 2)
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'DISTINCT' in query['sql']
+        ])
+
+    def test_recompute_scores_from_counters(self):
+        Comment.objects.update(hot_score=0)
+        Comment.objects.filter(pk=self.comments[0].pk).update(likes_comments=5)
+        call_command(
+            'rebase_hot_scores', recompute=True, stdout=io.StringIO(),
+        )
+        self.assertEqual(self.contents(self.hot())[0], 'comment 0')
+
+
+class SyncTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.comment = Comment.objects.create(content='synced', user=self.user)
+        self.reply = Reply.objects.create(
+            content='synced reply', comment=self.comment,
+        )
+
+    def sync(self, **params):
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_token_without_changes(self):
+        token = self.sync()['token']
+        data = self.sync(token=token)
+        self.assertEqual(data['token'], token)
+        self.assertFalse(data['has_more'])
+        self.assertEqual(data['comments'], [])
+        self.assertEqual(data['replies'], [])
+
+    def test_returns_created_updated_and_deleted_objects(self):
+        token = self.sync()['token']
+        created = Comment.objects.create(content='new', user=self.user)
+        self.client.patch(
+            f'/api/reply/{self.reply.id}/', {'content': 'edited'},
+        )
+        self.client.delete(f'/api/comment/{created.id}/')
+        self.client.post('/api/comment/', {'content': 'newer'})
+        data = self.sync(token=token)
+        self.assertEqual(
+            [comment['content'] for comment in data['comments']], ['newer'],
+        )
+        self.assertIn('id', data['comments'][0])
+        self.assertNotIn('replies', data['comments'][0])
+        self.assertEqual(
+            [reply['content'] for reply in data['replies']], ['edited'],
+        )
+        self.assertEqual(
+            data['deleted'], {'comments': [created.id], 'replies': []},
+        )
+        self.assertEqual(self.sync(token=data['token'])['comments'], [])
+
+    def test_counters_do_not_log_changes(self):
+        token = self.sync()['token']
+        add_like(self.user, 'comment', self.comment.id)
+        Reply.objects.create(content='other', comment=self.comment)
+        data = self.sync(token=token)
+        self.assertEqual(data['comments'], [])
+        self.assertEqual(len(data['replies']), 1)
+
+    def test_cascaded_and_bulk_writes_are_logged(self):
+        token = self.sync()['token']
+        response = self.client.post(
+            '/api/comment/bulk/', [{'content': 'a'}, {'content': 'b'}],
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        comment_id, reply_id = self.comment.id, self.reply.id
+        self.comment.delete()
+        data = self.sync(token=token)
+        self.assertEqual(len(data['comments']), 2)
+        self.assertEqual(data['deleted'], {
+            'comments': [comment_id], 'replies': [reply_id],
+        })
+
+    def test_thread_sync_sees_moved_replies_leave(self):
+        other = Comment.objects.create(content='other', user=self.user)
+        token = self.sync()['token']
+        response = self.client.patch(
+            f'/api/reply/{self.reply.id}/',
+            {'content': 'moved', 'comment': other.id},
+        )
+        self.assertEqual(response.status_code, 200)
+        old = self.sync(token=token, comment=self.comment.id)
+        self.assertEqual(old['deleted']['replies'], [self.reply.id])
+        new = self.sync(token=token, comment=other.id)
+        self.assertEqual(new['replies'][0]['id'], self.reply.id)
+        everywhere = self.sync(token=token)
+        self.assertEqual(everywhere['deleted']['replies'], [])
+        self.assertEqual(everywhere['replies'][0]['id'], self.reply.id)
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_changes_are_read_in_pages(self):
+        token = self.sync()['token']
+        for i in range(3):
+            Comment.objects.create(content=f'page {i}', user=self.user)
+        data = self.sync(token=token)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(len(data['comments']), 2)
+        data = self.sync(token=data['token'])
+        self.assertFalse(data['has_more'])
+        self.assertEqual(data['comments'][0]['content'], 'page 2')
+
+    def test_pruned_token_expires(self):
+        token = self.sync()['token']
+        Comment.objects.create(content='later', user=self.user)
+        call_command(
+            'prune_changes', days=-1, stdout=io.StringIO(),
+        )
+        self.assertEqual(Change.objects.count(), 1)
+        response = self.client.get('/api/sync/', {'token': 0})
+        self.assertEqual(response.status_code, 410)
+        data = self.sync(token=token)
+        self.assertEqual(data['comments'][0]['content'], 'later')
+
+    def test_invalid_token(self):
+        response = self.client.get('/api/sync/', {'token': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.comment = Comment.objects.create(content='timed', user=self.user)
+        request_metrics.reset()
+
+    def metrics(self, **headers):
+        response = self.client.get('/api/metrics/', **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode()
+
+    def test_records_latency_queries_and_stages(self):
+        self.client.get('/api/comment/')
+        self.client.get('/api/comment/')
+        self.client.patch(f'/api/comment/{self.comment.id}/like/')
+        metrics = self.metrics()
+        labels = 'view="comment-list",method="GET"'
+        self.assertIn(
+            f'comments_request_duration_seconds_count{{{labels},'
+            'status="200"} 2', metrics,
+        )
+        for name in ('queries', 'db_duration_seconds',
+                     'serialize_duration_seconds',
+                     'render_duration_seconds'):
+            self.assertIn(
+                f'comments_request_{name}_count{{{labels}}} 2', metrics,
+            )
+        self.assertIn(
+            'comments_request_queries_bucket{view="comment-list",'
+            'method="GET",le="+Inf"} 2', metrics,
+        )
+        self.assertIn('view="like_comment",method="PATCH"', metrics)
+
+    def test_histogram_buckets_are_cumulative(self):
+        request_metrics.observe(
+            'comments_request_queries', (('view', 'x'), ('method', 'GET')), 3,
+        )
+        metrics = request_metrics.render()
+        self.assertIn(
+            'comments_request_queries_bucket{view="x",method="GET",'
+            'le="2.0"} 0',
+            metrics,
+        )
+        self.assertIn(
+            'comments_request_queries_bucket{view="x",method="GET",'
+            'le="5.0"} 1',
+            metrics,
+        )
+        self.assertIn(
+            'comments_request_queries_sum{view="x",method="GET"} 3', metrics,
+        )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_protects_metrics(self):
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 403)
+        self.metrics(HTTP_AUTHORIZATION='Bearer secret')
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs('apps.v1_core.metrics', 'WARNING') as logs:
+            self.client.get(f'/api/comment/{self.comment.id}/')
+        self.assertIn('comment-detail', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class SeedAndBenchmarkTestCase(TestCase):
+
+    def test_seed_comments_builds_consistent_threads(self):
+        call_command(
+            'seed_comments', comments=30, users=5, targets=3, seed=7,
+            stdout=io.StringIO(),
+        )
+        self.assertEqual(Comment.objects.count(), 30)
+        self.assertEqual(
+            User.objects.filter(username__startswith='seed-user-').count(), 5,
+        )
+        self.assertTrue(Reply.objects.filter(parent__isnull=False).exists())
+        self.assertFalse(Reply.objects.filter(path='').exists())
+        for comment in Comment.objects.with_counted_replies():
+            self.assertEqual(comment.reply_count, comment.counted_replies)
+        self.assertTrue(Comment.objects.exclude(target_id='').exists())
+
+    def test_seed_is_reproducible(self):
+        contents = []
+        for _ in range(2):
+            Comment.objects.all().delete()
+            call_command(
+                'seed_comments', comments=5, seed=3, stdout=io.StringIO(),
+            )
+            contents.append(list(
+                Comment.objects.order_by('id').values_list(
+                    'content', 'likes_comments', 'reply_count',
+                ),
+            ))
+        self.assertEqual(contents[0], contents[1])
+
+    def test_benchmark_reports_and_compares_with_a_baseline(self):
+        call_command(
+            'seed_comments', comments=10, replies_per_comment=2,
+            stdout=io.StringIO(),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            output = io.StringIO()
+            call_command(
+                'benchmark', mode='inprocess', requests=3, warmup=1,
+                host='testserver', output=path, stdout=output,
+            )
+            with open(path) as baseline:
+                results = json.load(baseline)
+            call_command(
+                'benchmark', mode='inprocess', scenarios=['detail'],
+                requests=3, warmup=0, host='testserver', baseline=path,
+                max_regression=1000, fail_on_regression=True,
+                stdout=output,
+            )
+        scenarios = results['results']['inprocess']
+        self.assertEqual(set(scenarios), {
+            'list', 'detail', 'search', 'create', 'like', 'reply', 'page',
+        })
+        for result in scenarios.values():
+            self.assertEqual(result['requests'], 3)
+            self.assertEqual(result['errors'], 0)
+            self.assertGreater(result['queries_per_request'], 0)
+        self.assertIn('p50_ms', output.getvalue())
+
+
+class SparseFieldsTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.comment = Comment.objects.create(
+            content='sparse comment', user=self.user,
+        )
+        self.other = Comment.objects.create(content='other', user=self.user)
+        for i in range(4):
+            Reply.objects.create(content=f'reply {i}', comment=self.comment)
+        Reply.objects.create(content='other reply', comment=self.other)
+        Comment.objects.recount_replies()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in context.captured_queries]
+
+    def test_fields_select_keys_and_columns(self):
+        response, queries = self.get('/api/comment/?fields=likes_comments')
+        for comment in response.data['results']:
+            self.assertEqual(set(comment), {'likes_comments'})
+        comment_queries = [
+            sql for sql in queries if 'FROM "v1_core_comment"' in sql
+        ]
+        self.assertTrue(comment_queries)
+        self.assertFalse(any(
+            '"v1_core_comment"."content"' in sql for sql in comment_queries
+        ))
+        self.assertFalse(any('v1_core_reply' in sql for sql in queries))
+
+    def test_fields_on_detail(self):
+        response, _ = self.get(
+            f'/api/comment/{self.comment.id}/?fields=content,replies',
+        )
+        self.assertEqual(set(response.data), {'content', 'replies'})
+        self.assertEqual(len(response.data['replies']), 4)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/comment/?fields=content,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', str(response.data))
+
+    def test_fields_do_not_apply_to_writes(self):
+        response = self.client.post(
+            '/api/comment/?fields=likes_comments', {'content': 'written'},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['content'], 'written')
+
+    def test_replies_count(self):
+        response, queries = self.get('/api/comment/?replies=count')
+        counts = {
+            comment['content']: comment['replies']
+            for comment in response.data['results']
+        }
+        self.assertEqual(counts, {'sparse comment': 4, 'other': 1})
+        self.assertFalse(any('v1_core_reply' in sql for sql in queries))
+
+    def test_replies_first_n(self):
+        response, queries = self.get('/api/comment/?replies=first:2')
+        replies = {
+            comment['content']: [reply['content'] for reply in comment['replies']]  # NOQA
+            for comment in response.data['results']
+        }
+        self.assertEqual(replies, {
+            'sparse comment': ['reply 0', 'reply 1'],
+            'other': ['other reply'],
+        })
+        self.assertEqual(
+            len([sql for sql in queries if 'v1_core_reply' in sql]), 1,
+        )
+        response, _ = self.get(
+            f'/api/comment/{self.comment.id}/?replies=first:3',
+        )
+        self.assertEqual(len(response.data['replies']), 3)
+        self.assertEqual(response.data['reply_count'], 4)
+
+    def test_invalid_replies_mode(self):
+        for value in ('some', 'first:0', 'first:x', 'first:1000'):
+            response = self.client.get(f'/api/comment/?replies={value}')
+            self.assertEqual(response.status_code, 400)
+
+
+class FastReadPathTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.comment = Comment.objects.create(
+            content='row comment', user=self.user,
+            target_type='article', target_id='7',
+        )
+        Comment.objects.create(content='other', user=self.user)
+        first = Reply.objects.create(content='first', comment=self.comment)
+        Reply.objects.create(
+            content='nested', comment=self.comment, parent=first,
+        )
+        Comment.objects.recount_replies()
+        Reply.objects.place_in_threads()
+
+    def assertSameContent(self, url):
+        fast = self.client.get(url)
+        with override_settings(FAST_READ_PATH_ENABLED=False):
+            slow = self.client.get(url)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+
+    def test_comment_reads_are_byte_identical(self):
+        for url in (
+            '/api/comment/',
+            '/api/comment/?ordering=hot',
+            '/api/comment/?target_type=article&target_id=7',
+            '/api/comment/?replies=none',
+            '/api/comment/?replies=count',
+            '/api/comment/?replies=first:1',
+            '/api/comment/?fields=content,replies',
+            f'/api/comment/{self.comment.id}/',
+            f'/api/comment/{self.comment.id}/?fields=user,updated_at',
+        ):
+            with self.subTest(url=url):
+                self.assertSameContent(url)
+
+    def test_reply_reads_are_byte_identical(self):
+        for url in (
+            '/api/reply/',
+            f'/api/reply/thread/?comment={self.comment.id}',
+            f'/api/reply/thread/?comment={self.comment.id}&page_size=1',
+        ):
+            with self.subTest(url=url):
+                self.assertSameContent(url)
+
+    @override_settings(LIKE_BUFFER_ENABLED=True)
+    def test_buffered_likes_are_included(self):
+        add_like(self.user, 'comment', self.comment.id)
+        reply = self.comment.replies.first()
+        add_like(self.user, 'reply', reply.id)
+        try:
+            self.assertSameContent('/api/comment/')
+            response = self.client.get(f'/api/comment/{self.comment.id}/')
+            self.assertEqual(response.data['likes_comments'], 1)
+            self.assertEqual(response.data['replies'][0]['likes_replies'], 1)
+        finally:
+            like_buffer.stop()
+
+    def test_other_renderers_use_the_serializer(self):
+        response = self.client.get('/api/comment/?format=api')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(DATABASE_REPLICAS={'replica': 1})
+class ReadReplicaTestCase(APIViewBaseTest):
+    multi_db = True
+
+    def setUp(self):
+        super().setUp()
+        replica_pool.reset()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        User.objects.using('replica').create(
+            id=self.user.id, username=self.user.username,
+        )
+        self.primary = Comment.objects.create(
+            content='on the primary', user=self.user,
+        )
+        self.replicated = Comment.objects.using('replica').create(
+            content='on the replica', user_id=self.user.id,
+        )
+
+    def tearDown(self):
+        replica_pool.reset()
+
+    def contents(self):
+        response = self.client.get('/api/comment/')
+        self.assertEqual(response.status_code, 200)
+        return [comment['content'] for comment in response.data['results']]
+
+    def test_reads_go_to_a_replica(self):
+        self.assertEqual(self.contents(), ['on the replica'])
+        response = self.client.get(f'/api/comment/{self.replicated.id}/')
+        self.assertEqual(response.data['content'], 'on the replica')
+
+    def test_writes_go_to_the_primary_and_pin_it(self):
+        response = self.client.post('/api/comment/', {'content': 'new'})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('primary_pin', response.cookies)
+        self.assertTrue(Comment.objects.filter(content='new').exists())
+        self.assertFalse(
+            Comment.objects.using('replica').filter(content='new').exists(),
+        )
+        self.assertEqual(self.contents(), ['on the primary', 'new'])
+
+    def test_pin_expires(self):
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            self.client.post('/api/comment/', {'content': 'new'})
+        self.assertEqual(self.contents(), ['on the replica'])
+
+    @override_settings(COMMENT_CACHE_ENABLED=True)
+    def test_replica_reads_do_not_fill_the_cache(self):
+        comment_cache.local.clear()
+        Comment.objects.using('replica').update_or_create(
+            id=self.primary.id,
+            defaults={'content': 'lagging', 'user_id': self.user.id},
+        )
+        url = f'/api/comment/{self.primary.id}/'
+        self.assertEqual(self.client.get(url).data['content'], 'lagging')
+        with override_settings(DATABASE_REPLICAS={}):
+            response = self.client.get(url)
+        self.assertEqual(response.data['content'], 'on the primary')
+
+    @override_settings(DATABASE_REPLICAS={})
+    def test_without_replicas_reads_stay_on_the_primary(self):
+        self.assertEqual(self.contents(), ['on the primary'])
+
+    def test_unhealthy_replicas_are_skipped(self):
+        with mock.patch.object(replica_pool, 'probe', return_value=False) \
+                as probe:
+            self.assertEqual(self.contents(), ['on the primary'])
+            self.assertEqual(self.contents(), ['on the primary'])
+        self.assertEqual(probe.call_count, 1)
+
+    @override_settings(DATABASE_REPLICAS={'replica': 3, 'default': 1})
+    def test_choice_is_weighted(self):
+        rng = random.Random(0)
+        choices = [replica_pool.choose(rng) for _ in range(400)]
+        self.assertGreater(choices.count('replica'), 250)
+        self.assertGreater(choices.count('default'), 50)
+
+
+class SoftDeleteTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.comment = Comment.objects.create(content='doomed', user=self.user)
+        self.kept = Comment.objects.create(content='kept', user=self.user)
+        parent = Reply.objects.create(content='parent', comment=self.comment)
+        for i in range(4):
+            Reply.objects.create(
+                content=f'nested {i}', comment=self.comment, parent=parent,
+            )
+        self.reply = Reply.objects.create(content='kept', comment=self.kept)
+
+    def delete(self):
+        response = self.client.delete(f'/api/comment/{self.comment.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_only_marks_the_comment(self):
+        with self.assertNumQueries(1):
+            soft_delete_comment(self.comment.id)
+        self.assertEqual(Reply.objects.count(), 6)
+        self.assertIsNotNone(
+            Comment.all_objects.get(pk=self.comment.id).deleted_at,
+        )
+
+    def test_deleted_comments_are_hidden(self):
+        self.delete()
+        response = self.client.get('/api/comment/')
+        self.assertEqual(
+            [comment['content'] for comment in response.data['results']],
+            ['kept'],
+        )
+        for url in (
+            f'/api/comment/{self.comment.id}/',
+            f'/api/reply/{self.comment.replies.first().id}/',
+        ):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.get('/api/reply/')
+        self.assertEqual(
+            [reply['content'] for reply in response.data], ['kept'],
+        )
+        response = self.client.get(
+            '/api/reply/thread/', {'comment': self.comment.id},
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            '/api/reply/', {'content': 'late', 'comment': self.comment.id},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_sync_reports_the_deletion(self):
+        token = self.client.get('/api/sync/').data['token']
+        self.delete()
+        response = self.client.get('/api/sync/', {'token': token})
+        self.assertEqual(
+            response.data['deleted']['comments'], [self.comment.id],
+        )
+
+    def test_purge_deletes_replies_in_chunks(self):
+        self.delete()
+        with CaptureQueriesContext(connection) as context:
+            comments, replies = purge_deleted_comments(chunk_size=2)
+        self.assertEqual((comments, replies), (1, 5))
+        reply_deletes = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('DELETE FROM "v1_core_reply"')
+        ]
+        self.assertEqual(len(reply_deletes), 3)
+        self.assertFalse(
+            Comment.all_objects.filter(pk=self.comment.id).exists(),
+        )
+        self.assertEqual(list(Reply.objects.all()), [self.reply])
+        self.assertEqual(purge_deleted_comments(), (0, 0))
+
+
+class HotScoreRebaserTestCase(TransactionTestCase):
+
+    def test_rebaser_rebases_when_it_starts(self):
+        user = User.objects.create_user(username='user@test.com')
+        comment = Comment.objects.create(content='old', user=user)
+        Comment.objects.filter(pk=comment.pk).update(
+            hot_epoch=current_hot_epoch() - 4, hot_score=8.0,
+        )
+        hot_rebaser.start()
+        hot_rebaser.stop()
+        comment.refresh_from_db()
+        self.assertEqual(comment.hot_epoch, current_hot_epoch())
+        self.assertAlmostEqual(comment.hot_score, 4.0)
+
+
+class PurgeWorkerTestCase(APITransactionTestCase):
+
+    def test_worker_purges_after_the_delete_commits(self):
+        user = User.objects.create_user(
+            username='user@test.com', password='thisisapassword',
+        )
+        comment = Comment.objects.create(content='doomed', user=user)
+        for i in range(3):
+            Reply.objects.create(content=f'reply {i}', comment=comment)
+        self.client.login(username='user@test.com', password='thisisapassword')
+        response = self.client.delete(f'/api/comment/{comment.id}/')
+        self.assertEqual(response.status_code, 200)
+        purge_worker.join()
+        self.assertFalse(Comment.all_objects.exists())
+        self.assertFalse(Reply.objects.exists())
+
+    def test_leftover_purges_resume_when_the_application_loads(self):
+        user = User.objects.create_user(username='user@test.com')
+        comment = Comment.objects.create(content='left over', user=user)
+        Reply.objects.create(content='reply', comment=comment)
+        # Marked by a process that stopped before purging it.
+        Comment.objects.filter(pk=comment.pk).update(deleted_at=timezone.now())
+        sys.modules.pop('comments.wsgi', None)
+        importlib.import_module('comments.wsgi')
+        purge_worker.join()
+        hot_rebaser.stop()
+        self.assertFalse(Comment.all_objects.exists())
+        self.assertFalse(Reply.objects.exists())
+
+
+class ArchiveTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client.login(username='user@test.com', password='thisisapassword')
+        self.old = Comment.objects.create(content='old', user=self.user)
+        self.new = Comment.objects.create(content='new', user=self.user)
+        parent = Reply.objects.create(content='parent', comment=self.old)
+        Reply.objects.create(content='nested', comment=self.old, parent=parent)
+        Reply.objects.create(content='fresh', comment=self.new)
+        Comment.objects.filter(pk=self.old.id).update(
+            created_at=timezone.now() - datetime.timedelta(days=400),
+        )
+        self.before = timezone.now() - datetime.timedelta(days=365)
+
+    def test_old_comments_move_to_the_archive(self):
+        self.assertEqual(archive_comments(self.before), (1, 2))
+        self.assertEqual(list(Comment.objects.all()), [self.new])
+        self.assertEqual(
+            [reply.content for reply in Reply.objects.all()], ['fresh'],
+        )
+        archived = ArchivedComment.objects.get()
+        self.assertEqual(archived.id, self.old.id)
+        self.assertIsNotNone(archived.archived_at)
+        self.assertEqual(
+            [reply.content for reply in archived.replies.order_by('id')],
+            ['parent', 'nested'],
+        )
+        self.assertEqual(archive_comments(self.before), (0, 0))
+
+    def test_archived_comments_read_as_before(self):
+        detail = self.client.get(f'/api/comment/{self.old.id}/').data
+        page = self.client.get('/api/comment/').data['results']
+        archive_comments(self.before)
+        response = self.client.get(f'/api/comment/{self.old.id}/')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            f'/api/comment/{self.old.id}/', {'archive': 'true'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, detail)
+        response = self.client.get('/api/comment/', {'archive': 'true'})
+        self.assertEqual(response.data['results'], page[:1])
+        response = self.client.get('/api/comment/')
+        self.assertEqual(response.data['results'], page[1:])
+
+    def test_archive_reads_take_the_usual_parameters(self):
+        query = {'replies': 'first:1', 'fields': 'content,replies'}
+        page = self.client.get('/api/comment/', query).data['results']
+        archive_comments(self.before)
+        response = self.client.get(
+            '/api/comment/', dict(query, archive='true'),
+        )
+        self.assertEqual(response.data['results'], page[:1])
+        self.assertEqual(len(page[0]['replies']), 1)
+        response = self.client.get(
+            f'/api/comment/{self.new.id}/', {'archive': 'true'},
+        )
+        self.assertEqual(response.data['content'], 'new')
+
+    def test_archived_target_comments_are_listed(self):
+        Comment.objects.filter(pk__in=[self.old.id, self.new.id]).update(
+            target_type='article', target_id='1',
+        )
+        archive_comments(self.before)
+        response = self.client.get(
+            '/api/comment/target/article/1/', {'archive': 'true'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [comment['content'] for comment in response.data['results']],
+            ['old'],
+        )
+        response = self.client.get(
+            '/api/comment/target/article/2/', {'archive': 'true'},
+        )
+        self.assertEqual(response.data['results'], [])
+
+    def test_writes_after_the_copy_reach_the_archive(self):
+        copy = copy_to_archive
+
+        def copy_then_write(comment_ids, archived_at):
+            counts = copy(comment_ids, archived_at)
+            self.client.patch(
+                f'/api/comment/{self.old.id}/', {'content': 'edited'},
+            )
+            add_like(self.user, 'comment', self.old.id)
+            self.client.post('/api/reply/', {
+                'content': 'late', 'comment': self.old.id,
+            })
+            return counts
+
+        with mock.patch(
+            'apps.v1_core.archive.copy_to_archive', copy_then_write,
+        ):
+            archive_comments(self.before)
+        archived = ArchivedComment.objects.get()
+        self.assertEqual(archived.content, 'edited')
+        self.assertEqual(archived.likes_comments, 1)
+        # The replies of `setUp` were not counted.
+        self.assertEqual(archived.reply_count, 1)
+        self.assertEqual(archived.version, 1)
+        self.assertEqual(
+            [reply.content for reply in archived.replies.order_by('id')],
+            ['parent', 'nested', 'late'],
+        )
+        self.assertFalse(Reply.objects.filter(comment_id=self.old.id).exists())
+
+    def test_interrupted_copy_is_resumed(self):
+        copy_to_archive([self.old.id], timezone.now())
+        ArchivedReply.objects.filter(content='nested').delete()
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(archive_comments(self.before), (1, 2))
+        self.assertEqual(ArchivedComment.objects.count(), 1)
+        self.assertEqual(ArchivedReply.objects.count(), 2)
+
+    @override_settings(COMMENT_PURGE_CHUNK_SIZE=1)
+    def test_hot_rows_are_deleted_in_chunks(self):
+        add_like(self.user, 'comment', self.old.id)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(archive_comments(self.before), (1, 2))
+        deletes = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('DELETE FROM "v1_core_reply"')
+        ]
+        self.assertEqual(len(deletes), 2)
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(ArchivedReply.objects.count(), 2)
+
+    def test_archiving_leaves_no_sync_tombstones(self):
+        token = self.client.get('/api/sync/').data['token']
+        archive_comments(self.before)
+        response = self.client.get('/api/sync/', {'token': token})
+        self.assertEqual(
+            response.data['deleted'], {'comments': [], 'replies': []},
+        )
+
+    def test_archive_comments_command(self):
+        out = io.StringIO()
+        call_command('archive_comments', '--days', '365', stdout=out)
+        self.assertEqual(
+            out.getvalue().strip(), '1 comments and 2 replies archived',
+        )
+        self.assertFalse(Comment.objects.filter(pk=self.old.id).exists())
+
+
+@override_settings(
+    THROTTLE_ENABLED=True,
+    THROTTLE_RATES={
+        'create': '2/min', 'bulk': '5/min', 'update': '2/min',
+        'like': '2/min',
+    },
+    THROTTLE_IP_RATES={'create': '3/min', 'like': '3/min'},
+)
+class ThrottleTestCase(APIViewBaseTest):
+
+    def setUp(self):
+        super().setUp()
+        token_buckets.local.clear()
+        self.addCleanup(token_buckets.local.clear)
+        self.other = User.objects.create_user(
+            username='other@test.com', password='thisisapassword',
+        )
+        self.comment = Comment.objects.create(content='liked', user=self.user)
+        self.client.login(username='user@test.com', password='thisisapassword')
+
+    def like(self, client=None):
+        client = client or self.client
+        return client.patch(f'/api/comment/{self.comment.id}/like/')
+
+    def test_likes_past_the_budget_are_rejected_before_any_query(self):
+        self.assertEqual(self.like().status_code, 200)
+        self.assertEqual(self.like().status_code, 200)
+        with CaptureQueriesContext(connection) as context:
+            response = self.like()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'v1_core' in query['sql']
+        ])
+        self.assertEqual(Like.objects.count(), 1)
+        response = self.client.patch(
+            f'/api/reply/{Reply.objects.create(comment=self.comment).id}'
+            '/like/',
+        )
+        self.assertEqual(response.status_code, 429)
+
+    def test_budgets_are_per_scope_and_user(self):
+        for _ in range(2):
+            self.like()
+        self.assertEqual(self.like().status_code, 429)
+        response = self.client.post('/api/comment/', {'content': 'new'})
+        self.assertEqual(response.status_code, 201)
+        other = APIClient()
+        other.login(username='other@test.com', password='thisisapassword')
+        self.assertEqual(self.like(other).status_code, 200)
+
+    def test_address_budget_covers_every_account(self):
+        other = APIClient()
+        other.login(username='other@test.com', password='thisisapassword')
+        self.assertEqual(self.like().status_code, 200)
+        self.assertEqual(self.like(other).status_code, 200)
+        self.assertEqual(self.like().status_code, 200)
+        self.assertEqual(self.like(other).status_code, 429)
+
+    def test_rejected_requests_spend_from_no_bucket(self):
+        other = APIClient()
+        other.login(username='other@test.com', password='thisisapassword')
+        self.assertEqual(self.like().status_code, 200)
+        self.assertEqual(self.like(other).status_code, 200)
+        self.assertEqual(self.like(other).status_code, 200)
+        self.assertEqual(self.like().status_code, 429)
+        for key in list(token_buckets.local.buckets):
+            if key.startswith('throttle:ip:'):
+                del token_buckets.local.buckets[key]
+        self.assertEqual(self.like().status_code, 200)
+        self.assertEqual(self.like().status_code, 429)
+
+    def test_creates_and_updates_are_throttled(self):
+        for _ in range(2):
+            response = self.client.post('/api/comment/', {'content': 'new'})
+            self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/comment/', {'content': 'new'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(Comment.objects.count(), 3)
+        url = f'/api/comment/{self.comment.id}/'
+        for _ in range(2):
+            response = self.client.patch(url, {'content': 'edited'})
+            self.assertEqual(response.status_code, 200)
+        response = self.client.patch(url, {'content': 'edited'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_bulk_creates_spend_a_token_per_item(self):
+        def bulk(count):
+            return self.client.post(
+                '/api/comment/bulk/',
+                [{'content': f'bulk {i}'} for i in range(count)],
+                format='json',
+            )
+
+        self.assertEqual(bulk(3).status_code, 201)
+        response = bulk(3)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(bulk(2).status_code, 201)
+        token_buckets.local.clear()
+        response = bulk(6)
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn('Retry-After', response)
+        self.assertEqual(Comment.objects.count(), 6)
+        response = self.client.post('/api/comment/', {'content': 'single'})
+        self.assertEqual(response.status_code, 201)
+
+    @override_settings(THROTTLE_ENABLED=False)
+    def test_disabled(self):
+        for _ in range(3):
+            self.assertEqual(self.like().status_code, 200)
+
+    def test_buckets_refill_and_stay_bounded(self):
+        store = TokenBucketStore(max_keys=2)
+        with mock.patch('time.monotonic', return_value=100.0) as monotonic:
+            self.assertEqual(store.take('a', 2, 1.0), 0)
+            self.assertEqual(store.take('a', 2, 1.0), 0)
+            self.assertEqual(store.take('a', 2, 1.0), 1.0)
+            monotonic.return_value = 100.5
+            self.assertEqual(store.take('a', 2, 1.0), 0.5)
+            monotonic.return_value = 101.0
+            self.assertEqual(store.take('a', 2, 1.0), 0)
+            store.take('b', 2, 1.0)
+            store.take('c', 2, 1.0)
+        self.assertEqual(list(store.buckets), ['b', 'c'])
+
+    @override_settings(THROTTLE_BACKEND='default')
+    def test_shared_backend(self):
+        first, second = TokenBuckets(), TokenBuckets()
+        first.shared.clear()
+        self.addCleanup(first.shared.clear)
+        self.assertEqual(first.take('key', 1, 1.0), 0)
+        self.assertGreater(second.take('key', 1, 1.0), 0)
+        self.assertFalse(first.local.buckets)
+
+    @override_settings(THROTTLE_BACKEND='default')
+    def test_shared_backend_spends_each_token_once(self):
+        buckets = [TokenBuckets() for _ in range(8)]
+        buckets[0].shared.clear()
+        self.addCleanup(buckets[0].shared.clear)
+        barrier = threading.Barrier(len(buckets))
+        waits = []
+        backend = type(buckets[0].shared)
+        get = backend.get
+
+        def slow_get(*args, **kwargs):
+            # Widens the window between reading and writing the bucket.
+            value = get(*args, **kwargs)
+            time.sleep(0.01)
+            return value
+
+        def take(store):
+            barrier.wait()
+            waits.append(store.take('key', 2, 0.001))
+
+        with mock.patch.object(backend, 'get', slow_get):
+            threads = [
+                threading.Thread(target=take, args=(store,))
+                for store in buckets
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(waits.count(0), 2)
+
+
+class TestLikeUpdateView(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='like@test.com', password='thisisapassword',
+        )
+        self.comment = Comment.objects.create(
+            content='this awesome comment',
+            user=self.user,
+        )
+        self.reply_data = {
+            'content': 'this is a reply to the comment',
+            'comment': self.comment,
         }
         self.reply = Reply.objects.create(
             content='reply to this comment',
@@ -393,3 +2655,328 @@ class TestLikeUpdateView(APITestCase):
         after = response.data['likes_replies']
         self.assertEqual(after, (before + 1))
         self.assertEqual(response.status_code, 200)
+
+    def test_like_is_idempotent_per_user(self):
+        self.client.login(username='like@test.com', password='thisisapassword')
+        for _ in range(3):
+            response = self.client.patch(f'/api/comment/{self.comment.id}/like/')  # NOQA
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['likes_comments'], 1)
+        self.assertFalse(response.data['liked'])
+        self.assertEqual(Like.objects.filter(comment=self.comment).count(), 1)
+
+    def test_like_response_is_compact(self):
+        self.client.login(username='like@test.com', password='thisisapassword')
+        response = self.client.patch(f'/api/comment/{self.comment.id}/like/')
+        self.assertEqual(
+            response.data,
+            {'id': self.comment.id, 'likes_comments': 1, 'liked': True},
+        )
+
+    def test_edits_leave_like_counters_alone(self):
+        self.client.login(username='like@test.com', password='thisisapassword')
+        self.client.patch(f'/api/comment/{self.comment.id}/like/')
+        response = self.client.patch(
+            f'/api/comment/{self.comment.id}/',
+            {'content': 'edited', 'likes_comments': 100},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['likes_comments'], 1)
+        response = self.client.patch(
+            f'/api/reply/{self.reply.id}/',
+            {'content': 'edited', 'likes_replies': 100},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.comment.refresh_from_db()
+        self.reply.refresh_from_db()
+        self.assertEqual(self.comment.likes_comments, 1)
+        self.assertEqual(self.reply.likes_replies, 0)
+
+    def test_like_missing_target(self):
+        self.client.login(username='like@test.com', password='thisisapassword')
+        response = self.client.patch('/api/reply/999/like/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Like.objects.exists())
+
+
+@override_settings(
+    LIKE_BUFFER_ENABLED=True,
+    LIKE_BUFFER_FLUSH_INTERVAL=60 * 60 * 1000,
+    LIKE_BUFFER_FLUSH_EVENTS=5,
+)
+class LikeBufferTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='like@test.com', password='thisisapassword',
+        )
+        self.fans = [
+            User.objects.create_user(username=f'fan{i}@test.com')
+            for i in range(4)
+        ]
+        self.comment = Comment.objects.create(
+            content='this awesome comment', user=self.user,
+        )
+        self.reply = Reply.objects.create(
+            content='reply to this comment', comment=self.comment,
+        )
+
+    def tearDown(self):
+        like_buffer.stop()
+
+    def test_likes_are_buffered_until_flush(self):
+        for fan in self.fans[:3]:
+            likes, created = add_like(fan, 'comment', self.comment.id)
+        self.assertEqual(likes, 3)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.likes_comments, 0)
+        with self.assertNumQueries(3):
+            like_buffer.flush()
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.likes_comments, 3)
+        self.assertEqual(like_buffer.pending('comment', self.comment.id), 0)
+
+    def test_flushes_one_update_per_target_model(self):
+        add_like(self.fans[0], 'comment', self.comment.id)
+        add_like(self.fans[0], 'reply', self.reply.id)
+        add_like(self.fans[1], 'reply', self.reply.id)
+        with self.assertNumQueries(5):
+            like_buffer.flush()
+        self.reply.refresh_from_db()
+        self.assertEqual(self.reply.likes_replies, 2)
+
+    def test_reads_include_unflushed_likes(self):
+        add_like(self.fans[0], 'comment', self.comment.id)
+        add_like(self.fans[0], 'reply', self.reply.id)
+        self.client.login(username='like@test.com', password='thisisapassword')
+        response = self.client.get(f'/api/comment/{self.comment.id}/')
+        self.assertEqual(response.data['likes_comments'], 1)
+        self.assertEqual(response.data['replies'][0]['likes_replies'], 1)
+        response = self.client.get(f'/api/reply/{self.reply.id}/')
+        self.assertEqual(response.data['likes_replies'], 1)
+
+    def test_stop_flushes_pending_likes(self):
+        add_like(self.fans[0], 'comment', self.comment.id)
+        like_buffer.stop()
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.likes_comments, 1)
+
+
+@override_settings(
+    LIKE_BUFFER_ENABLED=True,
+    LIKE_BUFFER_FLUSH_INTERVAL=60 * 60 * 1000,
+    LIKE_BUFFER_FLUSH_EVENTS=5,
+)
+class LikeBufferFlusherTestCase(TransactionTestCase):
+
+    def tearDown(self):
+        like_buffer.stop()
+
+    def test_flush_after_event_threshold(self):
+        user = User.objects.create_user(username='like@test.com')
+        comment = Comment.objects.create(content='liked', user=user)
+        other = Comment.objects.create(content='other', user=user)
+        fans = [
+            User.objects.create_user(username=f'fan{i}@test.com')
+            for i in range(4)
+        ]
+        flush = like_buffer.flush
+        with mock.patch.object(like_buffer, 'flush') as flushed:
+            flushed.side_effect = flush
+            for fan in fans:
+                add_like(fan, 'comment', comment.id)
+            self.assertFalse(flushed.called)
+            add_like(user, 'comment', other.id)
+            self.assertFalse(flushed.called)
+            deadline = time.monotonic() + 5
+            while like_buffer.pending('comment', comment.id) and \
+                    time.monotonic() < deadline:
+                time.sleep(0.01)
+        comment.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(comment.likes_comments, 4)
+        self.assertEqual(other.likes_comments, 1)
+
+
+class ConcurrentLikeTestCase(TransactionTestCase):
+
+    def test_concurrent_likes_are_not_lost(self):
+        owner = User.objects.create_user(username='owner@test.com')
+        comment = Comment.objects.create(content='viral', user=owner)
+        users = [
+            User.objects.create_user(username=f'fan{i}@test.com')
+            for i in range(8)
+        ]
+        barrier = threading.Barrier(len(users))
+        errors = []
+
+        def like(user):
+            try:
+                barrier.wait()
+                # SQLite refuses concurrent writers instead of queueing them,
+                # a locked attempt is rolled back and simply retried.
+                for attempt in range(100):
+                    try:
+                        add_like(user, 'comment', comment.id)
+                        break
+                    except OperationalError:
+                        time.sleep(0.01)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=like, args=(user,)) for user in users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        comment.refresh_from_db()
+        self.assertEqual(comment.likes_comments, len(users))
+        self.assertEqual(
+            Like.objects.filter(comment=comment).count(), len(users),
+        )
+
+
+@override_settings(GROUP_COMMIT_ENABLED=True)
+class GroupCommitTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner@test.com')
+
+    def tearDown(self):
+        write_queue.stop()
+
+    def test_writes_share_a_transaction_but_not_failures(self):
+        release = threading.Event()
+        threads, results, errors = [], {}, {}
+
+        def blocked():
+            # Holds the writer, so the writes below queue up behind it.
+            release.wait()
+            return threading.current_thread().name
+
+        def create(content, fail=False):
+            Comment.objects.create(content=content, user=self.owner)
+            if fail:
+                raise ValueError(content)
+            return content
+
+        def submit(key, func, *args):
+            try:
+                results[key] = run_write(func, *args)
+            except ValueError as error:
+                errors[key] = error
+
+        for key, func, args in (
+            ('blocked', blocked, ()),
+            ('kept', create, ('kept',)),
+            ('failed', create, ('failed', True)),
+        ):
+            thread = threading.Thread(target=submit, args=(key, func, *args))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.05)
+        self.assertEqual(len(write_queue.pending), 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results['blocked'], 'group-commit')
+        self.assertEqual(results['kept'], 'kept')
+        self.assertEqual(str(errors['failed']), 'failed')
+        self.assertEqual(
+            list(Comment.objects.values_list('content', flat=True)),
+            ['kept'],
+        )
+
+    def test_concurrent_requests_are_all_written(self):
+        comment = Comment.objects.create(content='busy', user=self.owner)
+        barrier = threading.Barrier(8)
+        statuses = []
+
+        def post(i):
+            try:
+                client = APIClient()
+                client.force_authenticate(self.owner)
+                barrier.wait()
+                response = client.post('/api/reply/', {
+                    'content': f'reply {i}', 'comment': comment.id,
+                })
+                statuses.append(response.status_code)
+                response = client.patch(f'/api/comment/{comment.id}/like/')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(set(statuses)), [200, 201])
+        self.assertEqual(len(statuses), 16)
+        comment.refresh_from_db()
+        self.assertEqual(comment.reply_count, 8)
+        self.assertEqual(comment.likes_comments, 1)
+
+    def test_like_flushes_and_reply_deletes_use_the_writer(self):
+        comment = Comment.objects.create(content='busy', user=self.owner)
+        reply = Reply.objects.create(content='reply', comment=comment)
+        writers = []
+
+        def record(func):
+            def recorded(*args, **kwargs):
+                writers.append(threading.current_thread().name)
+                return func(*args, **kwargs)
+            return recorded
+
+        save = record(like_buffer.save)
+        with override_settings(LIKE_BUFFER_ENABLED=True), \
+                mock.patch.object(like_buffer, 'save', save):
+            like_buffer.add('comment', comment.id)
+            like_buffer.stop()
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        with mock.patch.object(
+            ReplyAPIView, 'save_destroy', record(ReplyAPIView.save_destroy),
+        ):
+            response = client.delete(f'/api/reply/{reply.id}/')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(set(writers), {'group-commit'})
+        self.assertEqual(len(writers), 2)
+        comment.refresh_from_db()
+        self.assertEqual(comment.likes_comments, 1)
+        self.assertFalse(Reply.objects.exists())
+
+    def test_bulk_creates_use_the_writer(self):
+        comment = Comment.objects.create(content='busy', user=self.owner)
+        writers = []
+        save = ReplyAPIView.save_bulk_create
+
+        def recorded(*args, **kwargs):
+            writers.append(threading.current_thread().name)
+            return save(*args, **kwargs)
+
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        with mock.patch.object(ReplyAPIView, 'save_bulk_create', recorded):
+            response = client.post('/api/reply/bulk/', [
+                {'content': f'reply {i}', 'comment': comment.id}
+                for i in range(3)
+            ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(writers, ['group-commit'])
+        comment.refresh_from_db()
+        self.assertEqual(comment.reply_count, 3)
+
+    def test_sqlite_pragmas_are_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
@@ -0,0 +1,253 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """
+    `(capacity, tokens per second)` of a rate such as `30/min`.
+
+    The bucket holds a whole period's budget, so a quiet client may spend
+    it in one burst.
+    """
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / PERIODS[period[0]]
+
+
+def refill(bucket, capacity, rate, now, cost=1):
+    """
+    Take `cost` tokens from `bucket`, a `(tokens, updated)` pair or `None`
+    for a full one. Returns the new bucket and the seconds to wait, 0 if
+    the tokens were granted.
+    """
+    tokens, updated = bucket or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= cost:
+        return (tokens - cost, now), 0
+    return (tokens, now), (cost - tokens) / rate
+
+
+def refill_all(stored, buckets, now, cost=1):
+    """
+    Take `cost` tokens from every one of `buckets`, `(key, capacity,
+    rate)` triples whose state is read from `stored`, or from none of
+    them. Returns the new buckets, empty if any of them is short, and
+    the seconds to wait, 0 if the tokens were granted.
+    """
+    refilled, wait = {}, 0
+    for key, capacity, rate in buckets:
+        refilled[key], key_wait = refill(
+            stored.get(key), capacity, rate, now, cost,
+        )
+        wait = max(wait, key_wait)
+    return ({} if wait else refilled), wait
+
+
+class TokenBucketStore:
+    """
+    Thread-safe in-process token buckets, at most `max_keys` of them.
+
+    Buckets refill lazily when they are read, so a check is one dict
+    lookup. The least recently used bucket is dropped past `max_keys`;
+    it was idle the longest and would be nearly full again anyway.
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1):
+        return self.take_all([(key, capacity, rate)], cost)
+
+    def take_all(self, buckets, cost=1):
+        with self.lock:
+            refilled, wait = refill_all(
+                self.buckets, buckets, time.monotonic(), cost,
+            )
+            for key, bucket in refilled.items():
+                self.buckets[key] = bucket
+                self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class TokenBuckets:
+    """
+    Token buckets of the throttles, shared between processes when
+    `THROTTLE_BACKEND` names one of `CACHES`.
+
+    Shared buckets are read and written back while holding their lock
+    keys, taken in key order with `cache.add`, which is atomic on
+    memcached, Redis and the database cache, so concurrent processes
+    never spend the same token. A request waits up to `lock_wait`
+    seconds for a lock and then takes without it; only then, or past a
+    lock that expired, can a token be spent twice.
+    """
+    lock_wait = 1
+
+    def __init__(self):
+        self.local = TokenBucketStore(self.max_keys)
+
+    @property
+    def max_keys(self):
+        return getattr(settings, 'THROTTLE_MAX_KEYS', 100000)
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'THROTTLE_BACKEND', None)
+        return caches[alias] if alias else None
+
+    def take(self, key, capacity, rate, cost=1):
+        return self.take_all([(key, capacity, rate)], cost)
+
+    def take_all(self, buckets, cost=1):
+        """
+        Take `cost` tokens from every one of `buckets` or, when any of
+        them is short, from none, and return the seconds to wait.
+        """
+        shared = self.shared
+        if shared is None:
+            return self.local.take_all(buckets, cost)
+        keys = sorted(key for key, _, _ in buckets)
+        locks = [self.acquire(shared, f'{key}:lock') for key in keys]
+        try:
+            # Wall clock, the buckets are read by other hosts.
+            refilled, wait = refill_all(
+                shared.get_many(keys), buckets, time.time(), cost,
+            )
+            for key, capacity, rate in buckets:
+                if key in refilled:
+                    # Expires once it would be full again, which is the
+                    # same as gone.
+                    shared.set(
+                        key, refilled[key], int(capacity / rate) + 1,
+                    )
+        finally:
+            for lock_key in locks:
+                if lock_key is not None:
+                    shared.delete(lock_key)
+        return wait
+
+    def acquire(self, shared, lock_key):
+        locked = shared.add(lock_key, 1, self.lock_wait + 1)
+        deadline = time.monotonic() + self.lock_wait
+        while not locked and time.monotonic() < deadline:
+            time.sleep(0.001)
+            locked = shared.add(lock_key, 1, self.lock_wait + 1)
+        return lock_key if locked else None
+
+
+token_buckets = TokenBuckets()
+
+
+def throttle_scope(view):
+    """
+    Budget used by a request, from the view's `throttle_scopes` per
+    action or its `throttle_scope`; `None` leaves it unthrottled.
+    """
+    scopes = getattr(view, 'throttle_scopes', {})
+    action = getattr(view, 'action', None)
+    if action in scopes:
+        return scopes[action]
+    return getattr(view, 'throttle_scope', None)
+
+
+def throttle_cost(request, view):
+    """
+    Tokens spent by a request, from the view's `get_throttle_cost`.
+    """
+    get_cost = getattr(view, 'get_throttle_cost', None)
+    return get_cost(request) if get_cost is not None else 1
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket per client and scope, with the rates of `rates_setting`.
+    The client is the user, or the address of anonymous requests.
+
+    Runs with the other DRF throttles before the handler, so a rejected
+    request gets its 429 and `Retry-After` without touching comments.
+    The first token bucket throttle of a view takes from the buckets of
+    all of them at once, or from none, so a request rejected by one
+    budget spends nothing from the others.
+    """
+    kind = 'user'
+    rates_setting = 'THROTTLE_RATES'
+
+    def __init__(self):
+        self.delay = None
+
+    def allow_request(self, request, view):
+        if not getattr(settings, 'THROTTLE_ENABLED', False):
+            return True
+        if getattr(request, 'token_buckets_taken', False):
+            # An earlier throttle of the view took from this bucket.
+            return True
+        request.token_buckets_taken = True
+        buckets = [
+            throttle.get_bucket(request, view)
+            for throttle in view.get_throttles()
+            if isinstance(throttle, TokenBucketThrottle)
+        ]
+        buckets = [bucket for bucket in buckets if bucket is not None]
+        if not buckets:
+            return True
+        cost = throttle_cost(request, view)
+        if any(cost > capacity for _, capacity, _ in buckets):
+            # Never fits in the bucket, waiting would not help.
+            self.delay = None
+            return False
+        self.delay = token_buckets.take_all(buckets, cost)
+        return not self.delay
+
+    def get_bucket(self, request, view):
+        """
+        `(key, capacity, tokens per second)` of the request's bucket, or
+        `None` when its scope has no rate.
+        """
+        scope = throttle_scope(view)
+        rate = getattr(settings, self.rates_setting, {}).get(scope)
+        if rate is None:
+            return None
+        capacity, per_second = parse_rate(rate)
+        ident = self.get_client(request)
+        return f'throttle:{self.kind}:{scope}:{ident}', capacity, per_second
+
+    def get_client(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
+
+    def wait(self):
+        return self.delay
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Budget per account, `THROTTLE_RATES`.
+    """
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Shared by every account behind an address, so bots spreading their
+    writes over many accounts still run dry.
+    """
+    kind = 'ip'
+    rates_setting = 'THROTTLE_IP_RATES'
+
+    def get_client(self, request):
+        return self.get_ident(request)
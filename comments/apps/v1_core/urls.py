@@ -1,7 +1,9 @@
 from apps.v1_core.views import CommentAPIView
 from apps.v1_core.views import LikeCommentAPIView
 from apps.v1_core.views import LikeReplyAPIView
+from apps.v1_core.views import MetricsAPIView
 from apps.v1_core.views import ReplyAPIView
+from apps.v1_core.views import SyncAPIView
 from django.urls import include
 from django.urls import path
 from rest_framework.routers import DefaultRouter
@@ -20,4 +22,6 @@ urlpatterns = [
         'reply/<int:reply_id>/like/',
         LikeReplyAPIView.as_view(), name='like_reply',
     ),
+    path('sync/', SyncAPIView.as_view(), name='sync'),
+    path('metrics/', MetricsAPIView.as_view(), name='metrics'),
 ]
@@ -1,22 +1,82 @@
+from apps.v1_core.archive import wants_archive
+from apps.v1_core.cache import cached_detail
+from apps.v1_core.cache import cached_list
+from apps.v1_core.cache import invalidate_comment
+from apps.v1_core.cache import representation
+from apps.v1_core.conditional import comment_validators
+from apps.v1_core.conditional import not_modified_response
+from apps.v1_core.conditional import page_validators
+from apps.v1_core.conditional import reply_validators
+from apps.v1_core.conditional import set_validators
+from apps.v1_core.deletion import soft_delete_comment
+from apps.v1_core.export import export_ndjson
+from apps.v1_core.filters import AliasOrderingFilter
+from apps.v1_core.likes import add_like
+from apps.v1_core.metrics import CONTENT_TYPE
+from apps.v1_core.metrics import HasMetricsToken
+from apps.v1_core.metrics import request_metrics
+from apps.v1_core.mixins import BulkCreateModelMixin
+from apps.v1_core.mixins import RowSerializerMixin
+from apps.v1_core.mixins import VersionedUpdateMixin
+from apps.v1_core.models import ArchivedComment
+from apps.v1_core.models import Change
 from apps.v1_core.models import Comment
 from apps.v1_core.models import Reply
+from apps.v1_core.pagination import KeysetPagination
+from apps.v1_core.pagination import ThreadPagination
+from apps.v1_core.search import FullTextSearchFilter
+from apps.v1_core.serializers import ArchivedCommentSerializer
 from apps.v1_core.serializers import CommentSerializer
 from apps.v1_core.serializers import ReplySerializer
+from apps.v1_core.serializers import ReplyThreadQuerySerializer
+from apps.v1_core.serializers import SyncCommentSerializer
+from apps.v1_core.serializers import SyncQuerySerializer
+from apps.v1_core.serializers import TargetCountsQuerySerializer
+from apps.v1_core.serializers import group_replies
+from apps.v1_core.serializers import reply_embedding
+from apps.v1_core.serializers import sparse_fields
+from apps.v1_core.sync import changed_objects
+from apps.v1_core.sync import changes_since
+from apps.v1_core.sync import head_token
+from apps.v1_core.sync import is_expired
+from apps.v1_core.throttling import IPTokenBucketThrottle
+from apps.v1_core.throttling import UserTokenBucketThrottle
+from apps.v1_core.writes import run_write
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404
+from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from rest_framework import filters
-from rest_framework import generics
 from rest_framework import mixins
 from rest_framework import status
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAdminUser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 # Create your views here.
 
 User = get_user_model()
 
+WRITE_THROTTLES = (UserTokenBucketThrottle, IPTokenBucketThrottle)
+
+# Budgets of the create and update actions, see `THROTTLE_RATES`.
+WRITE_THROTTLE_SCOPES = {
+    'create': 'create',
+    'bulk_create': 'bulk',
+    'update': 'update',
+    'partial_update': 'update',
+}
+
 
 class CommentAPIView(
+    RowSerializerMixin,
+    VersionedUpdateMixin,
+    BulkCreateModelMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.DestroyModelMixin,
@@ -27,34 +87,173 @@ class CommentAPIView(
     lookup_url_kwarg = 'comment_id'
     serializer_class = CommentSerializer
     permission_classes = IsAuthenticated,
-    filter_backends = (filters.SearchFilter, filters.OrderingFilter,)
+    pagination_class = KeysetPagination
+    filter_backends = (FullTextSearchFilter, AliasOrderingFilter,)
     search_fields = ('user__username', 'content',)
-    ordering_fields = ('username', 'created_at',)
+    ordering_fields = ('user', 'created_at', 'rank', 'hot_score',)
+    ordering_aliases = {'hot': '-hot_score'}
+    ordering = ('created_at',)
+    use_read_replicas = True
+    throttle_classes = WRITE_THROTTLES
+    throttle_scopes = WRITE_THROTTLE_SCOPES
+    # Set by reads asking for the archive tier with `?archive=true`.
+    archived = False
+
+    # Read by conditional validators and keyset cursors, so they are
+    # loaded even when `?fields=` leaves them out.
+    always_loaded = (
+        'id', 'user', 'created_at', 'hot_score', 'thread_version',
+        'thread_modified_at', 'version',
+    )
+    row_columns = (
+        'id', 'user_id', 'created_at', 'hot_score', 'thread_version',
+        'thread_modified_at', 'version',
+    )
 
     def get_object(self):
-        return Comment.objects.get(pk=self.kwargs['comment_id'])
+        return get_object_or_404(
+            self.get_queryset(), pk=self.kwargs['comment_id'],
+        )
 
     def get_queryset(self):
-        ordering_by = self.request.query_params.get('ordering', None)
-        if ordering_by is not None:
-            try:
-                return Comment.objects.all().order_by(f'{ordering_by}')
-            except Exception as e:
-                raise e
-        return Comment.objects.all()
-
-    def update(self, request, *args, **kwargs):
-        comment_id = self.kwargs.get('comment_id', None)
-        if comment_id is None:
-            return Response(
-                data={'response': 'comment id not found'},
-                status=status.HTTP_400_BAD_REQUEST,
+        model = ArchivedComment if self.archived else Comment
+        queryset = model.objects.all()
+        if 'target_type' in self.kwargs:
+            queryset = queryset.for_target(
+                self.kwargs['target_type'], self.kwargs['target_id'],
             )
-        instance = Comment.objects.get(pk=comment_id)
-        instance.updated_at = timezone.now()
-        instance.content = self.request.data['content']
-        instance.save()
-        return super().update(request, *args, **kwargs)
+        fields = sparse_fields(self.request)
+        if fields is not None:
+            columns = {
+                field.name for field in model._meta.concrete_fields
+            }.intersection(fields)
+            if 'replies' in fields:
+                columns.add('reply_count')
+            queryset = queryset.only(*self.always_loaded, *columns)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.archived:
+            return ArchivedCommentSerializer
+        return super().get_serializer_class()
+
+    def get_row_method_fields(self):
+        _, limit = reply_embedding(self.request)
+        model = self.get_serializer_class().reply_model
+        return {'replies': lambda ids: group_replies(ids, limit, model)}
+
+    def list(self, request, *args, **kwargs):
+        self.archived = wants_archive(request)
+        etag, last_modified, build = cached_list(
+            request, self.fetch_page, representation(request),
+        )
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        return set_validators(Response(build()), etag, last_modified)
+
+    def fetch_page(self):
+        rows = self.get_row_serializer()
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(self.get_rows(queryset, rows))
+        etag, last_modified = page_validators(
+            self.request, page, self.paginator,
+        )
+        return (
+            [comment.id for comment in page], etag, last_modified,
+            lambda: self.get_paginated_response(
+                self.get_data(page, rows),
+            ).data,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, last_modified, build = cached_detail(
+            self.kwargs['comment_id'], self.fetch_detail,
+            representation(request),
+        )
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        return set_validators(Response(build()), etag, last_modified)
+
+    def fetch_detail(self):
+        rows = self.get_row_serializer()
+        instance = self.get_row_instance(rows)
+        if instance is None and wants_archive(self.request):
+            # Comments leave the hot table for good, so the archive is
+            # only looked up once they are not found there.
+            self.archived = True
+            rows = self.get_row_serializer()
+            instance = self.get_row_instance(rows)
+        if instance is None:
+            raise Http404
+        etag, last_modified = comment_validators(self.request, instance)
+        return (
+            etag, last_modified,
+            lambda: self.get_data(instance, rows, many=False),
+        )
+
+    def get_row_instance(self, rows):
+        return self.get_rows(self.get_queryset(), rows)\
+            .filter(pk=self.kwargs['comment_id'])\
+            .first()
+
+    @action(
+        detail=False,
+        url_path=r'target/(?P<target_type>[^/.]+)/(?P<target_id>[^/.]+)',
+    )
+    def target(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+    @action(detail=False)
+    def counts(self, request, *args, **kwargs):
+        query = TargetCountsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        target_type = query.validated_data['target_type']
+        counts = Comment.objects.target_counts(
+            target_type, query.validated_data['target_id'],
+        )
+        return Response(
+            data={'target_type': target_type, 'counts': counts},
+            status=status.HTTP_200_OK,
+        )
+
+    @action(detail=False, permission_classes=(IsAdminUser,))
+    def export(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(
+            export_ndjson(), content_type='application/x-ndjson',
+        )
+        response['Content-Disposition'] = 'attachment; filename=comments.ndjson'  # NOQA
+        return response
+
+    def perform_create(self, serializer):
+        run_write(super().perform_create, serializer)
+        invalidate_comment(serializer.instance.id)
+
+    def perform_bulk_create(self, instances, batch_size):
+        super().perform_bulk_create(instances, batch_size)
+        invalidate_comment()
+
+    def perform_update(self, serializer):
+        run_write(self.save_update, serializer)
+        invalidate_comment(serializer.instance.id)
+
+    def save_update(self, serializer):
+        self.save_versioned(
+            serializer,
+            thread_version=F('thread_version') + 1,
+            thread_modified_at=timezone.now(),
+        )
+
+    def get_validators(self, request, instance):
+        instance.refresh_from_db(
+            fields=('thread_version', 'thread_modified_at'),
+        )
+        return comment_validators(request, instance)
+
+    def perform_destroy(self, instance):
+        run_write(soft_delete_comment, instance.id)
+        invalidate_comment(instance.id)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -63,6 +262,9 @@ class CommentAPIView(
 
 
 class ReplyAPIView(
+    RowSerializerMixin,
+    VersionedUpdateMixin,
+    BulkCreateModelMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.DestroyModelMixin,
@@ -73,25 +275,120 @@ class ReplyAPIView(
     lookup_url_kwarg = 'reply_id'
     serializer_class = ReplySerializer
     permission_classes = IsAuthenticated,
+    filter_backends = (FullTextSearchFilter,)
+    search_fields = ('content',)
+    row_columns = ('id', 'path',)
+    use_read_replicas = True
+    throttle_classes = WRITE_THROTTLES
+    throttle_scopes = WRITE_THROTTLE_SCOPES
 
     def get_queryset(self):
-        return Reply.objects.all()
+        return Reply.objects.visible()
+
+    def list(self, request, *args, **kwargs):
+        rows = self.get_row_serializer()
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = self.get_rows(queryset, rows)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_data(page, rows))
+        return Response(self.get_data(queryset, rows))
 
     def get_object(self):
-        return Reply.objects.get(id=self.kwargs['reply_id'])
+        return get_object_or_404(
+            self.get_queryset(), id=self.kwargs['reply_id'],
+        )
 
-    def update(self, request, *args, **kwargs):
-        reply_id = self.kwargs.get('reply_id', None)
-        if reply_id is None:
-            return Response(
-                data={'response': 'reply_id not found'},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        instance = Reply.objects.get(pk=reply_id)
-        instance.content = self.request.data['content']
-        instance.updated_at = timezone.now()
-        instance.save()
-        return super().update(request, *args, **kwargs)
+    def retrieve(self, request, *args, **kwargs):
+        instance = get_object_or_404(
+            self.get_queryset().select_related('comment'),
+            id=self.kwargs['reply_id'],
+        )
+        etag, last_modified = reply_validators(request, instance)
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        data = self.get_serializer(instance).data
+        return set_validators(Response(data), etag, last_modified)
+
+    @action(detail=False, pagination_class=ThreadPagination)
+    def thread(self, request, *args, **kwargs):
+        query = ReplyThreadQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        root = query.validated_data.get('root')
+        comment_id = root.comment_id if root is not None else \
+            query.validated_data['comment'].id
+        queryset = Reply.objects.thread(
+            comment_id, root=root,
+            depth=query.validated_data.get('depth'),
+            children=query.validated_data.get('children'),
+        )
+        rows = self.get_row_serializer()
+        page = self.paginate_queryset(self.get_rows(queryset, rows))
+        return self.get_paginated_response(self.get_data(page, rows))
+
+    def perform_create(self, serializer):
+        run_write(self.save_create, serializer)
+        invalidate_comment(serializer.instance.comment_id, membership=False)
+
+    @transaction.atomic
+    def save_create(self, serializer):
+        super().perform_create(serializer)
+        reply = serializer.instance
+        self.place_in_thread(reply)
+        Comment.objects.replies_added([reply])
+
+    def perform_bulk_create(self, instances, batch_size):
+        super().perform_bulk_create(instances, batch_size)
+        for comment_id in {reply.comment_id for reply in instances}:
+            invalidate_comment(comment_id, membership=False)
+
+    @transaction.atomic
+    def save_bulk_create(self, instances, batch_size):
+        super().save_bulk_create(instances, batch_size)
+        comment_ids = {reply.comment_id for reply in instances}
+        Reply.objects\
+            .filter(comment_id__in=comment_ids, path='')\
+            .place_in_threads()
+        Comment.objects.replies_added(instances)
+
+    def perform_update(self, serializer):
+        previous_comment_id = serializer.instance.comment_id
+        run_write(self.save_update, serializer, previous_comment_id)
+        if serializer.instance.comment_id != previous_comment_id:
+            invalidate_comment(previous_comment_id, membership=False)
+        invalidate_comment(serializer.instance.comment_id, membership=False)
+
+    @transaction.atomic
+    def save_update(self, serializer, previous_comment_id):
+        self.save_versioned(serializer)
+        reply = serializer.instance
+        if reply.comment_id == previous_comment_id:
+            Comment.objects.filter(pk=reply.comment_id).touch_threads()
+        else:
+            self.place_in_thread(reply)
+            Comment.objects.replies_removed([previous_comment_id])
+            Comment.objects.replies_added([reply])
+
+    def perform_destroy(self, instance):
+        run_write(self.save_destroy, instance)
+        invalidate_comment(instance.comment_id, membership=False)
+
+    @transaction.atomic
+    def save_destroy(self, instance):
+        # Deleting a reply deletes the replies nested under it too.
+        _, deleted = instance.delete()
+        removed = deleted.get(Reply._meta.label, 0)
+        Comment.objects.replies_removed([instance.comment_id] * removed)
+
+    def get_validators(self, request, instance):
+        # The edit bumped the thread of the comment.
+        instance.comment = Comment.all_objects.get(pk=instance.comment_id)
+        return reply_validators(request, instance)
+
+    def place_in_thread(self, reply):
+        Reply.objects.filter(pk=reply.pk).place_in_threads()
+        reply.refresh_from_db(fields=('path', 'depth', 'position'))
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -99,37 +396,91 @@ class ReplyAPIView(
         return Response(status=status.HTTP_200_OK)
 
 
-class LikeCommentAPIView(
-    generics.UpdateAPIView,
-):
-    lookup_url_kwarg = 'comment_id'
+class LikeCommentAPIView(APIView):
+    permission_classes = IsAuthenticated,
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'like'
 
-    def get_queryset(self):
-        return Comment.objects.all()
+    def patch(self, request, *args, **kwargs):
+        comment_id = self.kwargs['comment_id']
+        likes, created = run_write(
+            add_like, request.user, 'comment', comment_id,
+        )
+        return Response(
+            data={'id': comment_id, 'likes_comments': likes, 'liked': created},
+            status=status.HTTP_200_OK,
+        )
 
-    def get_serializer_class(self):
-        return CommentSerializer
+
+class LikeReplyAPIView(APIView):
+    permission_classes = IsAuthenticated,
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'like'
 
     def patch(self, request, *args, **kwargs):
-        comment_instance = Comment.objects.get(pk=self.kwargs['comment_id'])
-        comment_instance.likes_comments += 1
-        comment_instance.save()
-        return super().patch(request, *args, **kwargs)
+        reply_id = self.kwargs['reply_id']
+        likes, created = run_write(
+            add_like, request.user, 'reply', reply_id,
+        )
+        return Response(
+            data={'id': reply_id, 'likes_replies': likes, 'liked': created},
+            status=status.HTTP_200_OK,
+        )
 
 
-class LikeReplyAPIView(
-    generics.UpdateAPIView,
-):
-    lookup_url_kwarg = 'reply_id'
+class SyncAPIView(APIView):
+    """
+    Comments and replies changed since a sync token, with tombstones.
 
-    def get_queryset(self):
-        return Reply.objects.all()
+    Without a token only the current one is returned; clients fetch it
+    before loading their threads and then pass each returned token back.
+    """
+    permission_classes = IsAuthenticated,
 
-    def get_serializer_class(self):
-        return ReplySerializer
+    def get(self, request, *args, **kwargs):
+        query = SyncQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        token = query.validated_data.get('token', None)
+        comment_id = query.validated_data.get('comment', None)
+        if token is None:
+            return Response(
+                data={'token': str(head_token())}, status=status.HTTP_200_OK,
+            )
+        if is_expired(token):
+            return Response(
+                data={'response': 'sync token expired, reload all threads'},
+                status=status.HTTP_410_GONE,
+            )
+        latest, token, has_more = changes_since(token, comment_id)
+        comments, replies, deleted = changed_objects(latest, comment_id)
+        context = {'request': request}
+        return Response(
+            data={
+                'token': str(token),
+                'has_more': has_more,
+                'comments': SyncCommentSerializer(
+                    comments, many=True, context=context,
+                ).data,
+                'replies': ReplySerializer(
+                    replies, many=True, context=context,
+                ).data,
+                'deleted': {
+                    'comments': deleted[Change.COMMENT],
+                    'replies': deleted[Change.REPLY],
+                },
+            },
+            status=status.HTTP_200_OK,
+        )
 
-    def patch(self, request, *args, **kwargs):
-        reply_instance = Reply.objects.get(pk=self.kwargs['reply_id'])
-        reply_instance.likes_replies += 1
-        reply_instance.save()
-        return super().patch(request, *args, **kwargs)
+
+class MetricsAPIView(APIView):
+    """
+    Request metrics of this process in the Prometheus text format.
+    """
+    authentication_classes = ()
+    permission_classes = HasMetricsToken,
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            request_metrics.render(), content_type=CONTENT_TYPE,
+        )
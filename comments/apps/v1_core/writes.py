@@ -0,0 +1,169 @@
+import atexit
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+from django.db import transaction
+
+
+def apply_sqlite_pragmas(connection):
+    """
+    Run `SQLITE_PRAGMAS` on a new SQLite connection.
+
+    WAL lets readers run next to the single writer, and `busy_timeout`
+    makes a writer wait for the lock instead of failing right away.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+class PendingWrite:
+
+    def __init__(self, func, args, kwargs, alone=False):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.alone = alone
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class WriteQueue:
+    """
+    Group commit: one writer thread runs queued writes in shared
+    transactions.
+
+    Writes waiting while a batch commits are taken together, up to
+    `GROUP_COMMIT_MAX_BATCH`, and committed in one transaction, each in
+    its own savepoint so a failing write only rolls back itself. Callers
+    block until their batch committed and get the result or exception of
+    their own write. Only one connection ever writes, so requests no
+    longer fight over SQLite's lock. Writes queued `alone` commit their
+    own transaction and run by themselves, outside any batch.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.pending = deque()
+        self.thread = None
+        self.stopping = False
+        atexit.register(self.stop)
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'GROUP_COMMIT_ENABLED', False)
+
+    @property
+    def max_batch(self):
+        return getattr(settings, 'GROUP_COMMIT_MAX_BATCH', 64)
+
+    def run(self, func, *args, **kwargs):
+        return self.submit(PendingWrite(func, args, kwargs))
+
+    def run_alone(self, func, *args, **kwargs):
+        return self.submit(PendingWrite(func, args, kwargs, alone=True))
+
+    def submit(self, write):
+        if threading.current_thread() is self.thread:
+            return write.func(*write.args, **write.kwargs)
+        with self.lock:
+            self.start()
+            self.pending.append(write)
+            self.wakeup.notify()
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def start(self):
+        # Called with the lock held.
+        if self.thread is None:
+            self.stopping = False
+            self.thread = threading.Thread(
+                target=self.work, name='group-commit', daemon=True,
+            )
+            self.thread.start()
+
+    def work(self):
+        try:
+            while True:
+                with self.lock:
+                    while not self.pending and not self.stopping:
+                        self.wakeup.wait()
+                    if not self.pending:
+                        self.thread = None
+                        return
+                    batch = [self.pending.popleft()]
+                    while not batch[0].alone and self.pending and \
+                            not self.pending[0].alone and \
+                            len(batch) < self.max_batch:
+                        batch.append(self.pending.popleft())
+                if batch[0].alone:
+                    self.commit_alone(batch[0])
+                else:
+                    self.commit(batch)
+        finally:
+            connections.close_all()
+
+    def commit(self, batch):
+        try:
+            with transaction.atomic():
+                for write in batch:
+                    try:
+                        with transaction.atomic():
+                            write.result = write.func(
+                                *write.args, **write.kwargs
+                            )
+                    except Exception as error:
+                        write.error = error
+        except Exception as error:
+            # The commit itself failed, so did every write of the batch.
+            for write in batch:
+                write.error = write.error or error
+        finally:
+            for write in batch:
+                write.done.set()
+
+    def commit_alone(self, write):
+        try:
+            write.result = write.func(*write.args, **write.kwargs)
+        except Exception as error:
+            write.error = error
+        finally:
+            write.done.set()
+
+    def stop(self):
+        with self.lock:
+            thread, self.stopping = self.thread, True
+            self.wakeup.notify()
+        if thread is not None:
+            thread.join()
+
+
+write_queue = WriteQueue()
+
+
+def run_write(func, *args, **kwargs):
+    """
+    Call `func` through `write_queue` when group commit is enabled.
+    """
+    if write_queue.enabled:
+        return write_queue.run(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+def run_write_transaction(func, *args, **kwargs):
+    """
+    Like `run_write` for a `func` committing its own transaction, which
+    needs to know when its writes are committed.
+    """
+    if write_queue.enabled:
+        return write_queue.run_alone(func, *args, **kwargs)
+    return func(*args, **kwargs)
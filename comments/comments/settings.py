@@ -36,15 +36,17 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework_swagger',
-    'apps.v1_core',
+    'apps.v1_core.apps.V1CoreConfig',
 ]
 
 MIDDLEWARE = [
+    'apps.v1_core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.v1_core.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,8 +79,18 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     },
+    # Only read from once listed in DATABASE_REPLICAS.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+    },
 }
 
+DATABASE_ROUTERS = [
+    'apps.v1_core.archive.ArchiveRouter',
+    'apps.v1_core.replicas.ReplicaRouter',
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -114,3 +126,158 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Write-behind like counters
+# Likes are merged in memory and written in one batched UPDATE every
+# LIKE_BUFFER_FLUSH_INTERVAL milliseconds or LIKE_BUFFER_FLUSH_EVENTS likes.
+
+LIKE_BUFFER_ENABLED = False
+
+LIKE_BUFFER_FLUSH_INTERVAL = 200
+
+LIKE_BUFFER_FLUSH_EVENTS = 1000
+
+# Comment response cache
+# Detail and list responses are cached in an in-process LRU and, when
+# COMMENT_CACHE_BACKEND names one of CACHES, in that shared backend too.
+
+COMMENT_CACHE_ENABLED = False
+
+COMMENT_CACHE_BACKEND = None
+
+COMMENT_CACHE_TIMEOUT = 60
+
+COMMENT_CACHE_MAX_ENTRIES = 1024
+
+# Bulk create endpoints (/api/comment/bulk/ and /api/reply/bulk/)
+
+BULK_CREATE_MAX_ITEMS = 10000
+
+BULK_CREATE_BATCH_SIZE = 500
+
+# Streaming NDJSON export (/api/comment/export/ and `export_comments`)
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Bulk import (`import_comments`), comments written per transaction
+
+IMPORT_CHUNK_SIZE = 1000
+
+# Nested reply threads, levels of replies below a comment
+
+REPLY_MAX_DEPTH = 32
+
+# Replies embedded per comment with ?replies=first:N, largest N
+
+REPLY_EMBED_MAX = 100
+
+# Comment counts per target (/api/comment/counts/), targets per request
+
+TARGET_COUNTS_MAX_TARGETS = 200
+
+# Hot ranking (?ordering=hot)
+# Every comment, like and reply adds its weight, doubled for every
+# HOT_SCORE_HALF_LIFE seconds since the start of the comment's epoch.
+# Scores are rebased to a new epoch every HOT_SCORE_EPOCH_LENGTH seconds.
+
+HOT_SCORE_HALF_LIFE = 12 * 60 * 60
+
+HOT_SCORE_EPOCH_LENGTH = 3 * 60 * 60
+
+HOT_SCORE_COMMENT_WEIGHT = 1
+
+HOT_SCORE_LIKE_WEIGHT = 1
+
+HOT_SCORE_REPLY_WEIGHT = 2
+
+# Incremental sync (/api/sync/), changes read per request and days of
+# the change log kept by `prune_changes`
+
+SYNC_PAGE_SIZE = 500
+
+SYNC_RETENTION_DAYS = 30
+
+# Request metrics (/api/metrics/), scrapers send `Authorization: Bearer
+# <METRICS_TOKEN>` when it is set; requests slower than
+# METRICS_SLOW_REQUEST_MS are logged with their SQL
+
+METRICS_ENABLED = True
+
+METRICS_TOKEN = None
+
+METRICS_SLOW_REQUEST_MS = None
+
+# Serve JSON comment and reply reads from rows instead of serializers
+
+FAST_READ_PATH_ENABLED = True
+
+# Read replicas
+# Safe comment and reply requests read from one of these DATABASES aliases,
+# picked by weight among those passing a health check; a client that wrote
+# reads from the primary for REPLICA_STICKY_SECONDS.
+
+DATABASE_REPLICAS = {}
+
+REPLICA_STICKY_SECONDS = 5
+
+REPLICA_HEALTH_CHECK_SECONDS = 10
+
+# SQLite writes
+# Pragmas run on every new SQLite connection. With GROUP_COMMIT_ENABLED,
+# creates, edits and likes are run by one writer thread that commits up to
+# GROUP_COMMIT_MAX_BATCH of them per transaction.
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+}
+
+GROUP_COMMIT_ENABLED = False
+
+GROUP_COMMIT_MAX_BATCH = 64
+
+# Comment deletion
+# Deleted comments are hidden at once and removed with their replies by a
+# background worker, COMMENT_PURGE_CHUNK_SIZE replies per transaction.
+
+COMMENT_PURGE_CHUNK_SIZE = 500
+
+# Archive
+# Comments older than ARCHIVE_AFTER_DAYS are moved with their replies to
+# the archive tables in ARCHIVE_DATABASE by the `archive_comments` command,
+# ARCHIVE_BATCH_SIZE comments per transaction. Reads ask for them with
+# `?archive=true`.
+
+ARCHIVE_DATABASE = 'default'
+
+ARCHIVE_AFTER_DAYS = 365
+
+ARCHIVE_BATCH_SIZE = 500
+
+# Write throttling
+# Token buckets per user (THROTTLE_RATES) and per client address
+# (THROTTLE_IP_RATES) for comment and reply creates and edits and for
+# likes. Bulk creates spend a `bulk` token per item. Buckets are kept in
+# process, at most THROTTLE_MAX_KEYS of them, or in the CACHES alias named
+# by THROTTLE_BACKEND to share them between processes.
+
+THROTTLE_ENABLED = False
+
+THROTTLE_RATES = {
+    'create': '30/min',
+    'bulk': '1000/min',
+    'update': '60/min',
+    'like': '120/min',
+}
+
+THROTTLE_IP_RATES = {
+    'create': '120/min',
+    'bulk': '4000/min',
+    'update': '240/min',
+    'like': '600/min',
+}
+
+THROTTLE_MAX_KEYS = 100000
+
+THROTTLE_BACKEND = None
@@ -13,3 +13,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'comments.settings')
 
 application = get_wsgi_application()
+
+from apps.v1_core.deletion import resume_purges  # noqa: E402
+from apps.v1_core.ranking import hot_rebaser  # noqa: E402
+
+resume_purges()
+hot_rebaser.start()